@@ -6,23 +6,37 @@ This script integrates daily weather data with 30-year climate normals based on
 identifies potential data inconsistencies, and removes duplicate records to ensure data integrity.
 
 The script performs the following steps:
-1. Loads daily weather data, 30-year climate normals, and station mapping data from CSV files.
-2. Converts station identifiers to strings to ensure consistent data types for merging.
+1. Loads daily weather data and 30-year climate normals from their Parquet stages (dataStore.py),
+   and the station mapping data from CSV.
+2. Reads every table with its declared schema (climateSchema.py), so station identifiers are
+   consistent strings (categories) for merging and measurements stay float32.
 3. Checks for and removes duplicate station mappings to avoid redundancy.
-4. Converts the date in daily data to Month-Day format for matching with normals data.
+4. Keys daily dates and normals 'MM-DD' dates by a leap-aware day-of-year ordinal (0..365,
+   Feb 29 = 59) and stations by category codes, for matching with normals data.
 5. Identifies and removes duplicate records in daily and normals data based on station IDs and dates.
-6. Creates a composite key in normals data for unique identification.
+6. Indexes the normals as a dense [normal station x 366] array of row numbers.
 7. Joins daily data with station mappings and maps daily weather stations to nearest normal stations.
-8. Merges the daily data with the normals data using the composite keys to create a combined dataset.
-9. Saves the combined data to a CSV file for further analysis.
-10. Generates a map plot showing connections between daily weather stations and nearest normal stations.
+8. Gathers each daily row's normals from that array in one step to create a combined dataset
+   (MonthDay and CompositeKey are still written, labelled once per distinct value).
+9. Saves the combined data to the Combined_Daily_Normals Parquet stage (optionally also to CSV).
+10. With --plots, generates a map plot showing connections between daily weather stations and nearest
+    normal stations (stationMapDiagnostics.py, imported only then).
+
+Steps 3-8 are merge_with_normals(daily, normals, mapping), which can be imported; running the
+script (python climateTotalMerge.py [--state California]) reads and writes the stages as before.
 
 """
 
+import argparse
 import os
+import sys
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from mpl_toolkits.basemap import Basemap
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'Preprocessing'))
+from climateSchema import (DAILY_SCHEMA, NORMALS_SCHEMA, STATION_MAPPING_SCHEMA,
+                           COMBINED_SCHEMA, read_table)
+from dataStore import read_stage, write_stage
 
 
 # =============================================================================
@@ -30,129 +44,177 @@ from mpl_toolkits.basemap import Basemap
 # =============================================================================
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-daily_path = os.path.join(base_dir, "Data", 
-                          "Daily_Weather_Data", "CaliforniaDailyCleaned.csv")
-
-normals_path = os.path.join(base_dir, "Data", 
-                            "30YearNormals_Data", "CaliforniaNormalsReady.csv")
+state = "California"
+export_csv = False   ## Also write Combined_Daily_Normals.csv
+plots = False        ## Show the station connections map (needs matplotlib and Basemap)
 
-mapping_path = os.path.join(base_dir, "Data", 
-                            "Station_Mapping", "California_Station_Mapping.csv")
+data_dir = os.path.join(base_dir, "Data")
 
 # =============================================================================
-# Load the data
+# Day of Year Keys
 # =============================================================================
-daily_data = pd.read_csv(daily_path)
-normals_data = pd.read_csv(normals_path)
-station_mapping = pd.read_csv(mapping_path)
+## First day of each month in a leap year: day-of-year ordinals run 0..365 in every
+## year, with Feb 29 = 59, so non-leap years skip 59 and the normals' 'MM-DD' dates
+## line up with the daily dates of any year
+MONTH_START = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+
+## 'MM-DD' label of each ordinal
+MONTH_DAY_LABELS = pd.date_range('2000-01-01', '2000-12-31').strftime('%m-%d')
+
+
+def day_ordinal(month, day):
+    '''
+    Leap-aware day-of-year ordinal (0..365) of month / day arrays; -1 where missing.
+    '''
+    month = np.asarray(month, dtype=np.float64)
+    day = np.asarray(day, dtype=np.float64)
+    valid = ~np.isnan(month) & ~np.isnan(day)
+    ordinal = np.full(len(month), -1, dtype=np.int64)
+    ordinal[valid] = MONTH_START[month[valid].astype(np.int64) - 1] + day[valid].astype(np.int64) - 1
+    return ordinal
+
+
+def month_day_ordinal(labels):
+    '''
+    day_ordinal of 'MM-DD' labels (a category column: each category is parsed once).
+    '''
+    labels = labels.astype('category')
+    parts = labels.cat.categories.astype(str).str.extract(r'^(\d{2})-(\d{2})$').astype(np.float64)
+    category_ordinal = np.append(day_ordinal(parts[0], parts[1]), -1)
+    return category_ordinal[labels.cat.codes.to_numpy()]
+
+
+def category_codes(values, categories):
+    '''
+    Position of each value among categories (-1 where absent), matched once per distinct value.
+    '''
+    values = values.astype('category')
+    position = pd.Index(categories).get_indexer(values.cat.categories.astype(str))
+    return np.append(position, -1)[values.cat.codes.to_numpy()]
+
 
 # =============================================================================
 # Data Cleaning and Preparation
 # =============================================================================
-## Convert station identifiers to string to ensure consistent data types for merging
-daily_data['STATION'] = daily_data['STATION'].astype(str)
-normals_data['STATION'] = normals_data['STATION'].astype(str)
-station_mapping['DailyStation'] = station_mapping['DailyStation'].astype(str)
-station_mapping['NormalStation'] = station_mapping['NormalStation'].astype(str)
-
-## Check for and remove duplicate station mappings
-if station_mapping.duplicated(subset=['DailyStation']).any():
-    print("Warning: Duplicates found in station mappings. Removing duplicates.")
-    station_mapping = station_mapping.drop_duplicates(subset=['DailyStation'])
-
-## Convert date in daily data to Month-Day format for matching
-daily_data['MonthDay'] = pd.to_datetime(daily_data['Date']).dt.strftime('%m-%d')
-
-## Identify and remove duplicates in daily and normals data based on 'STATION' and 'DATE'
-duplicates_daily = daily_data.duplicated(subset=['STATION', 'Date'])
-if duplicates_daily.any():
-    print(f"Warning: {duplicates_daily.sum()} duplicates found in daily data. Removing duplicates.")
-    daily_data = daily_data.drop_duplicates(subset=['STATION', 'Date'])
-
-duplicates_normals = normals_data.duplicated(subset=['STATION', 'DATE'])
-if duplicates_normals.any():
-    print(f"Warning: {duplicates_normals.sum()} duplicates found in normals data. Removing duplicates.")
-    normals_data = normals_data.drop_duplicates(subset=['STATION', 'DATE'])
-
-## Create a composite key in normals data for unique identification
-normals_data['CompositeKey'] = normals_data['STATION'] + '-' + normals_data['DATE']
-if normals_data.duplicated(subset=['CompositeKey']).any():
-    print("Warning: Duplicates found in normals data composite keys. Removing duplicates.")
-    normals_data = normals_data.drop_duplicates(subset=['CompositeKey'])
-
-## Join daily data with station mappings
-daily_data_mapped = pd.merge(daily_data, station_mapping, left_on='STATION', right_on='DailyStation', how='left')
-
-## Check if any daily station maps to multiple normals stations
-if daily_data_mapped.duplicated(subset=['STATION', 'MonthDay']).any():
-    print("Warning: Daily data has multiple mappings to normals stations.")
-
-## Create a matching composite key in the daily mapped data for final merging
-daily_data_mapped['CompositeKey'] = daily_data_mapped['NormalStation'] + '-' + daily_data_mapped['MonthDay']
-
-## Merge the daily data with the normals data using the composite keys
-combined_data = pd.merge(daily_data_mapped, normals_data, on='CompositeKey', how='left', suffixes=('', '_norm'))
+def merge_with_normals(daily_data, normals_data, station_mapping):
+    '''
+    Joins daily weather data to the 30-year normals of each station's nearest normal station,
+    by month and day.
 
-# =============================================================================
-# Post-processing and Output
-# =============================================================================
-print(f"Original daily data count: {len(daily_data)}")
-print(f"Combined data count: {len(combined_data)}")
+    Both joins run on integer keys: stations are category codes and days are leap-aware
+    day-of-year ordinals (day_ordinal). The normals are indexed as a dense
+    [normal station x 366] array of row numbers, so each daily row finds its normals row
+    with one gather; no string keys are merged on.
+
+    Parameters:
+    - daily_data: DataFrame of the DailyCleaned stage.
+    - normals_data: DataFrame of the NormalsReady stage.
+    - station_mapping: DataFrame of {state}_Station_Mapping.csv.
 
-## Save the combined data to CSV
-output_path = os.path.join(base_dir, "Data", "Combined_Daily_Normals.csv")
-combined_data.to_csv(output_path, index=False)
+    Returns:
+    - Combined DataFrame, one row per daily row (COMBINED_SCHEMA columns).
+    '''
+    ## Check for and remove duplicate station mappings
+    if station_mapping.duplicated(subset=['DailyStation']).any():
+        print("Warning: Duplicates found in station mappings. Removing duplicates.")
+        station_mapping = station_mapping.drop_duplicates(subset=['DailyStation'])
+    station_mapping = station_mapping.reset_index(drop=True)
+
+    ## Integer keys: station codes and day-of-year ordinals
+    daily_stations = daily_data['STATION'].astype('category')
+    daily_ordinal = day_ordinal(daily_data['Date'].dt.month, daily_data['Date'].dt.day)
+    normal_stations = normals_data['STATION'].astype('category')
+    normal_ordinal = month_day_ordinal(normals_data['DATE'])
+
+    ## Identify and remove duplicates in daily and normals data based on 'STATION' and 'DATE'
+    daily_days = daily_data['Date'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    daily_key = daily_stations.cat.codes.to_numpy(np.int64) << 32 | (daily_days & 0xFFFFFFFF)
+    duplicates_daily = pd.Series(daily_key).duplicated().to_numpy()
+    if duplicates_daily.any():
+        print(f"Warning: {duplicates_daily.sum()} duplicates found in daily data. Removing duplicates.")
+        daily_data, daily_ordinal = daily_data[~duplicates_daily], daily_ordinal[~duplicates_daily]
+
+    normal_codes = normal_stations.cat.codes.to_numpy(np.int64)
+    duplicates_normals = pd.Series(normal_codes * 367 + normal_ordinal).duplicated().to_numpy()
+    if duplicates_normals.any():
+        print(f"Warning: {duplicates_normals.sum()} duplicates found in normals data. Removing duplicates.")
+        normals_data = normals_data[~duplicates_normals]
+        normal_codes, normal_ordinal = normal_codes[~duplicates_normals], normal_ordinal[~duplicates_normals]
+    normals_data = normals_data.reset_index(drop=True)
+
+    ## Dense [normal station x 366] index of normals rows (-1 where a station has no normals that day)
+    categories = normal_stations.cat.categories
+    normals_row = np.full((len(categories), 366), -1, dtype=np.int64)
+    keyed = (normal_codes >= 0) & (normal_ordinal >= 0)
+    normals_row[normal_codes[keyed], normal_ordinal[keyed]] = np.flatnonzero(keyed)
+
+    ## Join daily data with station mappings (mapping row of each daily station)
+    mapping_row = category_codes(daily_data['STATION'], station_mapping['DailyStation'].astype(str))
+    mapped = station_mapping.reindex(mapping_row).reset_index(drop=True)
+
+    ## Normals row of each daily row: its normal station's row for its day of year
+    normal_code = category_codes(mapped['NormalStation'], categories.astype(str))
+    found = (normal_code >= 0) & (daily_ordinal >= 0)
+    row = np.full(len(daily_data), -1, dtype=np.int64)
+    row[found] = normals_row[normal_code[found], daily_ordinal[found]]
+
+    ## MonthDay and CompositeKey ('{NormalStation}-{MM-DD}') labels, built once per distinct value
+    month_day = pd.Categorical.from_codes(daily_ordinal, categories=MONTH_DAY_LABELS)
+    mapped_normal = mapped['NormalStation'].astype('category')
+    normal_station_code = mapped_normal.cat.codes.to_numpy(np.int64)
+    labelled = (normal_station_code >= 0) & (daily_ordinal >= 0)
+    pair_codes = np.full(len(daily_ordinal), -1, dtype=np.int64)
+    pair_codes[labelled], pairs = pd.factorize(normal_station_code[labelled] * 366 + daily_ordinal[labelled])
+    composite = pd.Categorical.from_codes(pair_codes, categories=mapped_normal.cat.categories.astype(str)[pairs // 366]
+                                          + '-' + MONTH_DAY_LABELS[pairs % 366])
+
+    left = pd.concat([daily_data.reset_index(drop=True).assign(MonthDay=month_day), mapped], axis=1)
+    left['CompositeKey'] = composite
+
+    ## Gather the normals of every daily row at once
+    normals_part = normals_data.reindex(row).reset_index(drop=True)
+    normals_part = normals_part.rename(columns={column: f'{column}_norm' for column in normals_part.columns
+                                                if column in left.columns})
+    combined_data = pd.concat([left, normals_part], axis=1)
+
+    print(f"Original daily data count: {len(daily_data)}")
+    print(f"Combined data count: {len(combined_data)}")
+    return combined_data
 
 
-## Plot Station Mapping in Merged Dataframe to Check for Validity
-def plot_station_connections(df):
+# =============================================================================
+# Run Program
+# =============================================================================
+def main(state, data_dir=data_dir, export_csv=export_csv, plots=False):
     '''
-    Plots connections between daily weather stations and nearest normal stations on a map.
+    Merges one state's daily and normals stages into the Combined_Daily_Normals stage.
     '''
-    ## Group by 'DailyStation' and take the first occurrence
-    unique_stations_df = df.groupby('DailyStation').agg('first').reset_index()
-
-    ## Print diagnostic information
-    print(f"Number of unique stations in the original dataframe: {df['DailyStation'].nunique()}")
-    print(f"Number of rows after grouping: {len(unique_stations_df)}")
-
-    fig, ax = plt.subplots(figsize=(10, 10))
-    m = Basemap(projection='merc', llcrnrlat=31, urcrnrlat=42,
-                llcrnrlon=-124, urcrnrlon=-114, resolution='i', ax=ax)
-    m.drawcoastlines()
-    m.drawcountries()
-    m.drawstates()
-
-    ## Initialize legend tracking
-    plotted_daily = False
-    plotted_normal = False
-
-    ## Plot each pair of stations
-    for _, row in unique_stations_df.iterrows():
-        if pd.notnull(row['DailyLat']) and pd.notnull(row['DailyLong']) and pd.notnull(row['NormalLat']) and pd.notnull(row['NormalLong']):
-            x, y = m(row['DailyLong'], row['DailyLat'])
-            xn, yn = m(row['NormalLong'], row['NormalLat'])
-            
-            ## Plot Daily Station
-            if not plotted_daily:
-                m.plot(x, y, marker='o', color='blue', markersize=5, label='Daily Station')
-                plotted_daily = True
-            else:
-                m.plot(x, y, marker='o', color='blue', markersize=5)
-            
-            ## Plot Normal Station
-            if not plotted_normal:
-                m.plot(xn, yn, marker='s', color='green', markersize=5, label='Normal Station')
-                plotted_normal = True
-            else:
-                m.plot(xn, yn, marker='s', color='green', markersize=5)
-            
-            ## Connect with a line
-            m.plot([x, xn], [y, yn], linestyle='-', color='red', linewidth=1, alpha=0.5)
-
-    plt.title("Connections between Daily Weather Stations and Nearest Normal Stations")
-    plt.legend(loc='lower left')
-    plt.show()
-
-## Generate Map Plot
-plot_station_connections(combined_data)
\ No newline at end of file
+    ## Station identifiers are read as string categories by every schema
+    daily_data = read_stage(os.path.join(data_dir, "Daily_Weather_Data", "DailyCleaned"), DAILY_SCHEMA, state=state)
+    normals_data = read_stage(os.path.join(data_dir, "30YearNormals_Data", "NormalsReady"), NORMALS_SCHEMA, state=state)
+    station_mapping = read_table(os.path.join(data_dir, "Station_Mapping", f"{state}_Station_Mapping.csv"),
+                                 STATION_MAPPING_SCHEMA)
+
+    combined_data = merge_with_normals(daily_data, normals_data, station_mapping)
+
+    ## Save the combined data to its stage (read by combinedDiagnosticImpute.py)
+    output_stage = os.path.join(data_dir, "Main_Data", "Combined_Daily_Normals")
+    output_path = os.path.join(data_dir, "Combined_Daily_Normals.csv") if export_csv else None
+    write_stage(combined_data, output_stage, state, COMBINED_SCHEMA, csv_path=output_path)
+
+    ## Generate Map Plot (plotting libraries are only imported here)
+    if plots:
+        from stationMapDiagnostics import plot_combined_station_connections
+        plot_combined_station_connections(combined_data)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merge a state's daily weather data with its 30 year normals.")
+    parser.add_argument('--state', default=state, help="State to merge")
+    parser.add_argument('--data-dir', default=data_dir, help="Code/Data folder holding the stages")
+    parser.add_argument('--export-csv', action='store_true', default=export_csv,
+                        help="Also write Combined_Daily_Normals.csv")
+    parser.add_argument('--plots', action='store_true', default=plots, help="Show the station connections map")
+    args = parser.parse_args()
+
+    main(args.state, args.data_dir, args.export_csv, args.plots)
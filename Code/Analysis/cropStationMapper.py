@@ -6,22 +6,34 @@ This script processes geospatial agricultural data for specified states and year
 It performs the following tasks:
 
 - Loads a mapping of weather stations with their geographical coordinates.
-- Reads agricultural data from CSV files contained within zip archives for each specified state and year.
-- Converts CSV data into geospatial data format (GeoDataFrame) using coordinates.
-- Performs spatial joins to associate crop data points with the nearest daily weather stations.
+- Reads agricultural data for each specified state and year, either from the Parquet dataset
+  written by TIFtoCSV.py --format parquet ({state}TopCropLonLat/Year={year}) or from
+  CSV files contained within zip archives (opened once per state through cropArchive.py).
+- Assigns each crop data point to its nearest daily weather station by great-circle distance,
+  with a KD-tree over the stations' unit-sphere coordinates (nearestStation.py), straight from
+  the coordinate arrays; correct across UTM zones and with no reprojection of the points.
 - Groups the resulting data by daily weather station and crop type, then aggregates it for analysis.
 - Saves the processed and grouped data into CSV files, one for each state and year, 
   containing detailed crop data integrated with weather station geospatial information.
 
+load_station_index(mapping_file) and assign_nearest_station can be imported and the station
+KD-tree reused across years; running the script (python cropStationMapper.py [--states Florida])
+processes the states as before.
+
 @author: dforc
 """
 
-import geopandas as gpd
+import argparse
 import pandas as pd
 import os
 import zipfile
 from tqdm import tqdm
-import math
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'Preprocessing'))
+from cropArchive import CropArchive
+from cropPoints import read_crop_points, crop_points_path
+from nearestStation import NearestStations
 
 #######################################
 # Constants and Settings
@@ -29,66 +41,93 @@ import math
 states = ['Florida']
 years = [str(year) for year in range(2010, 2021)]
 script_dir = os.path.dirname(os.path.realpath(__file__))
-station_mapping_filename = f'{states[0]}_Station_Mapping.csv'
-
-# Load weather stations data
-station_mapping_file = os.path.join(script_dir, station_mapping_filename)
-station_mapping = pd.read_csv(station_mapping_file)
-
-# Keep only the daily weather station data
-station_mapping = station_mapping[['DailyStation', 'DailyLong', 'DailyLat']].drop_duplicates()
-stations_gdf = gpd.GeoDataFrame(station_mapping, geometry=gpd.points_from_xy(station_mapping['DailyLong'], station_mapping['DailyLat']))
-stations_gdf.crs = "EPSG:4326"
+output_root = os.path.join(script_dir, 'Output_CSVs')
 
 #######################################
-# Function to calculate UTM zone
+# Functions
 #######################################
-def get_utm_zone(longitude):
-    return math.floor((longitude + 180) / 6) + 1
+def load_csv_points(archive, csv_file_name):
+    return archive.read_csv(csv_file_name)
 
-def get_utm_crs(longitude):
-    zone = get_utm_zone(longitude)
-    return f"EPSG:326{zone:02d}"
+def load_parquet_points(dataset_path, year):
+    return read_crop_points(dataset_path, year, columns=['Longitude', 'Latitude', 'CropTypes'])
 
-#######################################
-# Functions
-#######################################
-def load_and_convert_csv_to_gdf(zip_file_path, csv_file_name):
-    with zipfile.ZipFile(zip_file_path, 'r') as z:
-        with z.open(csv_file_name) as csv_file:
-            df = pd.read_csv(csv_file)
-    gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['Longitude'], df['Latitude']))
-    gdf.crs = "EPSG:4326"
-    return gdf
-
-def perform_spatial_join(crop_gdf, weather_stations):
-    median_long = weather_stations.geometry.x.median()
-    projected_crs = get_utm_crs(median_long)
-    
-    crop_gdf = crop_gdf.to_crs(projected_crs)
-    weather_stations = weather_stations.to_crs(projected_crs)
-    
-    joined_data = gpd.sjoin_nearest(crop_gdf, weather_stations, how="left", distance_col="distance")
-    return joined_data[['geometry', 'DailyStation', 'CropTypes', 'Year', 'distance']]
+def assign_nearest_station(crop_df, stations, station_ids):
+    station_index, distance = stations.query(crop_df['Longitude'], crop_df['Latitude'])
+    return pd.DataFrame({'DailyStation': station_ids.to_numpy()[station_index],
+                         'CropTypes': crop_df['CropTypes'].to_numpy(),
+                         'Year': crop_df['Year'].to_numpy(),
+                         'distance': distance})
 
 def group_and_save_data(joined_data, output_path):
     grouping_columns = ['DailyStation', 'CropTypes', 'Year']
-    grouped_data = joined_data.groupby(grouping_columns).size().reset_index(name='Count')
+    grouped_data = joined_data.groupby(grouping_columns, observed=True).size().reset_index(name='Count')
     grouped_data.to_csv(output_path, index=False)
 
+def load_station_index(station_mapping_file):
+    """
+    Daily weather stations of a station mapping CSV, and a nearest-station KD-tree over them.
+    """
+    # Load weather stations data
+    station_mapping = pd.read_csv(station_mapping_file)
+
+    # Keep only the daily weather station data
+    station_mapping = station_mapping[['DailyStation', 'DailyLong', 'DailyLat']].drop_duplicates().reset_index(drop=True)
+
+    # Build the nearest-station KD-tree once (great-circle distances)
+    return station_mapping, NearestStations(station_mapping['DailyLong'], station_mapping['DailyLat'])
+
 #######################################
 # Main Processing Loop
 #######################################
-for state in states:
-    zip_file_path = os.path.join(script_dir, f'{state}Data.zip')
+def process_state(state, years, station_mapping, nearest_stations, data_dir=script_dir, output_root=output_root):
+    """
+    Write Output_CSVs/{state}/{state}TopCropLonLat_{year}_GroupedByStation.csv for each year.
+    """
+    zip_file_path = os.path.join(data_dir, f'{state}Data.zip')
+    parquet_path = os.path.join(data_dir, f'{state}TopCropLonLat')
+
+    # Open the state's zip once and index its members (not needed with a Parquet dataset)
+    archive = None
+    if not os.path.isdir(parquet_path):
+        if not zipfile.is_zipfile(zip_file_path):
+            print(f"Zip file not found or is corrupted: {zip_file_path}")
+            return
+        archive = CropArchive(zip_file_path)
+
     for year in tqdm(years, desc=f'Processing {state}'):
         csv_file_name = f'{state}TopCropLonLat_{year}.csv'
-        output_directory = os.path.join(script_dir, 'Output_CSVs', state)
+        output_directory = os.path.join(output_root, state)
         os.makedirs(output_directory, exist_ok=True)
         output_grouped_file_path = os.path.join(output_directory, f'{state}TopCropLonLat_{year}_GroupedByStation.csv')
         
-        crop_gdf = load_and_convert_csv_to_gdf(zip_file_path, csv_file_name)
-        joined_data = perform_spatial_join(crop_gdf, stations_gdf)
+        if os.path.isdir(parquet_path):
+            if not os.path.exists(crop_points_path(parquet_path, year)):
+                print(f"Year not found in dataset: {parquet_path} {year}")
+                continue
+            crop_df = load_parquet_points(parquet_path, year)
+        else:
+            if csv_file_name not in archive:
+                print(f"File not found in zip: {csv_file_name}")
+                continue
+            crop_df = load_csv_points(archive, csv_file_name)
+        joined_data = assign_nearest_station(crop_df, nearest_stations, station_mapping['DailyStation'])
         group_and_save_data(joined_data, output_grouped_file_path)
 
-print("All data processed successfully.")
\ No newline at end of file
+    if archive is not None:
+        archive.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Count crop points by nearest daily weather station.")
+    parser.add_argument('--states', nargs='+', default=states, help="States to process")
+    parser.add_argument('--years', nargs='+', default=years, help="Years to process")
+    parser.add_argument('--station-mapping', help="Station mapping CSV (default: {first state}_Station_Mapping.csv)")
+    args = parser.parse_args()
+
+    station_mapping_file = args.station_mapping or os.path.join(script_dir, f'{args.states[0]}_Station_Mapping.csv')
+    station_mapping, nearest_stations = load_station_index(station_mapping_file)
+
+    for state in args.states:
+        process_state(state, args.years, station_mapping, nearest_stations)
+
+    print("All data processed successfully.")
@@ -10,145 +10,101 @@ It completes the following tasks:
 
 - Reads the spatial mapping between daily weather stations and their nearest normal stations,
       which includes coordinates and essential metadata such as station names and counties.
-- Plots each daily weather station and its corresponding nearest normal station on a map,
-      using distinct markers (daily stations as blue circles, normal stations as red squares).
+- With --plots, plots each daily weather station and its corresponding nearest normal station on a map
+      (stationMapDiagnostics.py), using distinct markers (daily stations as blue circles, normal stations as red squares).
 - Produces a Station Mapping csv {State}_Station_Mapping.csv
+
+map_nearest_normals(weather_data, normals_data) builds the mapping and can be imported;
+running the script (python nearestNeighborStationMapping.py [--state California])
+reads the stages and writes the mapping; --plots also draws the map (stationMapDiagnostics.py).
 """
 
+import argparse
 import os
+import sys
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
-import matplotlib.pyplot as plt
-from mpl_toolkits.basemap import Basemap
-from matplotlib.patches import FancyArrowPatch
 
-# =============================================================================
-## Set Working Directory From Absolute Path
-# =============================================================================
-absPath = os.path.abspath(__file__)          ## Absolute Path
-dirPath = os.path.dirname(absPath)           ## Directory Path
-os.chdir(dirPath)                            ## Set Directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'Preprocessing'))
+from nearestStation import NearestStations
+from climateSchema import DAILY_SCHEMA, NORMALS_SCHEMA, STATION_MAPPING_SCHEMA, write_table
+from dataStore import read_stage
 
 # =============================================================================
 ## Define Paths
 # =============================================================================
 state = 'California'
-base_dir = os.path.dirname(os.getcwd())
+plots = False   ## Show the station connections map (needs matplotlib and Basemap)
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 data_dir = os.path.join(base_dir, 'Data')
-weather_data_file = os.path.join(data_dir, 'Daily_Weather_Data', f'{state}DailyCleaned.csv')
-normals_data_file = os.path.join(data_dir, '30YearNormals_Data', f'{state}NormalsReady.csv')
 
 # =============================================================================
-## Load the Data
+## Find the Nearest Normal Station to Each Daily Weather Station
+## Great-circle distances on a KD-tree of the normal stations (nearestStation.py), so the
+## mapping is correct statewide instead of only inside one hard-coded UTM zone
 # =============================================================================
-weather_data = pd.read_csv(weather_data_file)
-normals_data = pd.read_csv(normals_data_file)
+def map_nearest_normals(weather_data, normals_data):
+    '''
+    --> This function maps each daily weather station to its nearest normal station
+        (weather_data: STATION, Long, Lat, COUNTY, StationName; normals_data: STATION, Long, Lat, COUNTY)
+    <-- Returns the station mapping (STATION_MAPPING_SCHEMA columns), one row per daily station
+    '''
+    ## Extract Unique Station Locations for Both Datasets
+    unique_weather_stations = weather_data[['STATION', 'Long', 'Lat', 
+                                            'COUNTY', 'StationName']].drop_duplicates().reset_index(drop=True)
 
-# =============================================================================
-## Extract Unique Station Locations for Both Datasets
-# =============================================================================
-unique_weather_stations = weather_data[['STATION', 'Long', 'Lat', 
-                                        'COUNTY', 'StationName']].drop_duplicates().reset_index(drop=True)
+    unique_normals_stations = normals_data[['STATION', 'Long', 
+                                            'Lat', 'COUNTY']].drop_duplicates().reset_index(drop=True)
+
+    normals_index = NearestStations(unique_normals_stations['Long'], unique_normals_stations['Lat'])
+    nearest_index, nearest_distance = normals_index.query(unique_weather_stations['Long'],
+                                                          unique_weather_stations['Lat'])
+    nearest_normals = unique_normals_stations.iloc[nearest_index].reset_index(drop=True)
 
-unique_normals_stations = normals_data[['STATION', 'Long', 
-                                        'Lat', 'COUNTY']].drop_duplicates().reset_index(drop=True)
+    return pd.DataFrame({'DailyStation': unique_weather_stations['STATION'],
+                         'DailyLong': unique_weather_stations['Long'],
+                         'DailyLat': unique_weather_stations['Lat'],
+                         'DailyCounty': unique_weather_stations['COUNTY'],
+                         'DailyStationName': unique_weather_stations['StationName'],
+                         'NormalStation': nearest_normals['STATION'],
+                         'NormalLong': nearest_normals['Long'],
+                         'NormalLat': nearest_normals['Lat'],
+                         'NormalCounty': nearest_normals['COUNTY']})
 
 # =============================================================================
-## Convert DataFrame to GeoDataFrame for Weather Stations
+## Run Program
 # =============================================================================
-unique_weather_stations['geometry'] = [Point(xy) for xy in zip(unique_weather_stations['Long'], 
-                                                               unique_weather_stations['Lat'])]
+def main(state, data_dir=data_dir, plots=False):
+    '''
+    --> This function maps one state's daily stations to normal stations and saves the mapping
+    <-- Writes {data_dir}/Station_Mapping/{state}_Station_Mapping.csv
+    '''
+    weather_stage = os.path.join(data_dir, 'Daily_Weather_Data', 'DailyCleaned')
+    normals_stage = os.path.join(data_dir, '30YearNormals_Data', 'NormalsReady')
 
-gdf_weather_stations = gpd.GeoDataFrame(unique_weather_stations,
-                                        geometry='geometry')
+    ## Only the station columns of the state's partitions are read from the Parquet stages
+    weather_data = read_stage(weather_stage, DAILY_SCHEMA, state=state,
+                              columns=['STATION', 'Long', 'Lat', 'COUNTY', 'StationName'])
+    normals_data = read_stage(normals_stage, NORMALS_SCHEMA, state=state,
+                              columns=['STATION', 'Long', 'Lat', 'COUNTY'])
 
-gdf_weather_stations.set_crs(epsg=4326, inplace=True)
-gdf_weather_stations.to_crs(epsg=32610, inplace=True)  # Reproject to UTM
+    nearest_normals_mapping = map_nearest_normals(weather_data, normals_data)
 
-# =============================================================================
-## Convert DataFrame to GeoDataFrame for Normals Stations
-# =============================================================================
-unique_normals_stations['geometry'] = [Point(xy) for xy in zip(unique_normals_stations['Long'],
-                                                               unique_normals_stations['Lat'])]
+    ## Save the Mapping
+    mapping_output_file = os.path.join(data_dir, 'Station_Mapping', f'{state}_Station_Mapping.csv')
+    write_table(nearest_normals_mapping, mapping_output_file, STATION_MAPPING_SCHEMA)
+    print("Station mapping complete. Output saved to:", mapping_output_file)
 
-gdf_normals_stations = gpd.GeoDataFrame(unique_normals_stations, 
-                                        geometry='geometry')
+    # Optionally plot the connections (plotting libraries are only imported here)
+    if plots:
+        from stationMapDiagnostics import plot_station_connections
+        plot_station_connections(nearest_normals_mapping)
 
-gdf_normals_stations.set_crs(epsg=4326, inplace=True)
-gdf_normals_stations.to_crs(epsg=32610, inplace=True)  # Reproject to UTM
 
-# =============================================================================
-## Perform Spatial Join - This Joins Each Unique Weather Station to the Nearest Normal Station
-# =============================================================================
-nearest_normals_mapping = gpd.sjoin_nearest(gdf_weather_stations,
-                                            gdf_normals_stations, 
-                                            how="left", 
-                                            distance_col="distance")
-
-nearest_normals_mapping = nearest_normals_mapping[['STATION_left', 'Long_left', 
-                                                   'Lat_left', 'COUNTY_left', 
-                                                   'StationName', 'STATION_right',
-                                                   'Long_right', 'Lat_right',
-                                                   'COUNTY_right']].rename(
-    columns={'STATION_left': 'DailyStation', 
-             'Long_left': 'DailyLong', 
-             'Lat_left': 'DailyLat',
-             'COUNTY_left': 'DailyCounty', 
-             'StationName': 'DailyStationName', 
-             'STATION_right': 'NormalStation', 
-             'Long_right': 'NormalLong', 
-             'Lat_right': 'NormalLat', 
-             'COUNTY_right': 'NormalCounty'})
-
-# =============================================================================
-## Save the Mapping
-# =============================================================================
-mapping_output_file = os.path.join(data_dir, 'Station_Mapping', f'{state}_Station_Mapping.csv')
-nearest_normals_mapping.to_csv(mapping_output_file, index=False)
-print("Station mapping complete. Output saved to:", mapping_output_file)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Map a state's daily weather stations to their nearest normal stations.")
+    parser.add_argument('--state', default=state, help="State to map")
+    parser.add_argument('--data-dir', default=data_dir, help="Code/Data folder holding the stages")
+    parser.add_argument('--plots', action='store_true', default=plots, help="Show the station connections map")
+    args = parser.parse_args()
 
-# =============================================================================
-## Function to Plot Connections Between Stations on a Map
-# =============================================================================
-def plot_station_connections(df):
-    '''
-    --> This function plots connections between daily weather stations and nearest normal stations on a map
-    <-- Plots map with station connections
-    '''
-    fig, ax = plt.subplots(figsize=(10, 10))
-    m = Basemap(projection='merc', llcrnrlat=31, urcrnrlat=42,
-                llcrnrlon=-124, urcrnrlon=-114, resolution='i', ax=ax)
-    m.drawcoastlines()
-    m.drawcountries()
-    m.drawstates()
-
-    ## Plot each pair of stations
-    for _, row in df.iterrows():
-        x, y = m(row['DailyLong'], row['DailyLat'])
-        xn, yn = m(row['NormalLong'], row['NormalLat'])
-        
-        ## Plot Daily Station
-        m.plot(x, y, marker='o',
-               color='blue', 
-               markersize=5, 
-               label='Daily Station' if 'Daily Station' not in ax.get_legend_handles_labels()[1] else "")
-        
-        ## Plot Normal Station
-        m.plot(xn, yn, marker='s', 
-               color='green', 
-               markersize=5, 
-               label='Normal Station' if 'Normal Station' not in ax.get_legend_handles_labels()[1] else "")
-        
-        ## Connect with a line
-        m.plot([x, xn], [y, yn], linestyle='-',
-               color='red', 
-               linewidth=1,
-               alpha=0.9)
-
-    plt.title("Connections between Daily Weather Stations and Nearest Normal Stations")
-    plt.legend()
-    plt.show()
-
-# Optionally plot the connections
-plot_station_connections(nearest_normals_mapping)
+    main(args.state, args.data_dir, args.plots)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Station Mapping Diagnostic Plots \\\\\\\\\\
+
+Map plots of the daily weather station -> nearest normal station mapping, drawn with
+Basemap. Imported only when nearestNeighborStationMapping.py or climateTotalMerge.py is
+run with --plots, so the data products need neither matplotlib nor Basemap.
+
+- plot_station_connections: the station mapping table ({state}_Station_Mapping.csv)
+- plot_combined_station_connections: the mapping as found in the combined daily + normals data
+
+@author: dforc
+"""
+
+import pandas as pd
+import matplotlib.pyplot as plt
+from mpl_toolkits.basemap import Basemap
+
+
+# =============================================================================
+## Function to Plot Connections Between Stations on a Map
+# =============================================================================
+def plot_station_connections(df):
+    '''
+    --> This function plots connections between daily weather stations and nearest normal stations on a map
+    <-- Plots map with station connections
+    '''
+    fig, ax = plt.subplots(figsize=(10, 10))
+    m = Basemap(projection='merc', llcrnrlat=31, urcrnrlat=42,
+                llcrnrlon=-124, urcrnrlon=-114, resolution='i', ax=ax)
+    m.drawcoastlines()
+    m.drawcountries()
+    m.drawstates()
+
+    ## Plot each pair of stations
+    for _, row in df.iterrows():
+        x, y = m(row['DailyLong'], row['DailyLat'])
+        xn, yn = m(row['NormalLong'], row['NormalLat'])
+        
+        ## Plot Daily Station
+        m.plot(x, y, marker='o',
+               color='blue', 
+               markersize=5, 
+               label='Daily Station' if 'Daily Station' not in ax.get_legend_handles_labels()[1] else "")
+        
+        ## Plot Normal Station
+        m.plot(xn, yn, marker='s', 
+               color='green', 
+               markersize=5, 
+               label='Normal Station' if 'Normal Station' not in ax.get_legend_handles_labels()[1] else "")
+        
+        ## Connect with a line
+        m.plot([x, xn], [y, yn], linestyle='-',
+               color='red', 
+               linewidth=1,
+               alpha=0.9)
+
+    plt.title("Connections between Daily Weather Stations and Nearest Normal Stations")
+    plt.legend()
+    plt.show()
+
+
+
+# =============================================================================
+## Plot Station Mapping in Merged Dataframe to Check for Validity
+# =============================================================================
+def plot_combined_station_connections(df):
+    '''
+    Plots connections between daily weather stations and nearest normal stations on a map.
+    '''
+    ## Group by 'DailyStation' and take the first occurrence
+    unique_stations_df = df.groupby('DailyStation', observed=True).agg('first').reset_index()
+
+    ## Print diagnostic information
+    print(f"Number of unique stations in the original dataframe: {df['DailyStation'].nunique()}")
+    print(f"Number of rows after grouping: {len(unique_stations_df)}")
+
+    fig, ax = plt.subplots(figsize=(10, 10))
+    m = Basemap(projection='merc', llcrnrlat=31, urcrnrlat=42,
+                llcrnrlon=-124, urcrnrlon=-114, resolution='i', ax=ax)
+    m.drawcoastlines()
+    m.drawcountries()
+    m.drawstates()
+
+    ## Initialize legend tracking
+    plotted_daily = False
+    plotted_normal = False
+
+    ## Plot each pair of stations
+    for _, row in unique_stations_df.iterrows():
+        if pd.notnull(row['DailyLat']) and pd.notnull(row['DailyLong']) and pd.notnull(row['NormalLat']) and pd.notnull(row['NormalLong']):
+            x, y = m(row['DailyLong'], row['DailyLat'])
+            xn, yn = m(row['NormalLong'], row['NormalLat'])
+            
+            ## Plot Daily Station
+            if not plotted_daily:
+                m.plot(x, y, marker='o', color='blue', markersize=5, label='Daily Station')
+                plotted_daily = True
+            else:
+                m.plot(x, y, marker='o', color='blue', markersize=5)
+            
+            ## Plot Normal Station
+            if not plotted_normal:
+                m.plot(xn, yn, marker='s', color='green', markersize=5, label='Normal Station')
+                plotted_normal = True
+            else:
+                m.plot(xn, yn, marker='s', color='green', markersize=5)
+            
+            ## Connect with a line
+            m.plot([x, xn], [y, yn], linestyle='-', color='red', linewidth=1, alpha=0.5)
+
+    plt.title("Connections between Daily Weather Stations and Nearest Normal Stations")
+    plt.legend(loc='lower left')
+    plt.show()
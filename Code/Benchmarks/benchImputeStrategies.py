@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Imputation Strategy Benchmark \\\\\\\\\\
+
+Compares the imputation strategies of imputeStrategies.py on a state's real combined
+table (the Combined_Daily_Normals stage that combinedDiagnosticImpute.py reads).
+
+- Hides a --holdout share of the station days that have values, as outages of 1 to
+  --max-gap consecutive days (whole rows, every column at once)
+- Imputes the table with each strategy in turn, for all imputed columns
+- Reports throughput (rows per second) and, per column, the mean absolute error and
+  root mean square error on the hidden values, and the share of them filled at all
+
+Usage:
+    python benchImputeStrategies.py [--state California] [--stage ../../Data/Main_Data/Combined_Daily_Normals]
+                                    [--holdout 0.05] [--max-gap 7] [--workers 1]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from climateSchema import COMBINED_SCHEMA  # noqa: E402
+from combinedDiagnosticImpute import impute, drop_extra_columns, columns_to_impute, data_stage, state  # noqa: E402
+from dataStore import read_stage  # noqa: E402
+from imputeStrategies import STRATEGIES  # noqa: E402
+
+
+#######################################
+####### Hold Out Values
+#######################################
+def hold_out(df, share, max_gap, seed=0):
+    """
+    Hide values of the imputed columns as station outages of 1 to max_gap days.
+
+    Parameters:
+    - df: DataFrame sorted by DailyStation and Date.
+    - share: Float, share of rows to hide (roughly).
+    - max_gap: Integer, longest outage in rows.
+
+    Returns:
+    - Tuple (hidden, truth): the table with the outages blanked, and a boolean
+      (rows x columns) array of the blanked values that were present.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = len(df)
+    stations = df['DailyStation'].cat.codes.to_numpy()
+
+    n_outages = max(1, int(share * n_rows / ((1 + max_gap) / 2)))
+    starts = rng.integers(0, n_rows, n_outages)
+    lengths = rng.integers(1, max_gap + 1, n_outages)
+    rows = starts[:, None] + np.arange(max_gap)
+    within = (np.arange(max_gap) < lengths[:, None]) & (rows < n_rows)
+    within[within] &= stations[rows[within]] == np.repeat(stations[starts], within.sum(axis=1))
+
+    blank = np.zeros(n_rows, dtype=bool)
+    blank[rows[within]] = True
+    truth = blank[:, None] & df[columns_to_impute].notna().to_numpy()
+
+    hidden = df.copy()
+    hidden.loc[blank, columns_to_impute] = np.nan
+    return hidden, truth
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Run Benchmark
+#######################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--state', default=state, help='State of the combined table')
+    parser.add_argument('--stage', default=data_stage, help='Combined_Daily_Normals stage directory')
+    parser.add_argument('--holdout', type=float, default=0.05, help='Share of rows to hide')
+    parser.add_argument('--max-gap', type=int, default=7, help='Longest hidden outage, in days')
+    parser.add_argument('--workers', type=int, default=1, help='Processes for rolling_mean')
+    args = parser.parse_args()
+
+    df = drop_extra_columns(read_stage(args.stage, COMBINED_SCHEMA, state=args.state))
+    df = df.sort_values(by=['DailyStation', 'Date']).reset_index(drop=True)
+    hidden, truth = hold_out(df, args.holdout, args.max_gap)
+    actual = df[columns_to_impute].to_numpy(dtype=np.float64, na_value=np.nan)
+    print(f'{args.state}: {len(df):,d} rows, {df["DailyStation"].nunique():,d} stations, '
+          f'{int(truth.sum()):,d} values held out')
+
+    results = []
+    for name in STRATEGIES:
+        start = time.perf_counter()
+        imputed = impute(hidden, workers=args.workers, strategies=dict.fromkeys(columns_to_impute, name))
+        seconds = time.perf_counter() - start
+
+        filled = imputed[columns_to_impute].to_numpy(dtype=np.float64, na_value=np.nan)
+        for i, column in enumerate(columns_to_impute):
+            error = filled[truth[:, i], i] - actual[truth[:, i], i]
+            scored = error[~np.isnan(error)]
+            results.append({'Strategy': name, 'Rows/s': len(df) / seconds, 'Column': column,
+                            'MAE': np.abs(scored).mean() if len(scored) else np.nan,
+                            'RMSE': np.sqrt((scored ** 2).mean()) if len(scored) else np.nan,
+                            'Filled': len(scored) / max(len(error), 1)})
+
+    report = pd.DataFrame(results)
+    with pd.option_context('display.float_format', '{:,.3f}'.format, 'display.width', 200,
+                           'display.max_columns', None):
+        print(report.pivot(index='Column', columns='Strategy', values=['MAE', 'RMSE', 'Filled']).loc[columns_to_impute])
+        print(report.groupby('Strategy', sort=False)['Rows/s'].first().map('{:,.0f}'.format).to_string())
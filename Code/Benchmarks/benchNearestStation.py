@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Nearest Station Assignment Benchmark \\\\\\\\\\
+
+Compares cropStationMapper.py's former gpd.sjoin_nearest path (GeoDataFrame of crop
+points projected to UTM) with nearestStation.NearestStations (cKDTree queried with raw
+coordinate arrays).
+
+- Reports wall time for sjoin_nearest, the KD-tree in the same UTM zone, and the default
+  great-circle KD-tree (unit-sphere coordinates)
+- Checks that the UTM KD-tree assigns every point the same station as sjoin_nearest
+- Checks the great-circle KD-tree against a brute-force haversine search on a sample,
+  and counts how many points the single-UTM-zone joins assign to a different station
+- Uses random crop points and stations over Florida by default; pass --station-mapping
+  to use a real {state}_Station_Mapping.csv
+
+Usage:
+    python benchNearestStation.py [--points 2000000] [--stations 300] [--station-mapping CSV]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from nearestStation import NearestStations, get_utm_crs, EARTH_RADIUS_M  # noqa: E402
+
+
+## Florida bounding box (lon/lat)
+FLORIDA_BOUNDS = (-87.6, 24.5, -80.0, 31.0)
+
+
+#######################################
+####### Synthetic Inputs
+#######################################
+def random_points(n, bounds, seed):
+    """Uniform random longitudes/latitudes inside bounds (minx, miny, maxx, maxy)."""
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(bounds[0], bounds[2], n), rng.uniform(bounds[1], bounds[3], n))
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Engines
+#######################################
+def sjoin_nearest_stations(longitudes, latitudes, stations):
+    """
+    The former cropStationMapper.py join; returns (DailyStation, distance) per point.
+    Points tied between stations come back once per station; the first match is kept.
+    """
+    crop_gdf = gpd.GeoDataFrame({'point': np.arange(len(longitudes))},
+                                geometry=gpd.points_from_xy(longitudes, latitudes), crs='EPSG:4326')
+    stations_gdf = gpd.GeoDataFrame(stations, geometry=gpd.points_from_xy(stations['DailyLong'], stations['DailyLat']),
+                                    crs='EPSG:4326')
+    projected_crs = get_utm_crs(stations_gdf.geometry.x.median())
+
+    joined = gpd.sjoin_nearest(crop_gdf.to_crs(projected_crs), stations_gdf.to_crs(projected_crs),
+                               how='left', distance_col='distance')
+    ties = int(joined.index.duplicated().sum())
+    joined = joined[~joined.index.duplicated(keep='first')]
+    return joined['DailyStation'].to_numpy(), joined['distance'].to_numpy(), ties
+
+
+def kdtree_nearest_stations(longitudes, latitudes, stations, projected_crs=None):
+    """nearestStation.NearestStations; returns (DailyStation, distance) per point."""
+    engine = NearestStations(stations['DailyLong'], stations['DailyLat'], projected_crs=projected_crs)
+    indices, distances = engine.query(longitudes, latitudes)
+    return stations['DailyStation'].to_numpy()[indices], distances
+
+
+def haversine_nearest_stations(longitudes, latitudes, stations):
+    """Brute-force great-circle nearest station; returns (DailyStation, distance) per point."""
+    lon1, lat1 = np.radians(longitudes)[:, None], np.radians(latitudes)[:, None]
+    lon2, lat2 = np.radians(stations['DailyLong'].to_numpy()), np.radians(stations['DailyLat'].to_numpy())
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distances = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+    nearest = distances.argmin(axis=1)
+    return stations['DailyStation'].to_numpy()[nearest], distances[np.arange(len(nearest)), nearest]
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Run Benchmark
+#######################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=2_000_000, help='Number of crop points')
+    parser.add_argument('--stations', type=int, default=300, help='Number of random stations')
+    parser.add_argument('--station-mapping', help='{state}_Station_Mapping.csv to take stations from')
+    parser.add_argument('--sample', type=int, default=20_000, help='Points checked by brute force')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.station_mapping:
+        stations = pd.read_csv(args.station_mapping)[['DailyStation', 'DailyLong', 'DailyLat']]
+        stations = stations.drop_duplicates().reset_index(drop=True)
+        bounds = (stations['DailyLong'].min(), stations['DailyLat'].min(),
+                  stations['DailyLong'].max(), stations['DailyLat'].max())
+    else:
+        bounds = FLORIDA_BOUNDS
+        station_long, station_lat = random_points(args.stations, bounds, args.seed + 1)
+        stations = pd.DataFrame({'DailyStation': [f'USC{i:08d}' for i in range(args.stations)],
+                                 'DailyLong': station_long, 'DailyLat': station_lat})
+    longitudes, latitudes = random_points(args.points, bounds, args.seed)
+    print(f'{args.points:,d} points, {len(stations):,d} stations')
+
+    start = time.perf_counter()
+    old_station, old_distance, ties = sjoin_nearest_stations(longitudes, latitudes, stations)
+    t_old = time.perf_counter() - start
+
+    utm_crs = get_utm_crs(stations['DailyLong'].median())
+    start = time.perf_counter()
+    utm_station, utm_distance = kdtree_nearest_stations(longitudes, latitudes, stations, utm_crs)
+    t_utm = time.perf_counter() - start
+
+    start = time.perf_counter()
+    gc_station, gc_distance = kdtree_nearest_stations(longitudes, latitudes, stations)
+    t_gc = time.perf_counter() - start
+
+    same = old_station == utm_station
+    print(f'gpd.sjoin_nearest ({utm_crs}): {t_old:8.3f} s')
+    print(f'cKDTree ({utm_crs}):           {t_utm:8.3f} s  ({t_old / t_utm:.1f}x)')
+    print(f'cKDTree (great-circle):        {t_gc:8.3f} s  ({t_old / t_gc:.1f}x)')
+    print(f'UTM cKDTree vs sjoin_nearest: identical assignments {same.all()} '
+          f'({same.sum():,d} / {same.size:,d}; {ties} tied points in sjoin_nearest), '
+          f'max distance difference {np.abs(old_distance - utm_distance).max():.3e} m')
+
+    sample = slice(0, min(args.sample, args.points))
+    bf_station, bf_distance = haversine_nearest_stations(longitudes[sample], latitudes[sample], stations)
+    print(f'Great-circle cKDTree vs brute-force haversine ({bf_station.size:,d} points): '
+          f'identical assignments {np.array_equal(bf_station, gc_station[sample])}, '
+          f'max distance difference {np.abs(bf_distance - gc_distance[sample]).max():.3e} m')
+    print(f'Points the single-UTM-zone join assigns to another station: {(gc_station != old_station).sum():,d}')
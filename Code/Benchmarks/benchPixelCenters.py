@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Pixel Center Coordinates Benchmark \\\\\\\\\\
+
+Compares rasterio.transform.xy with rasterCoords.pixel_centers on the pixels that
+vegTIFtoCSV.py keeps (NDVI >= 0 after reprojection to EPSG:4326).
+
+- Reports wall time and peak traced Python memory (tracemalloc) for both routines
+- Checks that both return exactly the same coordinates
+- Defaults to the bundled Code/Preprocessing/california_ndvi_week1_2011.tif
+  (fetch it with `git lfs pull` if the checkout only holds the pointer file)
+
+Usage:
+    python benchPixelCenters.py [--tif PATH] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import rasterio
+from rasterio.warp import calculate_default_transform, reproject
+from rasterio.enums import Resampling
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from rasterCoords import pixel_centers  # noqa: E402
+
+
+#######################################
+####### Load NDVI Pixels
+#######################################
+def load_ndvi_pixels(fileloc, dst_crs='EPSG:4326'):
+    """
+    Reproject an NDVI raster exactly like vegTIFtoCSV.py and return the kept pixels.
+
+    Returns:
+    - Tuple (transform_4326, rows, cols).
+    """
+    with rasterio.open(fileloc) as src:
+        transform_4326, width_4326, height_4326 = calculate_default_transform(
+            src.crs, dst_crs, src.width, src.height, *src.bounds)
+        dst_array = np.empty((height_4326, width_4326), dtype=src.meta['dtype'])
+        reproject(source=rasterio.band(src, 1), destination=dst_array,
+                  src_transform=src.transform, src_crs=src.crs,
+                  dst_transform=transform_4326, dst_crs=dst_crs,
+                  resampling=Resampling.nearest)
+    rows, cols = np.where(dst_array >= 0)
+    return transform_4326, rows, cols
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Timing Helpers
+#######################################
+def measure(func, repeat):
+    """Return (result, best wall time in seconds, peak traced bytes) for func()."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+        del result
+
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Run Benchmark
+#######################################
+if __name__ == '__main__':
+    default_tif = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing',
+                               'california_ndvi_week1_2011.tif')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tif', default=default_tif, help='NDVI .tif to benchmark on')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed repetitions per routine')
+    args = parser.parse_args()
+
+    transform_4326, rows, cols = load_ndvi_pixels(args.tif)
+    print(f'{os.path.basename(args.tif)}: {rows.size:,d} pixels')
+
+    (xs_old, ys_old), t_old, mem_old = measure(
+        lambda: rasterio.transform.xy(transform_4326, rows, cols, offset='center'), args.repeat)
+    (xs_new, ys_new), t_new, mem_new = measure(
+        lambda: pixel_centers(transform_4326, rows, cols), args.repeat)
+
+    print(f'rasterio.transform.xy: {t_old:8.3f} s  peak {mem_old / 2**20:9.1f} MiB')
+    print(f'pixel_centers:         {t_new:8.3f} s  peak {mem_new / 2**20:9.1f} MiB')
+    print(f'Speedup {t_old / t_new:.1f}x, memory {mem_old / max(mem_new, 1):.1f}x lower')
+    print(f'Identical coordinates: {np.array_equal(np.asarray(xs_old), xs_new) and np.array_equal(np.asarray(ys_old), ys_new)}')
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Raster to Points Benchmark \\\\\\\\\\
+
+Compares the in-memory and streaming raster-to-points paths of TIFtoCSV.py.
+
+- Runs each conversion in its own child process so peak RSS is measured per mode
+- Reports wall time, pixels per second and peak RSS for both modes
+- Reports how many points both modes agree on (the in-memory reproject uses GDAL's
+  approximate transformer, the streamed strips an exact one, so a small share of
+  nearest-neighbour picks differ along resampling boundaries)
+- Uses a synthetic EPSG:5070 crop raster unless a .tif and legend are given
+
+Usage:
+    python benchRasterToPoints.py [--tif PATH --legend PATH] [--size 8000] [--block-rows 512]
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import from_origin
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+import TIFtoCSV  # noqa: E402
+
+
+#######################################
+####### Synthetic Inputs
+#######################################
+def make_synthetic_raster(path, size, crop_share=0.4, field_px=16, seed=0):
+    """
+    Write a square uint8 CropScape-like raster in CONUS Albers covering central Florida.
+
+    Parameters:
+    - path: String, output .tif path.
+    - size: Integer, width and height in pixels.
+    - crop_share: Float, share of fields carrying a non-zero crop code.
+    - field_px: Integer, side of the square single-crop fields in pixels.
+    - seed: Integer, random seed.
+    """
+    rng = np.random.default_rng(seed)
+    n_fields = -(-size // field_px)
+    fields = rng.integers(1, 255, size=(n_fields, n_fields), dtype=np.uint8)
+    fields[rng.random((n_fields, n_fields)) > crop_share] = 0
+    data = np.repeat(np.repeat(fields, field_px, axis=0), field_px, axis=1)[:size, :size]
+    profile = {'driver': 'GTiff', 'dtype': 'uint8', 'count': 1,
+               'width': size, 'height': size, 'crs': 'EPSG:5070',
+               'transform': from_origin(1300000, 700000, 30, 30),
+               'tiled': True, 'blockxsize': 256, 'blockysize': 256}
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(data, 1)
+
+
+def make_synthetic_legend():
+    return pd.DataFrame({'Value': np.arange(256), 'Category': [f'Crop{v}' for v in range(256)]})
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Timed Child Runs
+#######################################
+def _run_mode(mode, tif, legend_path, output_path, block_rows, queue):
+    crop_legend = pd.read_csv(legend_path)
+    start = time.perf_counter()
+    if mode == 'in-memory':
+        dfMerged = TIFtoCSV.raster_to_points(tif, crop_legend, 2020)
+        dfMerged.to_csv(output_path, index=False)
+        n_points = len(dfMerged)
+    else:
+        n_points = TIFtoCSV.stream_raster_to_points(tif, crop_legend, 2020, output_path,
+                                                    block_rows=block_rows)
+    elapsed = time.perf_counter() - start
+    ## ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    queue.put((n_points, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale))
+
+
+def run_mode(mode, tif, legend_path, output_path, block_rows):
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_mode, args=(mode, tif, legend_path, output_path, block_rows, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Run Benchmark
+#######################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tif', help='CropScape .tif to convert (synthetic raster if omitted)')
+    parser.add_argument('--legend', help='Legend.csv matching --tif')
+    parser.add_argument('--size', type=int, default=8000, help='Synthetic raster width/height in pixels')
+    parser.add_argument('--block-rows', type=int, default=512, help='Rows per streamed strip')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tif = args.tif
+        legend_path = args.legend
+        if tif is None:
+            tif = os.path.join(tmp, 'synthetic.tif')
+            make_synthetic_raster(tif, args.size)
+        if legend_path is None:
+            legend_path = os.path.join(tmp, 'Legend.csv')
+            make_synthetic_legend().to_csv(legend_path, index=False)
+
+        with rasterio.open(tif) as src:
+            n_pixels = src.width * src.height
+
+        outputs = {}
+        for mode in ['in-memory', 'streaming']:
+            outputs[mode] = os.path.join(tmp, f'{mode}.csv')
+            n_points, elapsed, peak = run_mode(mode, tif, legend_path, outputs[mode], args.block_rows)
+            print(f'{mode:>10}: {n_points:>12,d} points  {elapsed:8.2f} s  '
+                  f'{n_pixels / elapsed:14,.0f} px/s  peak RSS {peak / 2**20:9.1f} MiB')
+
+        keys = ['Longitude', 'Latitude', 'CropTypes']
+        old = pd.read_csv(outputs['in-memory'], usecols=keys)
+        new = pd.read_csv(outputs['streaming'], usecols=keys)
+        agree = len(old.merge(new, on=keys))
+        print(f'Points agreeing between modes: {agree:,d} of {max(len(old), len(new)):,d} '
+              f'({agree / max(len(old), len(new), 1):.2%})')
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Rolling Mean Imputation Benchmark \\\\\\\\\\
+
+Compares a per-column pandas groupby imputation over time windows
+(rolling('6D', center=True) on each station's dates) with impute() from
+combinedDiagnosticImpute.py, which fills all six columns in one pass over a dense
+station x day calendar (rollingImpute.py), on a synthetic combined daily table.
+
+- Builds --stations stations x --days days of float32 measurements with scattered
+  missing values, longer outages (so some windows have no values at all) and a share
+  of calendar days dropped altogether (--drop-days), station ids as a category and
+  rows shuffled
+- Reports wall time for the groupby and for impute() with 1 and --workers processes
+- Checks that all give identical tables (same order, same float32 values, same
+  missing values) and that ImputedMask marks exactly the values that were filled
+
+Usage:
+    python benchRollingImpute.py [--stations 400] [--days 4018] [--drop-days 0.05] [--workers 4]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from combinedDiagnosticImpute import impute, was_imputed, columns_to_impute  # noqa: E402
+
+
+#######################################
+####### Synthetic Combined Table
+#######################################
+def make_combined(stations, days, drop_days=0.0, seed=0):
+    """
+    DailyStation, Date and the imputed columns for every station and day, less a
+    drop_days share of days, rows shuffled.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = stations * days
+    df = pd.DataFrame({
+        'DailyStation': pd.Categorical(np.repeat([f'{72000000000 + i:011d}' for i in range(stations)], days)),
+        'Date': np.tile(pd.date_range('2010-01-01', periods=days).to_numpy(), stations),
+    })
+    for column in columns_to_impute:
+        values = rng.normal(20, 8, n_rows).astype(np.float32)
+        values[rng.random(n_rows) < 0.05] = np.nan
+        ## Outages: runs of 3 to 30 missing days
+        for start in rng.integers(0, n_rows, n_rows // 2000):
+            values[start:start + rng.integers(3, 30)] = np.nan
+        df[column] = values
+    df = df[rng.random(n_rows) >= drop_days]
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Groupby Imputation
+#######################################
+def impute_with_groupby(df, columns=columns_to_impute):
+    """Per-column groupby / time-window rolling mean imputation, the pandas reference for impute()."""
+    df = df.sort_values(by=['DailyStation', 'Date'])
+
+    def rolling_mean_impute(group):
+        series = group.set_index('Date').iloc[:, 0]
+        means = series.rolling('6D', min_periods=1, center=True).mean()
+        return series.fillna(means).set_axis(group.index)
+
+    for column in columns:
+        filled = df.groupby('DailyStation', observed=True)[[column, 'Date']].apply(rolling_mean_impute)
+        df[column] = filled.reset_index(level=0, drop=True).astype(df[column].dtype)
+    return df
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Run Benchmark
+#######################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=400, help='Stations in the synthetic table')
+    parser.add_argument('--days', type=int, default=4018, help='Days per station (4018 = 2010-2020)')
+    parser.add_argument('--drop-days', type=float, default=0.05, help='Share of station days missing from the table')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processes for the parallel impute()')
+    args = parser.parse_args()
+
+    df = make_combined(args.stations, args.days, args.drop_days)
+    print(f'{len(df):,d} rows, {df[columns_to_impute].isna().mean().mean():.1%} missing')
+
+    start = time.perf_counter()
+    reference = impute_with_groupby(df)
+    timings = {'groupby per column': time.perf_counter() - start}
+
+    results = {}
+    for n in sorted({1, args.workers}):
+        start = time.perf_counter()
+        results[n] = impute(df, workers=n)
+        timings[f'impute, {n} worker(s)'] = time.perf_counter() - start
+
+    def same_values(a, b):
+        return (a.index.equals(b.index)
+                and all(np.array_equal(a[c].astype(np.float32).to_numpy(), b[c].astype(np.float32).to_numpy(),
+                                       equal_nan=True)
+                        for c in columns_to_impute))
+
+    for name, seconds in timings.items():
+        print(f'{name + ":":24s}{seconds:8.3f} s   ({timings["groupby per column"] / seconds:.1f}x)')
+
+    new = results[args.workers]
+    masked = all((was_imputed(new, c) == (df[c].isna().loc[new.index] & new[c].notna())).all()
+                 for c in columns_to_impute)
+    print(f'Still missing after imputation: {int(new[columns_to_impute].isna().sum().sum()):,d} values')
+    print(f'Identical output: {all(same_values(reference, result) for result in results.values())}')
+    print(f'ImputedMask matches the filled values: {masked}')
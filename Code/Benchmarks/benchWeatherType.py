@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+////////// WeatherType (FRSHTT) Decoding Benchmark \\\\\\\\\\
+
+Compares dailyClimateBasicCleaner.py's former six .apply(lambda x: int(str(x).zfill(6)[i]))
+passes with weatherType.decode_weather_type on a synthetic GSOD-like file.
+
+- Writes a CSV with --rows daily records whose WeatherType follows GSOD's FRSHTT codes
+  (mostly 0, some rain / fog / thunder combinations) and reads it back like the cleaner
+- Reports wall time for both decoders
+- Checks that every flag is identical
+
+Usage:
+    python benchWeatherType.py [--rows 5000000] [--csv PATH]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from weatherType import decode_weather_type, WEATHER_CONDITIONS  # noqa: E402
+
+
+#######################################
+####### Synthetic GSOD File
+#######################################
+def make_weather_type_csv(path, rows, seed=0):
+    """
+    Write a CSV with Date, STATION and WeatherType columns; each FRSHTT digit is set
+    independently with a plausible daily frequency.
+    """
+    rng = np.random.default_rng(seed)
+    frequencies = [0.08, 0.35, 0.01, 0.002, 0.15, 0.001]
+    codes = np.zeros(rows, dtype=np.int64)
+    for i, p in enumerate(frequencies):
+        codes += (rng.random(rows) < p) * 10 ** (5 - i)
+
+    pd.DataFrame({'Date': np.resize(pd.date_range('2010-01-01', '2020-12-31').strftime('%Y-%m-%d'), rows),
+                  'STATION': rng.integers(72000000000, 72999999999, rows),
+                  'WeatherType': codes}).to_csv(path, index=False)
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Decoders
+#######################################
+def decode_with_apply(weather_type):
+    """The former per-flag .apply decoding from dailyClimateBasicCleaner.py."""
+    flags = pd.DataFrame(index=weather_type.index)
+    for i, condition in enumerate(WEATHER_CONDITIONS):
+        flags[condition] = weather_type.apply(lambda x: int(str(x).zfill(6)[i]) if pd.notnull(x) else np.nan)
+    return flags
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Run Benchmark
+#######################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5_000_000, help='Rows in the synthetic file')
+    parser.add_argument('--csv', help='Where to write the synthetic file (default: a temporary file)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = args.csv or os.path.join(tmp_dir, 'weather_type.csv')
+        make_weather_type_csv(csv_path, args.rows)
+        weather_type = pd.read_csv(csv_path, usecols=['WeatherType'])['WeatherType']
+    print(f'{len(weather_type):,d} rows')
+
+    start = time.perf_counter()
+    old_flags = decode_with_apply(weather_type)
+    t_old = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new_flags = decode_weather_type(weather_type)
+    t_new = time.perf_counter() - start
+
+    identical = all((old_flags[c].to_numpy() == new_flags[c].to_numpy(dtype=np.int64)).all()
+                    for c in WEATHER_CONDITIONS)
+    print(f'six .apply passes:    {t_old:8.3f} s')
+    print(f'decode_weather_type:  {t_new:8.3f} s')
+    print(f'Speedup {t_old / t_new:.0f}x')
+    print(f'Identical flags: {identical}')
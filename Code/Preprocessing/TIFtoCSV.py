@@ -4,59 +4,77 @@
 # Note:
 #  - Crop Data is from https://nassgeodata.gmu.edu/CropScape/
 #    Conversion: .222395 acres per pixel
+#  - Statewide 30 m rasters do not fit in memory once reprojected (California OOMs).
+#    By default the raster is warped through a WarpedVRT one strip of --block-rows rows
+#    at a time and each strip's points are appended straight to the output, so peak
+#    memory depends on the strip size rather than the size of the state
+#    (--in-memory reprojects each raster whole instead).
+#  - Run from the command line with the states and years to convert; the years are fanned
+#    out over a process pool and each worker reads Legend.csv and the reference rasters once:
+#      python TIFtoCSV.py --states Florida California --years 2010-2020 --workers 8
+#  - --format parquet writes {state}CropData/{state}TopCropLonLat/Year={year}/part-0.parquet
+#    (float32 coordinates, dictionary-encoded CropTypes) instead of one CSV per year;
+#    cropCountyShaper.py and cropStationMapper.py read that layout directly. See cropPoints.py.
+#  - --aggregate county station skips the point tables altogether: county polygons are burnt onto
+#    each strip, crop pixels are matched to their nearest station (great-circle KD-tree, see
+#    nearestStation.py), and pixels are counted per (zone, crop) with
+#    np.bincount, writing the same grouped tables cropCountyShaper.py and cropStationMapper.py
+#    produce. See zonalCounts.py. County ids come from a cached county grid (countyGrid.py).
 
 # In the future:
 #  - File paths are from Ryan's local file management.
 #    Use a python library to save and load files from root directory, instead of using local paths.
 ########################################################################################################
 
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import rasterio
-from rasterio.warp import calculate_default_transform, reproject, transform_bounds
+from rasterio.warp import calculate_default_transform, reproject
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
 from rasterio.enums import Resampling
 import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 import os
 
-# Set beginning year and state
-data_year = 2020
-state = "Florida"
+from rasterCoords import pixel_centers, warped_grid
+from cropPoints import CropLegend, crop_points_table, crop_points_path, open_crop_points_writer
+from zonalCounts import CountyZones, StationZones, ZonalAccumulator
+from countyBoundaries import load_counties
 
-# Set paths
-crs_raster_path = f"D:/Documents/GT/MGT 6203/Project/DataSets/{state}_Corn_Freq_2008_2023.tif"
-output_directory = f"D:/Documents/GT/MGT 6203/Project/DataSets/{state}CropData/"
+dst_crs = 'EPSG:4326'
 
-while data_year >= 2010:
 
-    # Set paths and CRS
-    crop_data = f"{data_year}.tif"
-    fileloc = f"D:/Documents/GT/MGT 6203/Project/DataSets/{state}_{crop_data}"
-    dst_crs = 'EPSG:4326'
+# Attach crop names and year to raw pixel points
+def label_points(dtPoints, crop_legend, data_year):
+    dfMerged = pd.merge(dtPoints, crop_legend.rename(columns={'Value': 'CropValue', 'Category': 'CropTypes'}), on='CropValue', how='left')
+    dfMerged['Year'] = data_year
 
-    # Open the reference raster to get its CRS
-    with rasterio.open(crs_raster_path) as ref_raster:
-        ref_crs = ref_raster.crs
+    # Drop the 'CropValue' column
+    dfMerged.drop(columns=['CropValue'], inplace=True)
+    return dfMerged
+
+
+# Reproject the whole raster into memory
+def reproject_raster(fileloc, ref_crs=None):
 
     # Load the source raster for reprojection
     with rasterio.open(fileloc) as src:
-        src_transform = src.transform
         src_crs = src.crs
 
         # Ensure the source raster has the same CRS as the reference raster before proceeding
-        if src_crs != ref_crs:
+        if ref_crs is not None and src_crs != ref_crs:
             print("CRS mismatch detected. Adjusting source CRS to match reference CRS for further operations...")
             # Note: Adjusting CRS in code without reprojecting can lead to incorrect spatial references.
             # The right approach is to reproject if the CRS doesn't match, as done below.
 
-        # Define the metadata for the reprojected raster
-        kwargs = src.meta.copy()
+        # Define the target grid of the reprojected raster
         transform_4326, width_4326, height_4326 = calculate_default_transform(
             src_crs, dst_crs, src.width, src.height, *src.bounds)
-        kwargs.update({
-            'crs': dst_crs,
-            'transform': transform_4326,
-            'width': width_4326,
-            'height': height_4326
-        })
 
         # Create an empty array for the reprojected data
         dst_array = np.empty((height_4326, width_4326), dtype=src.meta['dtype'])
@@ -72,25 +90,289 @@ while data_year >= 2010:
             resampling=Resampling.nearest
         )
 
+    return dst_array, transform_4326
+
+
+# Reproject the whole raster into memory and convert every non-zero pixel to a point
+def raster_to_points(fileloc, crop_legend, data_year, ref_crs=None):
+    dst_array, transform_4326 = reproject_raster(fileloc, ref_crs=ref_crs)
+
     # Process the reprojected data
     rows, cols = np.where(dst_array != 0)
-    xs, ys = rasterio.transform.xy(transform_4326, rows, cols, offset='center')
+    xs, ys = pixel_centers(transform_4326, rows, cols)
     values = dst_array[rows, cols]
 
     # Create a DataFrame
     dtPoints = pd.DataFrame({'Longitude': xs, 'Latitude': ys, 'CropValue': values})
+    return label_points(dtPoints, crop_legend, data_year)
 
-    # Load the crop legend and merge
-    crop_legend = pd.read_csv("D:/Documents/GT/MGT 6203/Project/DataSets/Legend.csv")
-    dfMerged = pd.merge(dtPoints, crop_legend.rename(columns={'Value': 'CropValue', 'Category': 'CropTypes'}), on='CropValue', how='left')
-    dfMerged['Year'] = data_year
 
-    # Drop the 'CropValue' column
-    dfMerged.drop(columns=['CropValue'], inplace=True)
+# Same as raster_to_points, written as one Parquet year partition under dataset_path
+def raster_to_parquet(fileloc, crop_legend, data_year, dataset_path, ref_crs=None):
+    dst_array, transform_4326 = reproject_raster(fileloc, ref_crs=ref_crs)
+
+    rows, cols = np.where(dst_array != 0)
+    xs, ys = pixel_centers(transform_4326, rows, cols)
+    table = crop_points_table(xs, ys, dst_array[rows, cols], CropLegend(crop_legend))
+
+    output_path = crop_points_path(dataset_path, data_year)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    pq.write_table(table, output_path, compression='zstd')
+    return table.num_rows
+
+
+# Warp the raster to EPSG:4326 and yield it as full-width strips of block_rows rows.
+# Yields (window, block, transform_4326); window locates the strip in the full grid.
+def warped_strips(fileloc, block_rows=512, ref_crs=None):
+    with rasterio.open(fileloc) as src:
+        if ref_crs is not None and src.crs != ref_crs:
+            print("CRS mismatch detected. Adjusting source CRS to match reference CRS for further operations...")
+
+        # Same target grid as the in-memory path
+        transform_4326, width_4326, height_4326 = calculate_default_transform(
+            src.crs, dst_crs, src.width, src.height, *src.bounds)
+
+        # GDAL's default approximate transformer (0.125 px error) resolves nearest
+        # neighbours differently per window, so warp strips with an exact transformer
+        with WarpedVRT(src, crs=dst_crs, transform=transform_4326,
+                       width=width_4326, height=height_4326,
+                       resampling=Resampling.nearest, tolerance=1e-6) as vrt:
+
+            # Full-width strips keep the output in the same row-major order as np.where
+            for row_off in range(0, height_4326, block_rows):
+                window = Window(0, row_off, width_4326, min(block_rows, height_4326 - row_off))
+                yield window, vrt.read(1, window=window), transform_4326
+
+
+# Warp the raster strip by strip and append each strip's points to output_path.
+# With output_format='parquet', output_path is the dataset folder and each strip becomes a row group.
+def stream_raster_to_points(fileloc, crop_legend, data_year, output_path, block_rows=512, ref_crs=None,
+                            output_format='csv'):
+    n_points = 0
+    header = True
+
+    if output_format == 'parquet':
+        legend = CropLegend(crop_legend)
+        writer = open_crop_points_writer(output_path, data_year)
+
+    for window, block, transform_4326 in warped_strips(fileloc, block_rows, ref_crs):
+        rows, cols = np.nonzero(block)
+        if rows.size == 0:
+            continue
+        # Offset into the full grid so coordinates match the in-memory path bit for bit
+        xs, ys = pixel_centers(transform_4326, rows + window.row_off, cols)
+
+        if output_format == 'parquet':
+            writer.write_table(crop_points_table(xs, ys, block[rows, cols], legend))
+            n_points += rows.size
+            continue
+
+        dtPoints = pd.DataFrame({'Longitude': xs, 'Latitude': ys, 'CropValue': block[rows, cols]})
+
+        dfMerged = label_points(dtPoints, crop_legend, data_year)
+        dfMerged.to_csv(output_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        n_points += len(dfMerged)
+
+    if output_format == 'parquet':
+        writer.close()
+
+    # Keep the output schema even when the raster has no crop pixels
+    elif header:
+        empty = pd.DataFrame({'Longitude': [], 'Latitude': [], 'CropValue': []})
+        label_points(empty, crop_legend, data_year).to_csv(output_path, index=False)
+
+    return n_points
+
+
+# Count crop pixels per zone (county / nearest station) while warping, without writing any points.
+# Returns {zone_set.name: grouped count table} for each ZoneSet in zone_sets.
+def stream_raster_to_counts(fileloc, crop_legend, data_year, zone_sets, block_rows=512, ref_crs=None):
+    with rasterio.open(fileloc) as src:
+        n_codes = max(int(crop_legend['Value'].max()), np.iinfo(src.dtypes[0]).max) + 1
+
+    transform_4326, width_4326, height_4326 = warped_grid(fileloc, dst_crs)
+    for zone_set in zone_sets:
+        zone_set.prepare(transform_4326, width_4326, height_4326)
+
+    accumulators = [ZonalAccumulator(zone_set, n_codes) for zone_set in zone_sets]
+    for window, block, transform_4326 in warped_strips(fileloc, block_rows, ref_crs):
+        if not block.any():
+            continue
+        for accumulator in accumulators:
+            accumulator.add(block, transform_4326, window)
+
+    return {acc.zone_set.name: acc.to_table(crop_legend, data_year) for acc in accumulators}
+
+
+# Per-process state filled in by init_worker, so each worker loads the legend once
+# and opens each state's reference raster once instead of once per year
+_worker = {}
+
+
+def init_worker(data_directory, legend_path, shapefile_path=None, grid_cache_dir='County_Grid_Cache'):
+    _worker['data_directory'] = data_directory
+    _worker['crop_legend'] = pd.read_csv(legend_path)
+    _worker['shapefile_path'] = shapefile_path
+    _worker['grid_cache_dir'] = grid_cache_dir
+    _worker['ref_crs'] = {}
+    _worker['zone_sets'] = {}
+
+
+def reference_crs(state):
+    if state not in _worker['ref_crs']:
+        crs_raster_path = os.path.join(_worker['data_directory'], f"{state}_Corn_Freq_2008_2023.tif")
+        with rasterio.open(crs_raster_path) as ref_raster:
+            _worker['ref_crs'][state] = ref_raster.crs
+    return _worker['ref_crs'][state]
+
+
+# County polygons and station KD-trees are built once per worker and state
+def zone_set(state, name):
+    key = (state, name)
+    if key not in _worker['zone_sets']:
+        if name == 'county':
+            # Only the state's counties (cached as GeoParquet), as cropCountyShaper.py loads them
+            counties = load_counties(_worker['shapefile_path'], state=state)
+            _worker['zone_sets'][key] = CountyZones(counties, shapefile_path=_worker['shapefile_path'],
+                                                    cache_dir=_worker['grid_cache_dir'])
+        else:
+            station_mapping = pd.read_csv(os.path.join(_worker['data_directory'], f"{state}_Station_Mapping.csv"))
+            _worker['zone_sets'][key] = StationZones(station_mapping)
+    return _worker['zone_sets'][key]
+
+
+# Write the per-county / per-station count tables for one state-year raster
+def aggregate_year(state, data_year, output_root, aggregate, block_rows=512):
+    start = time.perf_counter()
+
+    fileloc = os.path.join(_worker['data_directory'], f"{state}_{data_year}.tif")
+    output_directory = os.path.join(output_root, f"{state}CropData")
+    os.makedirs(output_directory, exist_ok=True)
+
+    tables = stream_raster_to_counts(fileloc, _worker['crop_legend'], data_year,
+                                     [zone_set(state, name) for name in aggregate],
+                                     block_rows=block_rows, ref_crs=reference_crs(state))
+
+    # Same file names as cropCountyShaper.py and cropStationMapper.py
+    suffixes = {'county': 'with_County_Grouped', 'station': 'GroupedByStation'}
+    n_pixels = 0
+    for name, table in tables.items():
+        table.to_csv(os.path.join(output_directory, f"{state}TopCropLonLat_{data_year}_{suffixes[name]}.csv"),
+                     index=False)
+        n_pixels = max(n_pixels, int(table['Count'].sum()))
+
+    return state, data_year, n_pixels, time.perf_counter() - start
+
+
+# Convert one state-year raster; runs inside a worker set up by init_worker
+def convert_year(state, data_year, output_root, streaming=True, block_rows=512, output_format='csv'):
+    start = time.perf_counter()
+
+    fileloc = os.path.join(_worker['data_directory'], f"{state}_{data_year}.tif")
+    output_directory = os.path.join(output_root, f"{state}CropData")
+    os.makedirs(output_directory, exist_ok=True)
+    if output_format == 'parquet':
+        output_path = os.path.join(output_directory, f"{state}TopCropLonLat")
+    else:
+        output_path = os.path.join(output_directory, f"{state}TopCropLonLat_{data_year}.csv")
+
+    if streaming:
+        n_points = stream_raster_to_points(fileloc, _worker['crop_legend'], data_year, output_path,
+                                           block_rows=block_rows, ref_crs=reference_crs(state),
+                                           output_format=output_format)
+    elif output_format == 'parquet':
+        n_points = raster_to_parquet(fileloc, _worker['crop_legend'], data_year, output_path,
+                                     ref_crs=reference_crs(state))
+    else:
+        dfMerged = raster_to_points(fileloc, _worker['crop_legend'], data_year, ref_crs=reference_crs(state))
+        dfMerged.to_csv(output_path, index=False)
+        n_points = len(dfMerged)
+
+    return state, data_year, n_points, time.perf_counter() - start
+
+
+# Parse "2010-2020" or "2012" into a list of years
+def parse_years(values):
+    years = []
+    for value in values:
+        if '-' in value:
+            first, last = (int(v) for v in value.split('-'))
+            years.extend(range(first, last + 1))
+        else:
+            years.append(int(value))
+    return sorted(set(years), reverse=True)
+
+
+# Fan (state, year) conversions out over a process pool; returns the results and the failed (state, year, error)
+def run_conversions(states, years, data_directory, output_root, legend_path,
+                    workers=None, streaming=True, block_rows=512, output_format='csv',
+                    aggregate=None, shapefile_path=None, grid_cache_dir='County_Grid_Cache'):
+    tasks = [(state, year) for state in states for year in years]
+
+    # Largest rasters first so a big California year does not start last and leave cores idle
+    def raster_size(task):
+        fileloc = os.path.join(data_directory, f"{task[0]}_{task[1]}.tif")
+        return os.path.getsize(fileloc) if os.path.exists(fileloc) else 0
+    tasks.sort(key=raster_size, reverse=True)
+
+    results = []
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(data_directory, legend_path, shapefile_path, grid_cache_dir)) as pool:
+        if aggregate:
+            futures = {pool.submit(aggregate_year, state, year, output_root, aggregate, block_rows): (state, year)
+                       for state, year in tasks}
+        else:
+            futures = {pool.submit(convert_year, state, year, output_root, streaming, block_rows, output_format): (state, year)
+                       for state, year in tasks}
+        for future in as_completed(futures):
+            state, year = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Failed {state} {year}: {e}")
+                failures.append((state, year, e))
+                continue
+            print(f"{state} {year}: {results[-1][2]:,d} {'pixels counted' if aggregate else 'points'} in {results[-1][3]:.1f} s")
+    return results, failures
+
+
+if __name__ == "__main__":
+
+    # Defaults reproduce the original single-state run
+    data_directory = "D:/Documents/GT/MGT 6203/Project/DataSets"
 
-    # Save to CSV
-    output_filename = f"{state}TopCropLonLat_{data_year}.csv"
-    dfMerged.to_csv(os.path.join(output_directory, output_filename), index=False)
+    parser = argparse.ArgumentParser(description="Convert CropScape state rasters to crop point CSVs.")
+    parser.add_argument('--states', nargs='+', default=["Florida"], help="States to convert")
+    parser.add_argument('--years', nargs='+', default=["2010-2020"], help="Years or ranges, e.g. 2010-2020 2022")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument('--data-dir', default=data_directory,
+                        help="Folder holding {state}_{year}.tif, {state}_Corn_Freq_2008_2023.tif, Legend.csv"
+                        " and {state}_Station_Mapping.csv")
+    parser.add_argument('--output-dir', help="Root for the {state}CropData folders (default: --data-dir)")
+    parser.add_argument('--legend', help="Crop legend CSV (default: Legend.csv in --data-dir)")
+    parser.add_argument('--block-rows', type=int, default=512, help="Rows per streamed strip")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help="CSV per year, or a Parquet dataset partitioned by year")
+    parser.add_argument('--aggregate', nargs='+', choices=['county', 'station'],
+                        help="Write grouped pixel counts per county and/or station instead of points")
+    parser.add_argument('--shapefile', default='Shapefiles/tl_2019_us_county.shp',
+                        help="County shapefile for --aggregate county")
+    parser.add_argument('--grid-cache', default='County_Grid_Cache',
+                        help="Folder caching the rasterized county-ID grids")
+    parser.add_argument('--in-memory', action='store_true', help="Reproject each raster whole instead of streaming")
+    args = parser.parse_args()
 
-    # Iterate
-    data_year -= 1
+    start = time.perf_counter()
+    results, failures = run_conversions(args.states, parse_years(args.years), args.data_dir,
+                                        args.output_dir or args.data_dir,
+                                        args.legend or os.path.join(args.data_dir, "Legend.csv"),
+                                        workers=args.workers, streaming=not args.in_memory,
+                                        block_rows=args.block_rows, output_format=args.format,
+                                        aggregate=args.aggregate, shapefile_path=args.shapefile,
+                                        grid_cache_dir=args.grid_cache)
+    print(f"Converted {len(results)} rasters in {time.perf_counter() - start:.1f} s")
+    if failures:
+        print(f"{len(failures)} failed: {', '.join(f'{state} {year}' for state, year, _ in failures)}")
+        sys.exit(1)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Daily and Normals Table Schemas \\\\\\\\\\
+
+Declared column types for the climate tables passed between stages:
+
+- {state}DailyRaw.csv (GSOD export columns)         (RAW_DAILY_SCHEMA)
+- {state}DailyReady.csv / {state}DailyCleaned.csv   (DAILY_SCHEMA)
+- {state}NormalsReady.csv                           (NORMALS_SCHEMA)
+- {state}_Station_Mapping.csv                       (STATION_MAPPING_SCHEMA)
+- Combined_Daily_Normals.csv                        (COMBINED_SCHEMA)
+- Imputed_Combined_Daily_Normals.csv                (IMPUTED_SCHEMA)
+
+Measurements are float32, FRSHTT flags nullable Int8, station / county / name columns
+category and dates datetime64. Coordinates stay float64 since they feed the
+nearest-station search. Station ids are read as strings, so ids with leading zeros
+survive the round trip. The same schemas type the Parquet stages of dataStore.py.
+
+read_table and write_table apply a schema on every read and write, so no stage
+re-infers types from text, and missing values are always written as NA.
+
+@author: dforc
+"""
+
+import pandas as pd
+
+
+DATETIME = 'datetime64[ns]'
+
+## Columns shared by several tables
+_STATION_COLUMNS = {
+    'STATION': 'category',
+    'StationName': 'category',
+    'COUNTY': 'category',
+    'STATE_CODE': 'category',
+    'Elevation': 'float32',
+    'ELEVATION': 'float32',
+    'Long': 'float64',
+    'Lat': 'float64',
+}
+
+## GSOD columns as exported by NOAA (dailyRawCombiner.py output)
+RAW_DAILY_SCHEMA = {
+    'STATION': 'category',
+    'DATE': DATETIME,
+    'LATITUDE': 'float64',
+    'LONGITUDE': 'float64',
+    'ELEVATION': 'float32',
+    'NAME': 'category',
+    **{column: 'float32' for column in ['TEMP', 'DEWP', 'SLP', 'STP', 'VISIB', 'WDSP',
+                                        'MXSPD', 'GUST', 'MAX', 'MIN', 'PRCP', 'SNDP']},
+    ## Observation counts behind each daily mean, and the MAX / MIN / PRCP source flags
+    **{f'{column}_ATTRIBUTES': 'Int16' for column in ['TEMP', 'DEWP', 'SLP', 'STP', 'VISIB', 'WDSP']},
+    **{f'{column}_ATTRIBUTES': 'category' for column in ['MAX', 'MIN', 'PRCP']},
+    'FRSHTT': 'Int32',
+}
+
+DAILY_SCHEMA = {
+    'Date': DATETIME,
+    'DewPoint': 'float32',
+    'WeatherType': 'Int32',
+    'WindGust': 'float32',
+    'MaxTemp': 'float32',
+    'MinTemp': 'float32',
+    'MaxWindSpeed': 'float32',
+    'Precipitation': 'float32',
+    'AvgTemp': 'float32',
+    'WindSpeed': 'float32',
+    'Fog': 'Int8',
+    'Rain_Drizzle': 'Int8',
+    'Snow_Ice': 'Int8',
+    'Hail': 'Int8',
+    'Thunder': 'Int8',
+    'Tornado_Funnel': 'Int8',
+    **_STATION_COLUMNS,
+}
+
+## Normals DATE is a month-day label ('01-31'), not a date
+NORMALS_SCHEMA = {
+    'DATE': 'category',
+    'normalAvgTemp': 'float32',
+    'normalAvgTempStd': 'float32',
+    'normalMaxTemp': 'float32',
+    'normalMaxTempStd': 'float32',
+    'normalMinTemp': 'float32',
+    'normalMinTempStd': 'float32',
+    'normalMtdPrcp': 'float32',
+    'normalMtdSnow': 'float32',
+    **_STATION_COLUMNS,
+}
+
+STATION_MAPPING_SCHEMA = {
+    'DailyStation': 'category',
+    'DailyLong': 'float64',
+    'DailyLat': 'float64',
+    'DailyCounty': 'category',
+    'DailyStationName': 'category',
+    'NormalStation': 'category',
+    'NormalLong': 'float64',
+    'NormalLat': 'float64',
+    'NormalCounty': 'category',
+}
+
+## climateTotalMerge.py output: daily + mapping + normals (overlapping names suffixed _norm)
+COMBINED_SCHEMA = {
+    **DAILY_SCHEMA,
+    **STATION_MAPPING_SCHEMA,
+    **NORMALS_SCHEMA,
+    **{f'{column}_norm': dtype for column, dtype in NORMALS_SCHEMA.items() if column in DAILY_SCHEMA},
+    'MonthDay': 'category',
+    'CompositeKey': 'category',
+}
+
+## combinedDiagnosticImpute.py output: combined columns + a bit per imputed column
+IMPUTED_SCHEMA = {
+    **COMBINED_SCHEMA,
+    'ImputedMask': 'uint8',
+}
+
+
+#######################################
+####### Enforce Schema
+#######################################
+def enforce_schema(df, schema):
+    """
+    Cast the columns of a DataFrame that appear in a schema to their declared types.
+
+    Parameters:
+    - df: DataFrame to cast (columns not in the schema are left unchanged).
+    - schema: Dictionary of column name -> dtype.
+
+    Returns:
+    - DataFrame with the declared types.
+    """
+    casts = {}
+    for column, dtype in schema.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if dtype == DATETIME:
+            casts[column] = pd.to_datetime(df[column]).astype(DATETIME)
+        elif dtype == 'category' and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            ## Categories are strings, whatever the column was parsed as
+            casts[column] = df[column].astype('string').astype(object).astype('category')
+        else:
+            casts[column] = df[column].astype(dtype)
+    return df.assign(**casts) if casts else df
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Read / Write Tables
+#######################################
+def _csv_types(path, schema, usecols=None):
+    ## dtype and parse_dates arguments of read_csv for the schema columns in a CSV's header
+    header = pd.read_csv(path, nrows=0).columns
+    if usecols is not None:
+        header = [c for c in header if c in usecols]
+    dtypes = {c: t for c, t in schema.items() if c in header and t != DATETIME}
+    dates = [c for c in header if schema.get(c) == DATETIME]
+    return dtypes, dates
+
+
+def read_table(path, schema, **kwargs):
+    """
+    Read a climate CSV with its declared column types.
+
+    Parameters:
+    - path: String, CSV file to read.
+    - schema: Dictionary of column name -> dtype (e.g. DAILY_SCHEMA).
+    - kwargs: Passed on to pandas.read_csv (e.g. usecols).
+
+    Returns:
+    - DataFrame with the schema's types for every schema column present in the file.
+    """
+    dtypes, dates = _csv_types(path, schema, kwargs.get('usecols'))
+    df = pd.read_csv(path, dtype=dtypes, parse_dates=dates, **kwargs)
+    return enforce_schema(df, schema)
+
+
+def iter_table(path, schema, chunksize, **kwargs):
+    """
+    Read a climate CSV in chunks of rows, each with its declared column types.
+
+    Parameters:
+    - path: String, CSV file to read.
+    - schema: Dictionary of column name -> dtype.
+    - chunksize: Integer, rows per chunk.
+    - kwargs: Passed on to pandas.read_csv.
+
+    Yields:
+    - DataFrame chunks with the schema's types.
+    """
+    dtypes, dates = _csv_types(path, schema, kwargs.get('usecols'))
+    with pd.read_csv(path, dtype=dtypes, parse_dates=dates, chunksize=chunksize, **kwargs) as reader:
+        for chunk in reader:
+            yield enforce_schema(chunk, schema)
+
+
+def write_table(df, path, schema, mode='w'):
+    """
+    Write a climate table as CSV after casting it to its declared types; missing values as NA.
+
+    Parameters:
+    - df: DataFrame to write.
+    - path: String, output CSV path.
+    - schema: Dictionary of column name -> dtype.
+    - mode: 'w' to write a new file with a header, 'a' to append rows to an existing one.
+    """
+    enforce_schema(df, schema).to_csv(path, index=False, na_rep='NA', date_format='%Y-%m-%d',
+                                      mode=mode, header=(mode == 'w'))
+######################## End Function ########################
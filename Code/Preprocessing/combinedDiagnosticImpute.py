@@ -3,148 +3,200 @@
 ////////// Weather Data Imputation and Visualization \\\\\\\\\
 
 This script manages the cleaning and imputation of missing weather data for multiple stations
-from the dataset (./Data/Combined_Daily_Normals.csv).
+from the Combined_Daily_Normals Parquet stage (./Data/Main_Data/Combined_Daily_Normals, see dataStore.py).
 
 Key tasks:
-- Visualizes missing data patterns using matrix and heatmap plots.
-- Implements rolling mean imputation for temperature, wind speed, and other variables.
-- Generates comprehensive visual comparisons of data distributions before and after imputation.
-- Saves the cleaned and imputed dataset.
+- Visualizes missing data patterns using matrix and heatmap plots (with --plots, or written
+  to PNG files headless with --plot-dir; imputeDiagnostics.py).
+- Implements rolling mean imputation for temperature, wind speed, and other variables,
+  over each station's calendar days (missing days included), for all columns in one
+  pass per table and stations spread over --workers processes (rollingImpute.py).
+- Other strategies can be chosen per column with --strategy COLUMN=NAME: linear,
+  seasonal_normal, neighbor or idw (imputeStrategies.py).
+- Records which values were imputed in a one byte ImputedMask column (bit i for the
+  i-th imputed column, see was_imputed).
+- Generates comprehensive visual comparisons of data distributions before and after imputation (with --plots).
+- Saves the cleaned and imputed dataset to its Parquet stage, and exports it to CSV for the R notebooks.
+
+drop_extra_columns(df), impute(df) and was_imputed(df, column) do the cleaning and imputation and can be imported;
+running the script (python combinedDiagnosticImpute.py [--state California]) reads and
+writes the stages; --plots also shows the diagnostic plots and --plot-dir saves them.
+--csv '' skips the CSV export, and --export-states California,Florida only exports
+those states' imputed stage to one CSV (pipeline.py runs it once all states are imputed).
 """
 
 
+import argparse
 import os
-import pandas as pd
-import missingno as msno
-import matplotlib.pyplot as plt
-import seaborn as sns
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'Preprocessing'))
+from climateSchema import COMBINED_SCHEMA, IMPUTED_SCHEMA
+from dataStore import export_stage_csv, read_stage, write_stage
+from imputeStrategies import impute_strategies
 
 
 # =============================================================================
 # Set paths to the datasets
 # =============================================================================
-
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-data_path = os.path.join(base_dir, "Data",
-                         "Main_Data", "Combined_Daily_Normals.csv")
-
-output_path = os.path.join(base_dir, "Data",
-                           "Main_Data", "Imputed_Combined_Daily_Normals.csv")
-
-## Load Data
-df = pd.read_csv(data_path)
+state = "California"
+export_csv = True   ## The R notebooks read Imputed_Combined_Daily_Normals.csv
+plots = False       ## Show the diagnostic plots (needs matplotlib)
+plot_dir = None     ## Or save them to this folder as PNG files, without a display
+workers = os.cpu_count() or 1   ## Processes the stations are imputed in
+strategies = {}     ## Column -> imputation strategy (imputeStrategies.py), others use rolling_mean
 
-# =============================================================================
-# View Missing Data
-# =============================================================================
-## Matrix plot to visualize missing data
-msno.matrix(df)
+data_stage = os.path.join(base_dir, "Data",
+                          "Main_Data", "Combined_Daily_Normals")
 
-## Heatmap to show correlations of missingness between columns
-msno.heatmap(df)
+output_stage = os.path.join(base_dir, "Data",
+                            "Main_Data", "Imputed_Combined_Daily_Normals")
 
+output_path = os.path.join(base_dir, "Data",
+                           "Main_Data", "Imputed_Combined_Daily_Normals.csv") if export_csv else None
 
-# =============================================================================
-# Check Stations Individually
-# =============================================================================
 
-# Get a list of unique stations
-unique_stations = df['DailyStationName'].unique()
-
-# Loop through each station and generate a matrix plot with a title
-for station in unique_stations[:10]:  # Limit to first 10 for demonstration
-    station_data = df[df['DailyStationName'] == station]
-    plt.figure(figsize=(12, 6))
-    msno.matrix(station_data)
-    plt.title(f'Missing Data Matrix for {station}')  # Setting the title using matplotlib
-    plt.show()  # This line ensures that the plot shows up in most environments
-    
 # =============================================================================
 # Drop Extra Columns
 # =============================================================================   
-    
 columns_to_drop = ['STATION', 'StationName', 'Long',
                    'Lat', 'COUNTY', 'STATION_norm', 
                    'Long_norm', 'Lat_norm', 'COUNTY_norm',
                    'DATE', 'WindGust']
 
-df = df.drop(columns=columns_to_drop)
-
-## View Missing Matrix after Cols Removed
-msno.matrix(df)
+def drop_extra_columns(df):
+    '''
+    Drops the duplicated station / normals columns and WindGust from the combined data.
+    '''
+    return df.drop(columns=columns_to_drop)
 
 
 # =============================================================================
 # Impute Missing Values
 # ============================================================================= 
 ## Implement a 6 Day Rolling Average Imputation
+columns_to_impute = ['MaxTemp', 'MinTemp', 'MaxWindSpeed', 
+                     'WindSpeed', 'Precipitation', 'DewPoint']
 
-## Sort data by Station and Date
-df = df.sort_values(by=['DailyStation', 'Date'])
+def impute(df, columns=columns_to_impute, window=6, workers=1, strategies=None):
+    '''
+    Fills missing values with each station's centred 6 day rolling mean, or another
+    strategy chosen per column (imputeStrategies.py).
 
-## Function for Rolling Average
-def rolling_mean_impute(series):
-    return series.fillna(series.rolling(window=6, min_periods=1, center=True).mean())
+    The window spans calendar days, not rows: a station missing days has fewer values
+    in its window rather than a window reaching further out (rollingImpute.py). The
+    columns of each strategy are imputed in one pass over a single array; windows never
+    cross stations.
 
-## Apply imputation and mark the imputations
-columns_to_impute = ['MaxTemp', 'MinTemp', 'MaxWindSpeed', 
-                     'WindSpeed', 'Precipitation', 'DewPoint']
+    Parameters:
+    - df: DataFrame with DailyStation, Date and the columns to impute.
+    - columns: List of strings, columns to impute (at most 8).
+    - window: Integer, rolling window length in days.
+    - workers: Integer, processes to spread the stations over.
+    - strategies: Dictionary of column -> strategy name (rolling_mean, linear,
+      seasonal_normal, neighbor, idw); columns not in it use rolling_mean.
 
-## Impute All Columns
-for column in columns_to_impute:
-    df[f'{column}_imputed'] = df.groupby('DailyStation')[column].transform(rolling_mean_impute)
+    Returns:
+    - New DataFrame sorted by DailyStation and Date, with the columns imputed (values
+      that were present are unchanged) and an ImputedMask column.
+    '''
+    if len(columns) > 8:
+        raise ValueError(f'ImputedMask holds 8 columns, got {len(columns)}')
 
+    ## Sort data by Station and Date
+    df = df.sort_values(by=['DailyStation', 'Date'])
 
+    ## Strategy of each column, each run once over all of its columns
+    chosen = {column: (strategies or {}).get(column, 'rolling_mean') for column in columns}
+    values, imputed = impute_strategies(df, chosen, window=window, workers=workers)
 
-# =============================================================================
-# Visual Imputation Analysis
-# ============================================================================= 
-## Create plots for the entire dataset to compare original and imputed data
-fig, axes = plt.subplots(len(columns_to_impute), 4, figsize=(20, len(columns_to_impute) * 5))
-
-for i, column in enumerate(columns_to_impute):
-    ## Before Imputation Line Plot
-    axes[i, 0].plot(df['Date'], df[column], label='Original', alpha=0.7, marker='o', linestyle='-')
-    axes[i, 0].set_title(f'Original {column}')
-    axes[i, 0].set_ylabel(column)
-    
-    ## After Imputation Line Plot
-    axes[i, 1].plot(df['Date'], df[f'{column}_imputed'], label='Imputed', color='orange', marker='o', linestyle='-')
-    imputed_points = df['Date'][df[column].isna()]
-    imputed_values = df[f'{column}_imputed'][df[column].isna()]
-    axes[i, 1].scatter(imputed_points, imputed_values, color='red', label='Imputed Values', zorder=5)
-    axes[i, 1].set_title(f'Imputed {column}')
-    
-    ## Before Imputation Histogram and Boxplot
-    sns.histplot(df[column].dropna(), kde=True, ax=axes[i, 2])
-    sns.boxplot(x=df[column], ax=axes[i, 3])
-    axes[i, 2].set_title(f'Before Imputation Histogram: {column}')
-    axes[i, 3].set_title(f'Before Imputation Boxplot: {column}')
-    
-    ## After Imputation Histogram and Boxplot
-    sns.histplot(df[f'{column}_imputed'], kde=True, ax=axes[i, 2], color="orange")
-    sns.boxplot(x=df[f'{column}_imputed'], ax=axes[i, 3], color="orange")
-    axes[i, 2].set_title(f'After Imputation Histogram: {column}')
-    axes[i, 3].set_title(f'After Imputation Boxplot: {column}')
-
-axes[0, 0].legend()
-axes[0, 1].legend()
-
-plt.tight_layout()
-plt.show()
-
-
-## Check Post Imputation Missing Matrix
-msno.matrix(df)
+    ## Impute All Columns, keeping their types
+    for i, column in enumerate(columns):
+        df[column] = imputed[:, i].astype(df[column].dtype)
 
+    ## Bit i is set where columns[i] was missing and has been imputed
+    filled = np.isnan(values) & ~np.isnan(imputed)
+    df['ImputedMask'] = (filled.astype(np.uint8) << np.arange(len(columns), dtype=np.uint8)).sum(axis=1, dtype=np.uint8)
+    return df
+
+
+def was_imputed(df, column, columns=columns_to_impute):
+    '''
+    Boolean Series, True where impute() filled a value of column (read from ImputedMask).
+    '''
+    return (df['ImputedMask'] & (1 << columns.index(column))) != 0
 
-# =============================================================================
-# Add Imputed Values to NAs and Drop _isImputed Columns
-# ============================================================================= 
-for column in columns_to_impute:
-    df[column] = df[f'{column}_imputed']
-    df.drop(columns=f'{column}_imputed', inplace=True)  ## Removes is_imputed Cols
 
-## Write to CSV
-df.to_csv(output_path, index=False)
+# =============================================================================
+# Run Program
+# =============================================================================
+def main(state, data_stage=data_stage, output_stage=output_stage, output_path=output_path, plots=False,
+         workers=1, strategies=None, plot_dir=None):
+    '''
+    Imputes one state's Combined_Daily_Normals stage into the Imputed_Combined_Daily_Normals stage.
+    '''
+    ## Load Data with the declared column types (float32 measurements, category stations)
+    df = read_stage(data_stage, COMBINED_SCHEMA, state=state)
+
+    ## The plotting libraries are only imported for --plots / --plot-dir
+    plots = plots or plot_dir is not None
+    if plots:
+        if plot_dir is not None:
+            import matplotlib
+            matplotlib.use('Agg')   ## Render to files, no display needed
+        from imputeDiagnostics import plot_missing, plot_station_missing, plot_missing_matrix, plot_imputation
+
+        ## View Missing Data, overall and for stations individually
+        plot_missing(df, plot_dir)
+        plot_station_missing(df, plot_dir)
+
+    df = drop_extra_columns(df).sort_values(by=['DailyStation', 'Date'])
+    imputed = impute(df, workers=workers, strategies=strategies)
+
+    if plots:
+        ## View Missing Matrix after Cols Removed, Visual Imputation Analysis
+        ## and Post Imputation Missing Matrix
+        plot_missing_matrix(df, plot_dir, 'missing_matrix')
+        plot_imputation(df, imputed, columns_to_impute, plot_dir)
+        plot_missing_matrix(imputed, plot_dir, 'missing_matrix_imputed')
+
+    ## Write to the stage (and the CSV export)
+    write_stage(imputed, output_stage, state, IMPUTED_SCHEMA, csv_path=output_path)
+
+
+def export_states(states, output_stage=output_stage, output_path=output_path):
+    '''
+    Exports the imputed stage of several states to one CSV, one state after another.
+    '''
+    rows = 0
+    for state in states:
+        rows += export_stage_csv(output_stage, state, IMPUTED_SCHEMA, output_path, mode='w' if rows == 0 else 'a')
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Impute missing values of a state's combined daily and normals data.")
+    parser.add_argument('--state', default=state, help="State to impute")
+    parser.add_argument('--input-stage', default=data_stage, help="Combined_Daily_Normals stage directory")
+    parser.add_argument('--stage', default=output_stage, help="Imputed_Combined_Daily_Normals stage directory")
+    parser.add_argument('--csv', default=output_path, help="CSV export path (read by the R notebooks)")
+    parser.add_argument('--plots', action='store_true', default=plots,
+                        help="Show the missing data and imputation plots (imputeDiagnostics.py)")
+    parser.add_argument('--plot-dir', default=plot_dir,
+                        help="Save the plots to this folder as PNG files instead, without a display")
+    parser.add_argument('--workers', type=int, default=workers, help="Processes to impute the stations in")
+    parser.add_argument('--strategy', action='append', default=[], metavar='COLUMN=NAME',
+                        help="Imputation strategy of a column: rolling_mean, linear, seasonal_normal, neighbor or idw")
+    parser.add_argument('--export-states', metavar='STATE,STATE',
+                        help="Only export these states' imputed stage to the CSV (comma separated)")
+    args = parser.parse_args()
+    strategies = {**strategies, **dict(choice.split('=', 1) for choice in args.strategy)}
+
+    if args.export_states:
+        export_states(args.export_states.split(','), args.stage, args.csv)
+    else:
+        main(args.state, args.input_stage, args.stage, args.csv or None, args.plots, args.workers, strategies,
+             args.plot_dir)
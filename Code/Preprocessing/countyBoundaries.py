@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+////////// County Boundary Loader \\\\\\\\\\
+
+Shared loader for the national county shapefile (tl_2019_us_county.shp).
+
+dailyClimateShaper.py, normalsCountyConverter.py and cropCountyShaper.py only ever join
+against the counties of one state, but used to read all 3,000+ polygons. load_counties
+restricts the read to what is needed:
+
+- statefp: only that state's counties (attribute filter pushed down to the reader)
+- bbox: only counties intersecting a bounding box, e.g. of the stations being joined
+
+With pyogrio installed the filters are pushed down to GDAL (where=/bbox=), otherwise the
+shapefile is read through geopandas' default engine and filtered afterwards. State reads
+are memoized as a small per-state GeoParquet keyed on the shapefile's contents.
+
+join_station_counties assigns stations to the loaded counties (spatial join), and
+attach_station_counties adds the result to a table of station rows.
+
+@author: dforc
+"""
+
+import hashlib
+import os
+
+import geopandas as gpd
+import pandas as pd
+
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+
+COUNTY_COLUMNS = ['STATEFP', 'COUNTYFP', 'GEOID', 'NAME', 'ALAND', 'AWATER']
+
+## State FIPS codes of the states this project processes
+STATE_FIPS = {'California': '06', 'Florida': '12'}
+
+## Shapefile digests already computed in this process, keyed on (path, size, mtime)
+_digests = {}
+
+
+#######################################
+####### Shapefile Digest
+#######################################
+def shapefile_digest(shapefile_path):
+    """
+    SHA-1 of a shapefile's .shp, .shx, .dbf and .prj contents (whichever exist).
+    """
+    base, _ = os.path.splitext(shapefile_path)
+    parts = [base + ext for ext in ('.shp', '.shx', '.dbf', '.prj') if os.path.exists(base + ext)]
+    stamp = tuple((p, os.path.getsize(p), os.path.getmtime(p)) for p in parts)
+
+    if stamp not in _digests:
+        sha = hashlib.sha1()
+        for part in parts:
+            with open(part, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(chunk)
+        _digests[stamp] = sha.hexdigest()
+    return _digests[stamp]
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Load Counties
+#######################################
+def points_bbox(longitudes, latitudes, pad=0.01):
+    """
+    Bounding box (minx, miny, maxx, maxy) of a set of points, padded by pad degrees.
+    """
+    return (float(longitudes.min()) - pad, float(latitudes.min()) - pad,
+            float(longitudes.max()) + pad, float(latitudes.max()) + pad)
+
+
+def read_counties(shapefile_path, statefp=None, bbox=None, columns=COUNTY_COLUMNS):
+    """
+    Read county polygons, pushing the state and bbox filters down to the reader when possible.
+
+    Parameters:
+    - shapefile_path: String, path to the county shapefile.
+    - statefp: String, two digit state FIPS code to keep, or None.
+    - bbox: Tuple (minx, miny, maxx, maxy) in the shapefile's CRS, or None.
+    - columns: List of strings, attribute columns to keep.
+
+    Returns:
+    - Geopandas GeoDataFrame with geometry and the requested columns.
+    """
+    if pyogrio is not None:
+        where = f"STATEFP = '{statefp}'" if statefp is not None else None
+        counties = pyogrio.read_dataframe(shapefile_path, columns=columns, where=where, bbox=bbox)
+    else:
+        counties = gpd.read_file(shapefile_path, bbox=bbox)
+        if statefp is not None:
+            counties = counties[counties['STATEFP'] == statefp]
+    return counties[['geometry'] + list(columns)].reset_index(drop=True)
+
+
+def load_counties(shapefile_path, state=None, statefp=None, bbox=None,
+                  columns=COUNTY_COLUMNS, cache_dir='County_Shape_Cache'):
+    """
+    Load the counties of one state and/or bounding box from the national shapefile.
+
+    State reads (without bbox) are cached as {cache_dir}/counties_{STATEFP}_{digest}.parquet
+    and reused while the shapefile is unchanged.
+
+    Parameters:
+    - shapefile_path: String, path to the county shapefile.
+    - state: String, state name in STATE_FIPS (alternative to statefp).
+    - statefp: String, two digit state FIPS code.
+    - bbox: Tuple (minx, miny, maxx, maxy), e.g. from points_bbox.
+    - columns: List of strings, attribute columns to keep.
+    - cache_dir: String, folder of the per-state GeoParquet files; None disables caching.
+
+    Returns:
+    - Geopandas GeoDataFrame with geometry and the requested columns.
+    """
+    if state is not None:
+        statefp = STATE_FIPS[state]
+
+    if statefp is None or bbox is not None or cache_dir is None:
+        return read_counties(shapefile_path, statefp=statefp, bbox=bbox, columns=columns)
+
+    cache_path = os.path.join(cache_dir, f'counties_{statefp}_{shapefile_digest(shapefile_path)[:12]}.parquet')
+    if os.path.exists(cache_path):
+        counties = gpd.read_parquet(cache_path)
+        if set(columns) <= set(counties.columns):
+            return counties[['geometry'] + list(columns)]
+
+    counties = read_counties(shapefile_path, statefp=statefp,
+                             columns=list(dict.fromkeys(COUNTY_COLUMNS + list(columns))))
+    os.makedirs(cache_dir, exist_ok=True)
+    ## Written under a temporary name, so a process reading it never sees a partial file
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    counties.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    return counties[['geometry'] + list(columns)]
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Counties Covering Points
+#######################################
+def load_counties_for_points(shapefile_path, state, longitudes, latitudes,
+                             columns=COUNTY_COLUMNS, cache_dir='County_Shape_Cache'):
+    """
+    Load a state's counties (cached), widened with a bbox read for any point outside them.
+
+    Joining against the result gives the same counties as joining against the whole
+    national shapefile, e.g. for a station sitting just across a state line.
+
+    Parameters:
+    - shapefile_path: String, path to the county shapefile.
+    - state: String, state name in STATE_FIPS.
+    - longitudes, latitudes: pandas Series of point coordinates (EPSG:4326).
+    - columns: List of strings, attribute columns to keep.
+    - cache_dir: String, folder of the per-state GeoParquet files.
+
+    Returns:
+    - Geopandas GeoDataFrame with geometry and the requested columns.
+    """
+    counties = load_counties(shapefile_path, state=state, columns=columns, cache_dir=cache_dir)
+
+    points = gpd.GeoSeries(gpd.points_from_xy(longitudes, latitudes), crs='EPSG:4326').to_crs(counties.crs)
+    covered = counties.sindex.query(points.values, predicate='intersects')[0]
+    outside = ~points.index.isin(points.index[covered]) & ~points.is_empty & points.notna()
+
+    if outside.any():
+        extra = read_counties(shapefile_path, bbox=tuple(points[outside].total_bounds), columns=columns)
+        extra = extra.to_crs(counties.crs)
+        counties = gpd.GeoDataFrame(
+            pd.concat([counties, extra[~extra['GEOID'].isin(counties['GEOID'])]], ignore_index=True),
+            crs=counties.crs)
+    return counties
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Stations to Counties
+#######################################
+def join_station_counties(stations, counties):
+    """
+    Assign each station to the county containing it.
+
+    Parameters:
+    - stations: DataFrame with STATION, Lat and Long columns (one row per station).
+    - counties: Geopandas GeoDataFrame from load_counties / load_counties_for_points.
+
+    Returns:
+    - DataFrame with STATION, COUNTY, STATE_CODE, Lat and Long (COUNTY missing outside every county).
+    """
+    counties = counties[['geometry', 'STATEFP', 'NAME']].rename(columns={'NAME': 'COUNTY', 'STATEFP': 'STATE_CODE'})
+    stations_sf = gpd.GeoDataFrame(stations[['STATION', 'Lat', 'Long']],
+                                   geometry=gpd.points_from_xy(stations['Long'], stations['Lat']),
+                                   crs='EPSG:4326')
+    stations_with_county = gpd.sjoin(stations_sf, counties.to_crs(stations_sf.crs), how='left')
+    return pd.DataFrame(stations_with_county[['STATION', 'COUNTY', 'STATE_CODE', 'Lat', 'Long']])
+
+
+def attach_station_counties(df, stations_with_county):
+    """
+    Add the COUNTY and STATE_CODE of each row's station (join_station_counties) to a table,
+    keeping the table's own Lat and Long.
+    """
+    merged = pd.merge(df, stations_with_county, on='STATION', suffixes=('_x', '_y'))
+    merged = merged.drop(columns=['Lat_y', 'Long_y'])
+    return merged.rename(columns={'Lat_x': 'Lat', 'Long_x': 'Long'})
+######################## End Function ########################
@@ -14,31 +14,22 @@ It completes the following tasks:
 - Concatenates all the data files into a single DataFrame for further analysis.
 - Saves the aggregated DataFrame to a CSV file named Crop_Report_2010_2020.csv
 
+combine_crop_reports(data_dir) and filter_crops(df) can be imported; running the script
+(python countyCropRecordCombine.py [--data-dir ...]) writes both CSV files as before.
+
 - @Daniel
 """
 
+import argparse
 import os
 import re
 import pandas as pd
 
-# =============================================================================
-## Set Working Directory From Absolute Path
-# =============================================================================
-absPath = os.path.abspath(__file__)          ## Absolute Path
-dirPath = os.path.dirname(absPath)           ## Directory Path
-os.chdir(dirPath)                            ## Set Directory
-
 # =============================================================================
 ## Define Paths
 # =============================================================================
-base_dir = os.path.dirname(os.path.dirname(os.getcwd()))  ## Move up two levels to WeatherProject
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  ## Move up two levels to WeatherProject
 data_dir = os.path.join(base_dir, 'Data', 'Crop_Production_Data')
-output_file = os.path.join(data_dir, 'Crop_Report_2010_2020.csv')
-
-# =============================================================================
-## Initialize an Empty DataFrame to Store Aggregated Data
-# =============================================================================
-aggregated_data = pd.DataFrame()
 
 # =============================================================================
 ## Function to Standardize Column Names
@@ -80,60 +71,75 @@ def standardize_columns(df):
 # =============================================================================
 ## Read and Concatenate Crop Report Data Files
 # =============================================================================
-for year in range(2010, 2021):
-    file_path = os.path.join(data_dir, f'Crop_Report_{year}.csv')
-    if os.path.exists(file_path):
-        yearly_data = pd.read_csv(file_path)
-        yearly_data = standardize_columns(yearly_data)
-        ## Check Column Names are Consistent
-        print(f"Column names for {year}: {list(yearly_data.columns)}")
-        aggregated_data = pd.concat([aggregated_data, yearly_data], ignore_index=True)
-    else:
-        print(f"File not found: {file_path}")
-        
-        
-# =============================================================================
-## County Names Cleaning
-# =============================================================================
-
-## Change "San Luis Obisp" to "San Luis Obispo
-aggregated_data['County'] = aggregated_data['County'].replace(to_replace=r'^San Luis Obis[p|bo]?.*$',
-                                                              value='San Luis Obispo', regex=True)
-
-## Change 'State Totals' to 'State Total'
-aggregated_data['County'] = aggregated_data['County'].str.strip().replace(to_replace=r'^State Totals$', 
-                                                                         value='State Total', regex=True)
+def combine_crop_reports(data_dir, years=range(2010, 2021)):
+    """
+    Read, standardize and concatenate the yearly Crop_Report_{year}.csv files,
+    with the county names cleaned.
+    """
+    aggregated_data = pd.DataFrame()
+    for year in years:
+        file_path = os.path.join(data_dir, f'Crop_Report_{year}.csv')
+        if os.path.exists(file_path):
+            yearly_data = pd.read_csv(file_path)
+            yearly_data = standardize_columns(yearly_data)
+            ## Check Column Names are Consistent
+            print(f"Column names for {year}: {list(yearly_data.columns)}")
+            aggregated_data = pd.concat([aggregated_data, yearly_data], ignore_index=True)
+        else:
+            print(f"File not found: {file_path}")
+
+    ## County Names Cleaning
+    ## Change "San Luis Obisp" to "San Luis Obispo
+    aggregated_data['County'] = aggregated_data['County'].replace(to_replace=r'^San Luis Obis[p|bo]?.*$',
+                                                                  value='San Luis Obispo', regex=True)
+
+    ## Change 'State Totals' to 'State Total'
+    aggregated_data['County'] = aggregated_data['County'].str.strip().replace(to_replace=r'^State Totals$', 
+                                                                             value='State Total', regex=True)
+    return aggregated_data
 
 
 # =============================================================================
-## Save the Aggregated Data to a CSV File
+## Filter Crops of Interest
 # =============================================================================
-aggregated_data.to_csv(output_file, index=False)
-print(f"Aggregated data saved to {output_file}")
-
-
-
 crops = ["HAY", "RICE", "TOMATO", 
          "GRAPE", "ALMOND", "WALNUT",
          "PISTACH", "ORANGE", "STRAWB", 
          "LETTUCE"]
 
+def filter_crops(aggregated_data, crops=crops):
+    """
+    Rows whose Crop_Name contains any of the crops (case insensitive).
+    """
+    # Joining the list into a regex pattern that matches any of the crops
+    regex_pattern = '|'.join(crops)
+    return aggregated_data[aggregated_data['Crop_Name'].str.contains(regex_pattern, case=False, na=False)]
 
-# Joining the list into a regex pattern that matches any of the crops
-regex_pattern = '|'.join(crops)
 
+# =============================================================================
+## Save the Aggregated and Filtered Data to CSV Files
+# =============================================================================
+def main(data_dir=data_dir):
+    aggregated_data = combine_crop_reports(data_dir)
 
+    output_file = os.path.join(data_dir, 'Crop_Report_2010_2020.csv')
+    aggregated_data.to_csv(output_file, index=False)
+    print(f"Aggregated data saved to {output_file}")
 
+    filtered_data = filter_crops(aggregated_data)
 
-# Filter the DataFrame for rows where the Crop_Name contains any of the specified crops
-filtered_data = aggregated_data[aggregated_data['Crop_Name'].str.contains(regex_pattern, case=False, na=False)]
+    # Display or process your filtered data
+    print(filtered_data)
 
-# Display or process your filtered data
-print(filtered_data)
+    # Optionally, save the filtered data to a new CSV file
+    filtered_output_file = os.path.join(data_dir, 'Filtered_Crop_Report_2010_2020.csv')
+    filtered_data.to_csv(filtered_output_file, index=False)
+    print(f"Filtered data saved to {filtered_output_file}")
 
-# Optionally, save the filtered data to a new CSV file
-filtered_output_file = os.path.join(data_dir, 'Filtered_Crop_Report_2010_2020.csv')
-filtered_data.to_csv(filtered_output_file, index=False)
-print(f"Filtered data saved to {filtered_output_file}")
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Combine the yearly crop reports into Crop_Report_2010_2020.csv.")
+    parser.add_argument('--data-dir', default=data_dir, help="Folder of the Crop_Report_{year}.csv files")
+    args = parser.parse_args()
 
+    main(args.data_dir)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Cached County-ID Grid \\\\\\\\\\
+
+County geometry never changes between crop years, so instead of spatially joining
+every year's points against the county shapefile, the counties are rasterized once
+onto the EPSG:4326 grid TIFtoCSV.py warps CropScape rasters to. Each year's points
+(or raster strips) then get their county with a single array lookup.
+
+- The grid stores county number + 1 per pixel (0 = no county) as a .npy file that is
+  memory-mapped on load, next to a CSV with the county attributes per number.
+- The cache key hashes the shapefile's contents, the county list and the grid
+  transform/shape, so the grid rebuilds automatically when either input changes.
+
+Used by cropCountyShaper.py and TIFtoCSV.py --aggregate county.
+
+@author: dforc
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+from rasterio.features import rasterize
+from rasterio.windows import Window, bounds as window_bounds, transform as window_transform
+
+from countyBoundaries import shapefile_digest
+
+
+COUNTY_ATTRIBUTES = ['STATEFP', 'COUNTYFP', 'GEOID', 'NAME', 'ALAND', 'AWATER']
+
+
+#######################################
+####### Cache Keys
+#######################################
+def county_grid_key(shapefile_path, geoids, transform, width, height):
+    """
+    Cache key for one county set rasterized onto one grid.
+
+    Parameters:
+    - shapefile_path: String, county shapefile the polygons came from.
+    - geoids: Sequence of county GEOIDs in zone order.
+    - transform, width, height: Target grid.
+
+    Returns:
+    - 16 hex character key.
+    """
+    sha = hashlib.sha1(shapefile_digest(shapefile_path).encode())
+    sha.update('|'.join(map(str, geoids)).encode())
+    sha.update(repr((tuple(transform)[:6], width, height)).encode())
+    return sha.hexdigest()[:16]
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Build / Load Grid
+#######################################
+def rasterize_counties(counties, transform, width, height, output_path, block_rows=512):
+    """
+    Rasterize county polygons onto a grid, strip by strip, into a .npy file.
+
+    Parameters:
+    - counties: GeoDataFrame of county polygons in EPSG:4326 (zone = row number + 1).
+    - transform, width, height: Target grid.
+    - output_path: String, .npy file to write.
+    - block_rows: Integer, rows rasterized at a time.
+    """
+    dtype = np.uint16 if len(counties) < np.iinfo(np.uint16).max else np.int32
+    grid = np.lib.format.open_memmap(output_path, mode='w+', dtype=dtype, shape=(height, width))
+
+    geometries = np.asarray(counties.geometry.values)
+    tree = shapely.STRtree(geometries)
+    for row_off in range(0, height, block_rows):
+        window = Window(0, row_off, width, min(block_rows, height - row_off))
+        candidates = tree.query(shapely.box(*window_bounds(window, transform)))
+        if candidates.size == 0:
+            grid[row_off:row_off + window.height] = 0
+            continue
+        grid[row_off:row_off + window.height] = rasterize(
+            ((geometries[i], int(i) + 1) for i in candidates),
+            out_shape=(window.height, width), transform=window_transform(window, transform),
+            fill=0, dtype=dtype, all_touched=False)
+
+    grid.flush()
+    del grid
+
+
+def load_county_grid(counties, shapefile_path, transform, width, height,
+                     cache_dir='County_Grid_Cache'):
+    """
+    Load the county-ID grid for a county set and raster grid, building it on a cache miss.
+
+    Parameters:
+    - counties: GeoDataFrame with geometry and COUNTY_ATTRIBUTES columns.
+    - shapefile_path: String, shapefile the counties were read from (part of the cache key).
+    - transform, width, height: Target grid (see rasterCoords.warped_grid).
+    - cache_dir: String, folder holding the cached grids.
+
+    Returns:
+    - Tuple (grid, attributes): memory-mapped array of county number + 1 per pixel, and a
+      DataFrame of county attributes whose row i belongs to grid value i + 1.
+    """
+    counties = counties.to_crs('EPSG:4326').reset_index(drop=True)
+    key = county_grid_key(shapefile_path, counties['GEOID'], transform, width, height)
+    grid_path = os.path.join(cache_dir, f'countyGrid_{key}.npy')
+    attributes_path = os.path.join(cache_dir, f'countyGrid_{key}.csv')
+
+    if not (os.path.exists(grid_path) and os.path.exists(attributes_path)):
+        os.makedirs(cache_dir, exist_ok=True)
+        print(f"Building county grid cache {grid_path} ({height} x {width})")
+
+        ## Write under a temporary name so an interrupted build is never picked up
+        tmp_path = f'{grid_path}.{os.getpid()}.tmp.npy'
+        rasterize_counties(counties, transform, width, height, tmp_path)
+        pd.DataFrame(counties[COUNTY_ATTRIBUTES]).to_csv(attributes_path, index=False)
+        os.replace(tmp_path, grid_path)
+
+    grid = np.load(grid_path, mmap_mode='r')
+    attributes = pd.read_csv(attributes_path, dtype={'STATEFP': str, 'COUNTYFP': str, 'GEOID': str})
+    return grid, attributes
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Lookup
+#######################################
+def lookup_counties(grid, transform, longitudes, latitudes):
+    """
+    County number + 1 (0 = none) for each point, read from the grid cell it falls in.
+
+    Parameters:
+    - grid: County-ID grid from load_county_grid.
+    - transform: affine.Affine of the grid (north-up).
+    - longitudes, latitudes: Arrays of point coordinates.
+
+    Returns:
+    - Integer NumPy array of zone ids.
+    """
+    cols = np.floor((np.asarray(longitudes, dtype=np.float64) - transform.c) / transform.a).astype(np.int64)
+    rows = np.floor((np.asarray(latitudes, dtype=np.float64) - transform.f) / transform.e).astype(np.int64)
+    inside = (rows >= 0) & (rows < grid.shape[0]) & (cols >= 0) & (cols < grid.shape[1])
+
+    zones = np.zeros(rows.shape, dtype=np.int64)
+    zones[inside] = grid[rows[inside], cols[inside]]
+    return zones
+######################## End Function ########################
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Crop Data Archive Access \\\\\\\\\\
+
+Shared access to the {state}Data.zip archives of crop point CSVs used by
+cropCountyShaper.py and cropStationMapper.py.
+
+The archive is opened once per state and its member index (name -> ZipInfo) is read
+once, instead of re-opening the zip for every is_zipfile / namelist / read of a year.
+
+- open(name): a stream over one member (decompressing if needed)
+- buffer(name): a zero-copy memoryview over a stored (uncompressed) member, backed by
+  an mmap of the archive file
+- read_csv(name, chunksize): pandas read_csv over the member, through the mmap'd
+  buffer when the member is stored
+
+@author: dforc
+"""
+
+import io
+import mmap
+import struct
+import zipfile
+
+import pandas as pd
+
+
+## Local file header: signature, ..., file name length (offset 26), extra field length (offset 28)
+_LOCAL_HEADER = struct.Struct('<4s22xHH')
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+#######################################
+####### Buffer Stream
+#######################################
+class _BufferReader(io.RawIOBase):
+    """
+    Raw, seekable file object over a memoryview (readinto copies straight to the caller).
+    """
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._buffer) - self._pos)
+        b[:n] = self._buffer[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._buffer)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Archive
+#######################################
+class CropArchive:
+    """
+    One open {state}Data.zip with its member index.
+
+    Parameters:
+    - zip_file_path: String, path to the zip archive.
+
+    Raises:
+    - zipfile.BadZipFile if the file is not a zip archive.
+    """
+    def __init__(self, zip_file_path):
+        self.path = zip_file_path
+        self._file = open(zip_file_path, 'rb')
+        try:
+            self._zip = zipfile.ZipFile(self._file, 'r')
+        except zipfile.BadZipFile:
+            self._file.close()
+            raise
+        self.members = {info.filename: info for info in self._zip.infolist()}
+        self._mmap = None
+        self._views = []
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            ## Views handed out by buffer() must be released before the mmap can close
+            for view in self._views:
+                view.release()
+            self._views = []
+            self._mmap.close()
+            self._mmap = None
+        self._zip.close()
+        self._file.close()
+
+    def is_stored(self, name):
+        """True if the member is stored without compression (and can be memory-mapped)."""
+        return self.members[name].compress_type == zipfile.ZIP_STORED
+
+    def open(self, name):
+        """Stream over one member; decompresses and checks the CRC like ZipFile.open."""
+        return self._zip.open(self.members[name], 'r')
+
+    def buffer(self, name):
+        """
+        Zero-copy view of a stored member's bytes.
+
+        Parameters:
+        - name: String, member name.
+
+        Returns:
+        - memoryview over the mmap'd archive file.
+
+        Raises:
+        - ValueError if the member is compressed.
+        """
+        info = self.members[name]
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f"{name} in {self.path} is compressed; use open() instead")
+
+        if self._mmap is None:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        ## The data starts after the local header, whose name/extra lengths may differ
+        ## from the central directory's
+        signature, name_length, extra_length = _LOCAL_HEADER.unpack_from(self._mmap, info.header_offset)
+        if signature != _LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad local file header for {name} in {self.path}")
+        start = info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+        with memoryview(self._mmap) as whole:
+            view = whole[start:start + info.file_size]
+        self._views.append(view)
+        return view
+
+    def read_csv(self, name, chunksize=None, **kwargs):
+        """
+        Read one CSV member with pandas, through the mmap'd buffer when it is stored.
+
+        Parameters:
+        - name: String, member name.
+        - chunksize: Integer, rows per chunk; returns an iterator of DataFrames when given.
+        - kwargs: Passed on to pandas.read_csv.
+
+        Returns:
+        - DataFrame, or a TextFileReader when chunksize is given.
+        """
+        if self.is_stored(name):
+            stream = io.BufferedReader(_BufferReader(self.buffer(name)), buffer_size=1 << 20)
+        else:
+            stream = self.open(name)
+        return pd.read_csv(stream, chunksize=chunksize, **kwargs)
+######################## End Function ########################
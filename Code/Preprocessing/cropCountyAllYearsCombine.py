@@ -12,10 +12,14 @@ It completes the following tasks:
 - Saves the combined data in a structured CSV file named {state}CropsCountyReady.csv within the state-specific folder
 - Ensures that all spatial and temporal data is aligned and correctly formatted for further analysis
 
+combine_csv_files can be imported; running the script (python cropCountyAllYearsCombine.py
+[--state Florida]) writes the combined file as before.
+
 
 @author: dforc
 """
 
+import argparse
 import pandas as pd
 import os
 
@@ -24,8 +28,6 @@ import os
 #######################################
 STATE_OF_INTEREST = 'Florida'
 
-## TODO: Set Dynamic 'State of interest' button on master script
-
 
 
 
@@ -73,19 +75,32 @@ def combine_csv_files(state, start_year, end_year, output_directory_base='Output
 #######################################
 ####### Run Program
 #######################################
+def main(state, start_year=2010, end_year=2020, output_directory_base='Output_CSVs'):
+    """
+    Combine a state's yearly county files and save Output_CSVs/{state}/{state}CropsCountyReady.csv.
+    """
+    ## Combining CSV files for the specified state and year range
+    combined_df = combine_csv_files(state, start_year, end_year, output_directory_base)
+
+    ## Define Path for Save Location
+    output_file_path = os.path.join(output_directory_base, state, f'{state}CropsCountyReady.csv')
+
+    if not combined_df.empty:
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)  ## Ensure the output directory exists
+        combined_df.to_csv(output_file_path, index=False)
+        print(f'Combined data saved to {output_file_path}')
+    else:
+        print('No combined data to save.')
+######################## End Function ########################
+
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Combine a state's yearly crop county files.")
+    parser.add_argument('--state', default=STATE_OF_INTEREST, help="State to combine")
+    parser.add_argument('--start-year', type=int, default=2010, help="First year")
+    parser.add_argument('--end-year', type=int, default=2020, help="Last year")
+    args = parser.parse_args()
 
-## Combining CSV files for the specified state and year range
-combined_df = combine_csv_files(STATE_OF_INTEREST, 2010, 2020)
-
-## Define Path for Save Location
-output_file_path = os.path.join('Output_CSVs', STATE_OF_INTEREST, f'{STATE_OF_INTEREST}CropsCountyReady.csv')
-
-if not combined_df.empty:
-    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)  ## Ensure the output directory exists
-    combined_df.to_csv(output_file_path, index=False)
-    print(f'Combined data saved to {output_file_path}')
-else:
-    print('No combined data to save.')
-    
-    
-    
\ No newline at end of file
+    main(args.state, args.start_year, args.end_year)
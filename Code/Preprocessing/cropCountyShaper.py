@@ -5,24 +5,42 @@
 This script processes geospatial agricultural data for specified states and years.
 It performs the following tasks:
 
-- Reads and processes shapefiles for county boundaries to use in spatial analysis.
-- Loads agricultural data from CSV files contained within zip archives for each specified state and year.
-- Converts CSV data into geospatial data format (GeoDataFrame) using coordinates.
-- Performs spatial joins to associate crop data points with corresponding counties.
-- Groups the resulting data by county and crop type, then aggregates it for analysis.
+- Reads the county boundaries of each state (countyBoundaries.py) to use in spatial analysis.
+- Loads agricultural data for each specified state and year, either from the Parquet dataset
+  written by TIFtoCSV.py --format parquet ({state}TopCropLonLat/Year={year}) or from
+  CSV files contained within zip archives (opened once per state through cropArchive.py).
+- Reads each year in chunks of {chunk_size} points (read_csv chunksize straight from the zip
+  member, or Parquet record batches) so memory stays flat however many pixels a year has.
+- Performs spatial joins to associate each chunk's crop points with corresponding counties,
+  querying the counties' prepared STRtree directly instead of building a GeoDataFrame.
+  When the year's CropScape raster is available ({raster_directory}/{state}_{year}.tif), counties
+  are instead read from a cached county-ID grid aligned to the crop grid (countyGrid.py), which
+  is built once and reused by every later year.
+- Counts each chunk by county and crop type and merges the partial counts as it goes.
 - Saves the processed and grouped data into CSV files, one for each state and year, 
   containing detailed crop data integrated with county-level geospatial information.
 
+count_year(state, year, counties, ...) counts one year against counties loaded once by the
+caller, and process_state runs every year of a state; running the script
+(python cropCountyShaper.py [--states Florida] [--years 2010 2011]) processes the states as before.
+
 
 @author: dforc
 """
 
+import argparse
 import geopandas as gpd
 import pandas as pd
 import os
 import zipfile
 from tqdm import tqdm
 
+from cropArchive import CropArchive
+from cropPoints import iter_crop_points, crop_points_path
+from countyGrid import load_county_grid, lookup_counties
+from rasterCoords import warped_grid
+from countyBoundaries import load_counties
+
 
 
 
@@ -31,6 +49,14 @@ from tqdm import tqdm
 #######################################
 states = ['Florida']
 years = [str(year) for year in range(2010, 2021)]  ## From 2010 to 2020
+
+## Folder with the CropScape rasters ({state}_{year}.tif) TIFtoCSV.py converted;
+## years whose raster is found here use the cached county grid instead of a spatial join
+raster_directory = 'Rasters'
+grid_cache_directory = 'County_Grid_Cache'
+
+## Points read, joined and counted at a time
+chunk_size = 1_000_000
 #######################################
 
 
@@ -38,17 +64,21 @@ years = [str(year) for year in range(2010, 2021)]  ## From 2010 to 2020
 #######################################
 ####### Load Shapefiles
 #######################################
-def load_and_process_shapefile(shapefile_path, columns_needed):
+def load_and_process_shapefile(shapefile_path, columns_needed, state=None):
     """
     Load a county shapefile and select the required columns.
 
     Parameters:
     - shapefile_path: String, path to the shapefile.
     - columns_needed: List of strings, names of the columns to keep.
+    - state: String, state name; when given only that state's counties are loaded
+      (memoized as GeoParquet by countyBoundaries.py).
 
     Returns:
     - Geopandas GeoDataFrame with only the selected columns.
     """
+    if state is not None:
+        return load_counties(shapefile_path, state=state)[columns_needed]
     return gpd.read_file(shapefile_path)[columns_needed]
 ######################## End Function ########################
 
@@ -57,52 +87,94 @@ def load_and_process_shapefile(shapefile_path, columns_needed):
 
 
 #######################################
-####### Read .CSV from Zip; Convert to Geospatial
+####### Read .CSV from Zip
 #######################################
-def load_and_convert_csv_to_gdf(zip_file_path, csv_file_name, 
-                                longitude_col='Longitude', latitude_col='Latitude'):
+def iter_csv_from_zip(archive, csv_file_name, chunksize=1_000_000):
     """
-    Load CSV data from within a zip file and convert it to a GeoDataFrame.
+    Stream CSV data from within an open zip archive in chunks, without extracting it.
 
     Parameters:
-    - zip_file_path: String, path to the zip file containing CSV data.
+    - archive: CropArchive, the state's open zip archive.
     - csv_file_name: String, name of the CSV file to process.
-    - longitude_col: String, name of the column containing longitude data.
-    - latitude_col: String, name of the column containing latitude data.
+    - chunksize: Integer, rows per yielded DataFrame.
 
-    Returns:
-    - Geopandas GeoDataFrame with geometry created from longitude and latitude columns.
+    Yields:
+    - DataFrames of at most chunksize rows.
     """
-    with zipfile.ZipFile(zip_file_path, 'r') as z:
-        with z.open(csv_file_name) as csv_file:
-            df = pd.read_csv(csv_file)
-    return gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df[longitude_col],
-                                                            df[latitude_col]))
+    with archive.read_csv(csv_file_name, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield chunk
 ######################## End Function ########################
 
 
 
 
 #######################################
-####### Spatial Join
+####### Chunked County Assignment
 #######################################
-def perform_spatial_join(gdf, counties):
+def join_chunk_to_counties(chunk, counties, longitude_col='Longitude', latitude_col='Latitude'):
+    """
+    Spatially join one chunk of crop points to counties through the counties' STRtree.
+
+    Each point is matched to the counties it intersects (points outside every county are
+    dropped), without building a GeoDataFrame or copying the county attributes onto every point.
+
+    Parameters:
+    - chunk: DataFrame of crop points with CropTypes and Year columns.
+    - counties: Geopandas GeoDataFrame, county polygons (row position = zone).
+
+    Returns:
+    - DataFrame with zone (row position in counties), CropTypes and Year per matched point.
+    """
+    points = gpd.points_from_xy(chunk[longitude_col], chunk[latitude_col])
+    point_index, zone = counties.sindex.query(points, predicate='intersects')
+    return pd.DataFrame({'zone': zone,
+                         'CropTypes': chunk['CropTypes'].to_numpy()[point_index],
+                         'Year': chunk['Year'].to_numpy()[point_index]})
+
+
+def grid_chunk_to_counties(chunk, grid, transform, longitude_col='Longitude', latitude_col='Latitude'):
     """
-    Perform a spatial join between GeoDataFrames of points and counties.
+    Assign counties to one chunk of crop points by reading the cached county-ID grid.
 
     Parameters:
-    - gdf: Geopandas GeoDataFrame, points to join.
-    - counties: Geopandas GeoDataFrame, county polygons to join against.
+    - chunk: DataFrame of crop points (pixel centers of the grid's warped raster).
+    - grid, transform: County-ID grid from countyGrid.load_county_grid and its transform.
 
     Returns:
-    - Geopandas GeoDataFrame after performing the spatial join, retaining specified columns.
+    - DataFrame with zone (row position in the grid attributes), CropTypes and Year;
+      points outside every county are dropped.
+    """
+    zones = lookup_counties(grid, transform, chunk[longitude_col], chunk[latitude_col])
+    inside = zones > 0
+    return pd.DataFrame({'zone': zones[inside] - 1,
+                         'CropTypes': chunk['CropTypes'].to_numpy()[inside],
+                         'Year': chunk['Year'].to_numpy()[inside]})
+
+
+def count_chunks_by_county(chunks, assign_counties):
     """
-    gdf.crs = counties.crs
-    joined_data = gpd.sjoin(gdf, counties, how="left", op='intersects')
-    return joined_data[['geometry', 'STATEFP', 'COUNTYFP', 
-                        'GEOID', 'NAME', 'ALAND', 'AWATER', 
-                        'CropTypes', 'Year']]
+    Count crop points by (zone, CropTypes, Year) one chunk at a time.
+
+    Parameters:
+    - chunks: Iterable of crop point DataFrames.
+    - assign_counties: Function mapping a chunk to its (zone, CropTypes, Year) DataFrame.
 
+    Returns:
+    - Integer Series of point counts indexed by (zone, CropTypes, Year).
+    """
+    counts = None
+    for chunk in chunks:
+        ## Plain object labels: Parquet batches may each carry their own category dictionary
+        if isinstance(chunk['CropTypes'].dtype, pd.CategoricalDtype):
+            chunk['CropTypes'] = chunk['CropTypes'].astype(object)
+
+        partial = assign_counties(chunk).groupby(['zone', 'CropTypes', 'Year']).size()
+        counts = partial if counts is None else counts.add(partial, fill_value=0)
+
+    if counts is None:
+        return pd.Series(dtype='int64')
+    return counts.astype('int64')
 ######################## End Function ########################
 
 
@@ -111,21 +183,28 @@ def perform_spatial_join(gdf, counties):
 #######################################
 ####### Group Data by County and Crop
 #######################################
-def group_and_save_data(joined_data, output_path, grouping_columns, count_column_name='Count'):
+def save_county_counts(counts, attributes, output_path, grouping_columns, count_column_name='Count'):
     """
-    Group spatially joined data by specified columns and save to CSV.
+    Save chunk-merged county counts, one row per grouping_columns key with its count,
+    sorted by grouping_columns.
 
     Parameters:
-    - joined_data: Geopandas GeoDataFrame, data to group.
+    - counts: Series from count_chunks_by_county.
+    - attributes: DataFrame of county attributes whose row position is the zone.
     - output_path: String, path to save the grouped data CSV.
-    - grouping_columns: List of strings, columns to group by.
+    - grouping_columns: List of strings, output key columns (County plus attribute names).
     - count_column_name: String, name of the count column in the output.
 
     Outputs:
     - CSV file saved to the specified path.
     """
-    grouped_data = joined_data.groupby(grouping_columns).size().reset_index(name=count_column_name)
-    grouped_data.to_csv(output_path, index=False)
+    grouped_data = counts.rename(count_column_name).reset_index()
+    county_columns = pd.DataFrame(attributes).drop(columns='geometry', errors='ignore')
+    county_columns = county_columns.reset_index(drop=True).rename(columns={'NAME': 'County'})
+    grouped_data = grouped_data.join(county_columns, on='zone')
+
+    grouped_data = grouped_data.sort_values(grouping_columns, kind='stable')
+    grouped_data[grouping_columns + [count_column_name]].to_csv(output_path, index=False)
 ######################## End Function ########################
 
 
@@ -144,43 +223,121 @@ shapefile_path = 'Shapefiles/tl_2019_us_county.shp'
 columns_needed = ['geometry', 'STATEFP', 'COUNTYFP', 
                   'GEOID', 'NAME', 'ALAND', 'AWATER']
 
-## Process and Load Shapefile
-counties = load_and_process_shapefile(shapefile_path, columns_needed)
+## Define grouping columns for the grouped data ('NAME' is saved as 'County')
+grouping_columns = ['County', 'CropTypes', 'Year', 'STATEFP', 
+                    'COUNTYFP', 'GEOID', 'ALAND', 'AWATER']
+
+
+def count_year(state, year, counties, archive=None, parquet_path=None, shapefile_path=shapefile_path,
+               raster_directory=raster_directory, grid_cache_directory=grid_cache_directory,
+               chunk_size=chunk_size):
+    """
+    Count one year's crop points by county and crop type.
+
+    Parameters:
+    - state: String, state name.
+    - year: String, year.
+    - counties: GeoDataFrame of the state's counties (load_and_process_shapefile), loaded once per state.
+    - archive: CropArchive of the state's zip, or None when reading the Parquet dataset.
+    - parquet_path: String, the state's crop points dataset (preferred when it exists).
+    - shapefile_path, raster_directory, grid_cache_directory: Strings, county grid inputs.
+    - chunk_size: Integer, points read, joined and counted at a time.
+
+    Returns:
+    - Tuple (counts Series indexed by zone, CropTypes and Year; county attributes), or None
+      when the year is not in the data.
+    """
+    csv_file_name = f'{state}TopCropLonLat_{year}.csv'
+
+    ## Prefer the Parquet dataset when TIFtoCSV.py wrote one
+    if parquet_path is not None and os.path.isdir(parquet_path):
+        if not os.path.exists(crop_points_path(parquet_path, year)):
+            print(f"Year not found in dataset: {parquet_path} {year}")
+            return None
+
+        chunks = iter_crop_points(parquet_path, year, columns=['Longitude', 'Latitude', 'CropTypes'],
+                                  batch_size=chunk_size)
+
+    else:
+        if csv_file_name not in archive:
+            print(f"File not found in zip: {csv_file_name}")
+            return None
+
+        ## Stream CSV data from the zip
+        chunks = iter_csv_from_zip(archive, csv_file_name, chunksize=chunk_size)
+
+    raster_path = os.path.join(raster_directory, f'{state}_{year}.tif')
+    if os.path.exists(raster_path):
+        ## Look counties up in the cached county grid
+        transform, width, height = warped_grid(raster_path)
+        grid, attributes = load_county_grid(counties, shapefile_path, transform, width, height,
+                                            cache_dir=grid_cache_directory)
+        counts = count_chunks_by_county(
+            chunks, lambda chunk: grid_chunk_to_counties(chunk, grid, transform))
+    else:
+        ## Spatially join each chunk against the counties' STRtree
+        attributes = counties
+        counts = count_chunks_by_county(
+            chunks, lambda chunk: join_chunk_to_counties(chunk, counties))
+    return counts, attributes
+
+
+def process_state(state, years, shapefile_path=shapefile_path, **kwargs):
+    """
+    Write Output_CSVs/{state}/{state}TopCropLonLat_{year}_with_County_Grouped.csv for each year.
+
+    Parameters:
+    - state: String, state name.
+    - years: List of strings, years to process.
+    - shapefile_path: String, county shapefile.
+    - kwargs: Passed on to count_year (raster_directory, grid_cache_directory, chunk_size).
+    """
+    ## Process and Load the State's Counties (CropScape state rasters are clipped to the state)
+    counties = load_and_process_shapefile(shapefile_path, columns_needed, state=state)
 
-## Process all States and Years Specified at Top of Script
-for state in states:
     zip_file_path = f'{state}Data.zip'
-    for year in tqdm(years, desc=f'Processing {state}'):
-        csv_file_name = f'{state}TopCropLonLat_{year}.csv'
-        
-        ## Define and ensure the output directory exists
-        output_directory = f'Output_CSVs/{state}'
-        os.makedirs(output_directory, exist_ok=True)
-        
-        output_grouped_file_path = f'{output_directory}/{state}TopCropLonLat_{year}_with_County_Grouped.csv'
+    parquet_path = f'{state}TopCropLonLat'
 
+    ## Open the state's zip once and index its members (not needed with a Parquet dataset)
+    archive = None
+    if not os.path.isdir(parquet_path):
         if not zipfile.is_zipfile(zip_file_path):
             print(f"Zip file not found or is corrupted: {zip_file_path}")
-            continue
+            return
+        archive = CropArchive(zip_file_path)
 
-        if csv_file_name not in zipfile.ZipFile(zip_file_path, 'r').namelist():
-            print(f"File not found in zip: {csv_file_name}")
+    ## Define and ensure the output directory exists
+    output_directory = f'Output_CSVs/{state}'
+    os.makedirs(output_directory, exist_ok=True)
+
+    for year in tqdm(years, desc=f'Processing {state}'):
+        result = count_year(state, year, counties, archive, parquet_path, shapefile_path, **kwargs)
+        if result is None:
             continue
 
-        ## Load and convert CSV data to GeoDataFrame
-        gdf = load_and_convert_csv_to_gdf(zip_file_path, csv_file_name)
+        ## Merge county attributes onto the counts and save the result
+        counts, attributes = result
+        output_grouped_file_path = f'{output_directory}/{state}TopCropLonLat_{year}_with_County_Grouped.csv'
+        save_county_counts(counts, attributes, output_grouped_file_path, grouping_columns)
+
+    if archive is not None:
+        archive.close()
+######################## End Function ########################
+
 
-        ## Perform the spatial join
-        joined_data = perform_spatial_join(gdf, counties)
 
-        ## Rename the 'NAME' column to 'County' for clarity
-        joined_data.rename(columns={'NAME': 'County'}, inplace=True)
 
-        ## Define grouping columns for the grouped data
-        grouping_columns = ['County', 'CropTypes', 'Year', 'STATEFP', 
-                            'COUNTYFP', 'GEOID', 'ALAND', 'AWATER']
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Count crop points by county for each state and year.")
+    parser.add_argument('--states', nargs='+', default=states, help="States to process")
+    parser.add_argument('--years', nargs='+', default=years, help="Years to process")
+    parser.add_argument('--shapefile', default=shapefile_path, help="County shapefile")
+    parser.add_argument('--raster-dir', default=raster_directory, help="Folder of the {state}_{year}.tif rasters")
+    parser.add_argument('--grid-cache', default=grid_cache_directory, help="Folder caching the county grids")
+    parser.add_argument('--chunk-size', type=int, default=chunk_size, help="Points counted at a time")
+    args = parser.parse_args()
 
-        ## Group by specified columns and save the result
-        group_and_save_data(joined_data, output_grouped_file_path, grouping_columns)
-        
-######################## And We're Done  ########################
\ No newline at end of file
+    ## Process all States and Years Specified at Top of Script
+    for state in args.states:
+        process_state(state, args.years, args.shapefile, raster_directory=args.raster_dir,
+                      grid_cache_directory=args.grid_cache, chunk_size=args.chunk_size)
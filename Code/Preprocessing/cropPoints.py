@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Crop Point Tables (Parquet) \\\\\\\\\\
+
+Columnar storage for the crop pixel points written by TIFtoCSV.py and read by
+cropCountyShaper.py and cropStationMapper.py.
+
+The CSV tables repeat the CropTypes string on every pixel row and store coordinates
+as 17-digit text. The Parquet layout stores:
+
+- Longitude / Latitude as float32 (< 1 m error at CropScape's 30 m resolution)
+- CropTypes as a dictionary-encoded column built straight from the raster codes
+- One hive partition per year: {state}TopCropLonLat/Year={year}/part-0.parquet
+
+@author: dforc
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+CROP_POINT_COLUMNS = ['Longitude', 'Latitude', 'CropTypes']
+
+crop_points_schema = pa.schema([
+    ('Longitude', pa.float32()),
+    ('Latitude', pa.float32()),
+    ('CropTypes', pa.dictionary(pa.int16(), pa.string())),
+])
+
+
+#######################################
+####### Legend Lookup
+#######################################
+class CropLegend:
+    """
+    Map raw CropScape pixel codes to dictionary indices of the crop names.
+
+    Parameters:
+    - crop_legend: DataFrame with 'Value' (pixel code) and 'Category' (crop name) columns.
+    """
+    def __init__(self, crop_legend):
+        codes, categories = pd.factorize(crop_legend['Category'])
+        values = crop_legend['Value'].to_numpy(dtype=np.int64)
+
+        self.dictionary = pa.array(categories.astype(str), type=pa.string())
+
+        ## Codes missing from the legend become null, like the left merge in the CSV path
+        self.lookup = np.full(values.max() + 1, -1, dtype=np.int16)
+        self.lookup[values] = codes
+
+    def indices(self, values):
+        values = np.asarray(values, dtype=np.int64)
+        known = values < self.lookup.size
+        indices = np.full(values.shape, -1, dtype=np.int16)
+        indices[known] = self.lookup[values[known]]
+        return pa.array(indices, mask=indices < 0, type=pa.int16())
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Write Crop Points
+#######################################
+def crop_points_table(xs, ys, values, legend):
+    """
+    Build an Arrow table of crop points without materializing per-pixel strings.
+
+    Parameters:
+    - xs, ys: Arrays of longitudes and latitudes.
+    - values: Array of raw CropScape pixel codes.
+    - legend: CropLegend for the codes.
+
+    Returns:
+    - pyarrow.Table with crop_points_schema.
+    """
+    return pa.Table.from_arrays([
+        pa.array(np.asarray(xs, dtype=np.float32)),
+        pa.array(np.asarray(ys, dtype=np.float32)),
+        pa.DictionaryArray.from_arrays(legend.indices(values), legend.dictionary),
+    ], schema=crop_points_schema)
+
+
+def crop_points_path(dataset_path, year):
+    """Path of the single Parquet file holding one year's partition."""
+    return os.path.join(dataset_path, f'Year={int(year)}', 'part-0.parquet')
+
+
+def open_crop_points_writer(dataset_path, year):
+    """
+    Open a ParquetWriter for one year's partition; each write_table call adds a row group.
+    """
+    output_path = crop_points_path(dataset_path, year)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    return pq.ParquetWriter(output_path, crop_points_schema, compression='zstd')
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Read Crop Points
+#######################################
+def read_crop_points(dataset_path, year, columns=CROP_POINT_COLUMNS):
+    """
+    Load one year of crop points from a partitioned Parquet dataset.
+
+    Parameters:
+    - dataset_path: String, the {state}TopCropLonLat dataset folder.
+    - year: Integer or string, the year partition to read.
+    - columns: List of strings, columns to load (column projection).
+
+    Returns:
+    - DataFrame with the requested columns plus 'Year'; CropTypes is categorical.
+    """
+    df = pq.read_table(crop_points_path(dataset_path, year),
+                       columns=[c for c in columns if c != 'Year']).to_pandas()
+    df['Year'] = int(year)
+    return df
+
+
+def iter_crop_points(dataset_path, year, columns=CROP_POINT_COLUMNS, batch_size=1_000_000):
+    """
+    Stream one year of crop points from the Parquet dataset in bounded-size batches.
+
+    Parameters:
+    - dataset_path: String, the {state}TopCropLonLat dataset folder.
+    - year: Integer or string, the year partition to read.
+    - columns: List of strings, columns to load (column projection).
+    - batch_size: Integer, maximum rows per yielded DataFrame.
+
+    Yields:
+    - DataFrames with the requested columns plus 'Year'.
+    """
+    parquet_file = pq.ParquetFile(crop_points_path(dataset_path, year))
+    for batch in parquet_file.iter_batches(batch_size=batch_size,
+                                           columns=[c for c in columns if c != 'Year']):
+        df = batch.to_pandas()
+        df['Year'] = int(year)
+        yield df
+######################## End Function ########################
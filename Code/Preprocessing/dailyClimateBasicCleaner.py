@@ -3,35 +3,46 @@
 ////////// Daily Climate Data Cleaning \\\\\\\\\
 
 This Script Cleans the Daily Climate Data
-(./Clean_Daily_Data/{state}DailyReady.csv)
+(the DailyReady Parquet stage, ./Clean_Daily_Data/DailyReady, see dataStore.py)
 
 It completes the following tasks:
 
 - Reads the cleaned daily climate data for a specified state
 - Replaces placeholder values in columns like DewPoint, MaxTemp, MinTemp,
       WindGust, MaxWindSpeed, WindSpeed, and Precipitation with NaN
-- Ensures the 'Date' column is in the proper datetime format
+- Reads and writes with the declared column types of climateSchema.py
+      (float32 measurements, Int8 flags, category station/county, datetime dates)
 - Decodes the WeatherType column into separate indicators for weather conditions
       such as Fog, Rain_Drizzle, Snow_Ice, Hail, Thunder, and Tornado_Funnel
-- Outputs the further cleaned data into new CSV files (./Clean_Daily_Data/{state}DailyCleaned.csv)
-- Fills Missing Values with NA
+      (vectorized, as nullable Int8 columns; see weatherType.py)
+- Outputs the further cleaned data to the DailyCleaned Parquet stage (./Clean_Daily_Data/DailyCleaned),
+      optionally exported to CSV (./Clean_Daily_Data/{state}DailyCleaned.csv, missing values as NA)
+
+clean_daily(df) does the cleaning on a DailyReady table and can be imported;
+running the script (python dailyClimateBasicCleaner.py [--state Florida]) reads and
+writes the stages as before.
 
 @author: dforc
 """
 
-import pandas as pd
+import argparse
 import numpy as np
 
+from weatherType import decode_weather_type
+from climateSchema import DAILY_SCHEMA
+from dataStore import read_stage, write_stage
+
 #######################################
 ####### !! >> Set State Here << !!
 #######################################
 myState = "Florida"
 
-## Set Dynamic Path
-cleanDataPath = f'./Clean_Daily_Data/{myState}DailyReady.csv'
+## Also export {myState}DailyCleaned.csv next to the Parquet stage
+exportCSV = False
 
-## Read the CSV into Dataframe
-dailyCleanedData = pd.read_csv(cleanDataPath)
+## Stage written by dailyClimateShaper.py, and the cleaned stage
+cleanStagePath = './Clean_Daily_Data/DailyReady'
+cleanedStagePath = './Clean_Daily_Data/DailyCleaned'
 
 
 
@@ -52,46 +63,63 @@ missing_value_indicators = {
     'Precipitation': 99.99  # Added Precipitation column filter
 }
 
-for column, placeholder in missing_value_indicators.items():
-    dailyCleanedData[column].replace(placeholder, np.nan, inplace=True)
-
-## Ensure 'Date' is in the datetime format
-dailyCleanedData['Date'] = pd.to_datetime(dailyCleanedData['Date'], format='%Y-%m-%d')
 
-## Decode WeatherType column into separate indicators
-weather_conditions = ['Fog', 'Rain_Drizzle', 'Snow_Ice', 'Hail', 'Thunder', 'Tornado_Funnel']
-for i, condition in enumerate(weather_conditions):
-    dailyCleanedData[condition] = dailyCleanedData['WeatherType'].apply(lambda x: int(str(x).zfill(6)[i]) if pd.notnull(x) else np.nan)
+def clean_daily(df):
+    """
+    Mask the GSOD missing value placeholders and decode WeatherType into indicator columns.
 
+    Parameters:
+    - df: DataFrame of the DailyReady stage (DAILY_SCHEMA types; 'Date' already datetime).
 
+    Returns:
+    - New DataFrame with the placeholders as NaN and Fog ... Tornado_Funnel in place of WeatherType.
+    """
+    df = df.copy()
 
-## Remove the original 'WeatherType' column as it's no longer needed
-dailyCleanedData.drop('WeatherType', axis=1, inplace=True)
+    ## Measurements are float32, so compare against the placeholder at float32
+    for column, placeholder in missing_value_indicators.items():
+        is_placeholder = df[column] == np.float32(placeholder)
+        df[column] = df[column].mask(is_placeholder)
 
+    ## Decode WeatherType column into separate indicators (one integer pass for all six flags)
+    weather_flags = decode_weather_type(df['WeatherType'])
+    df[weather_flags.columns] = weather_flags
 
-## Fill in all missing values with NA
-dailyCleanedData.fillna('NA', inplace=True)
-
-## /////////////////////////////////////
+    ## Remove the original 'WeatherType' column as it's no longer needed
+    return df.drop(columns='WeatherType')
+######################## End Function ########################
 
 
 
 
 #######################################
-####### Write Cleaned Data
+####### Run Program
 #######################################
+def main(state, input_stage=cleanStagePath, output_stage=cleanedStagePath, export_csv=exportCSV):
+    """
+    Clean one state's DailyReady stage into the DailyCleaned stage.
+    """
+    ## Read the state's partitions with the declared daily schema (see climateSchema.py)
+    dailyCleanedData = clean_daily(read_stage(input_stage, DAILY_SCHEMA, state=state))
 
-## Construct the file path for output
-cleanedOutputPath = f'./Clean_Daily_Data/{myState}DailyCleaned.csv'
-
-## Write the cleaned data to .CSV
-dailyCleanedData.to_csv(cleanedOutputPath, index=False)
-
-print(f"Data cleaned and saved to {cleanedOutputPath}")
+    ## Write the cleaned data to the stage; the optional CSV export writes missing values as NA
+    ## (na_rep instead of fillna('NA'), which would turn every column into strings)
+    cleanedOutputPath = f'./Clean_Daily_Data/{state}DailyCleaned.csv' if export_csv else None
+    write_stage(dailyCleanedData, output_stage, state, DAILY_SCHEMA, csv_path=cleanedOutputPath)
 
+    print(f"Data cleaned and saved to {output_stage}")
+######################## End Function ########################
 
-## /////////////////////////////////////
 
 
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Clean a state's DailyReady stage into the DailyCleaned stage.")
+    parser.add_argument('--state', default=myState, help="State to clean")
+    parser.add_argument('--input-stage', default=cleanStagePath, help="DailyReady stage directory")
+    parser.add_argument('--stage', default=cleanedStagePath, help="DailyCleaned stage directory")
+    parser.add_argument('--export-csv', action='store_true', default=exportCSV,
+                        help="Also write ./Clean_Daily_Data/{state}DailyCleaned.csv")
+    args = parser.parse_args()
 
+    main(args.state, args.input_stage, args.stage, args.export_csv)
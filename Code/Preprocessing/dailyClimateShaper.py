@@ -6,7 +6,7 @@ This script is run after dailyRawCombiner.py, and before
 dailyClimateBasicCleaner.py
     
 This Script Processes Daily Climate Data
-(./Raw_Daily_Data/{state}DailyRaw.csv)
+(the DailyRaw Parquet stage, ./Raw_Daily_Data/DailyRaw, see dataStore.py)
 It completes the following tasks:
 
 - Reads raw daily climate data for a specified state
@@ -15,30 +15,45 @@ It completes the following tasks:
   dew point, weather conditions, elevation, station, and geographic coordinates
 - Replaces missing values indicated by -9999 with NaN to handle missing data
 - Extracts unique weather station identifiers along with their coordinates
-- Loads county boundaries shapefile to map stations to their respective counties
+- Loads the state's county boundaries (countyBoundaries.py) to map stations to their respective counties
 - Performs a spatial join to associate weather stations with county and state information
-- Outputs the processed data into clean CSV files, including station locations and daily climate data
+- Outputs the processed daily climate data to the DailyReady Parquet stage (CSV export optional)
+  and the station locations to CSV, typed by climateSchema.py
+  (float32 measurements, category station/county, dates)
+
+The work is done by functions that can be imported and reused, e.g. by a long-running
+worker that keeps the county boundaries loaded across states:
+    select_daily(raw) -> renamed, selected daily table
+    shape_daily(raw, counties) -> (daily table with counties, station table)
+Running the script (python dailyClimateShaper.py [--state California]) reads the raw
+stage and writes the outputs as before.
 
 @author: dforc
 """
 
-import pandas as pd
-import geopandas as gpd
+import argparse
+import os
 import numpy as np
 
+from countyBoundaries import load_counties_for_points, join_station_counties, attach_station_counties
+from climateSchema import DAILY_SCHEMA, RAW_DAILY_SCHEMA
+from dataStore import read_stage, write_stage
+
 #######################################
 ####### !! >> Set State Here << !!
 #######################################
 myState = "California"
 
+## Also export {myState}DailyReady.csv next to the Parquet stage
+exportCSV = False
 
 
 
-## Dynamically construct the file paths for raw data
-rawDataPath = f'./Raw_Daily_Data/{myState}DailyRaw.csv'
-
-## Read the CSV data into a DataFrame
-dailyData = pd.read_csv(rawDataPath)
+## Raw stage written by dailyRawCombiner.py, county shapefile and outputs
+rawStagePath = './Raw_Daily_Data/DailyRaw'
+shapeFilePath = "./Shape_Files/tl_2019_us_county.shp"
+dailyStagePath = './Clean_Daily_Data/DailyReady'
+outputDirectory = './Clean_Daily_Data'
 
 
 
@@ -63,11 +78,7 @@ rename_dict = {
     'WDSP': 'WindSpeed'
 }
 
-
-## Rename Columns
-dailyData = dailyData.rename(columns=rename_dict)
-
-## Select columns of interest and replace -9999 with NaN
+## Columns of interest, after renaming
 columns_of_interest = ['Date', 'DewPoint', 'WeatherType', 
                        'WindGust', 'MaxTemp', 'MinTemp',
                        'MaxWindSpeed', 'Precipitation', 
@@ -76,15 +87,22 @@ columns_of_interest = ['Date', 'DewPoint', 'WeatherType',
                        'StationName',
                        'Long', 'Lat']
 
-
-dailySelect = dailyData[columns_of_interest].replace(-9999, np.nan)
+## Raw stage columns read
+raw_columns = ['STATION', *rename_dict]
 
 
-## Extract UNIQUE STATIONS
-uniqueStations = dailySelect[['STATION', 'Lat', 'Long']].drop_duplicates()
+def select_daily(raw):
+    """
+    Rename and select the columns of interest of a raw GSOD table; -9999 becomes NaN.
 
-## /////////////////////////////////////
+    Parameters:
+    - raw: DataFrame with the raw_columns of the DailyRaw stage.
 
+    Returns:
+    - DataFrame with the columns_of_interest.
+    """
+    return raw.rename(columns=rename_dict)[columns_of_interest].replace(-9999, np.nan)
+######################## End Function ########################
 
 
 
@@ -92,54 +110,69 @@ uniqueStations = dailySelect[['STATION', 'Lat', 'Long']].drop_duplicates()
 #######################################
 ####### Shapefile Processing and Mapping
 #######################################
+def shape_daily(raw, counties):
+    """
+    Shape a raw GSOD table and map its stations to counties.
 
-## Load county boundaries shapefile
-shapeFilePath = "./Shape_Files/tl_2019_us_county.shp"
-counties_sf = gpd.read_file(shapeFilePath)
-
-## Select the necessary columns and rename for clarity
-counties_sf = counties_sf[['geometry', 'STATEFP', 'COUNTYFP', 
-                           'GEOID', 'NAME', 'ALAND', 'AWATER']]
+    Parameters:
+    - raw: DataFrame with the raw_columns of the DailyRaw stage.
+    - counties: Geopandas GeoDataFrame of county boundaries (countyBoundaries.py), covering the stations.
 
-## Rename Columns of Interest
-counties_sf = counties_sf.rename(columns={'NAME': 'COUNTY', 'STATEFP': 'STATE_CODE'})
+    Returns:
+    - Tuple (daily DataFrame with COUNTY and STATE_CODE, stations DataFrame with
+      STATION, COUNTY, STATE_CODE, Lat and Long).
+    """
+    dailySelect = select_daily(raw)
 
-## Convert unique stations to a GeoDataFrame and perform a spatial join
-stations_sf = gpd.GeoDataFrame(uniqueStations, 
-                               geometry=gpd.points_from_xy(uniqueStations['Long'], uniqueStations['Lat']), 
-                               crs='EPSG:4326')
+    ## Extract UNIQUE STATIONS and perform a spatial join with the counties
+    uniqueStations = dailySelect[['STATION', 'Lat', 'Long']].drop_duplicates()
+    stations_with_county = join_station_counties(uniqueStations, counties)
 
-## Perform a spatial join between Stations and Map to Counties
-counties_sf_transformed = counties_sf.to_crs(stations_sf.crs)
-stations_with_county = gpd.sjoin(stations_sf, counties_sf_transformed, how="left")
-
-## Prepare the stations data with county and state information
-stations_with_county = stations_with_county[['STATION', 'COUNTY', 'STATE_CODE', 'Lat', 'Long']]
-
-## /////////////////////////////////////
+    ## Merge Daily Data with Spatial Data (keeping the daily Lat / Long)
+    dailyData_with_county = attach_station_counties(dailySelect, stations_with_county)
+    return dailyData_with_county, stations_with_county
+######################## End Function ########################
 
 
 
 
 #######################################
-####### Write Files
+####### Run Program
 #######################################
-
-## Construct the file paths for output
-dailyOutputPath = f'./Clean_Daily_Data/{myState}DailyReady.csv'
-stationsOutputPath = f'./Clean_Daily_Data/{myState}StationsReady.csv'
-
-## Merge Daily Data with Spatial Data
-dailyData_with_county = pd.merge(dailySelect, stations_with_county, on='STATION', 
-                                 suffixes=('_x', '_y'))
-
-## Drop the 'Lat_y' and 'Long_y' Columns (Dupes)
-dailyData_with_county.drop(columns=['Lat_y', 'Long_y'], inplace=True)
-
-## Rename Lat_x Long_x to Standard Lat/Long
-dailyData_with_county.rename(columns={'Lat_x': 'Lat', 'Long_x': 'Long'}, inplace=True)
-
-## Write the Processed Daily Data to .CSV
-dailyData_with_county.to_csv(dailyOutputPath, index=False)
-stations_with_county.to_csv(stationsOutputPath, index=False)
-
+def main(state, raw_stage=rawStagePath, shapefile_path=shapeFilePath,
+         daily_stage=dailyStagePath, output_directory=outputDirectory, export_csv=exportCSV):
+    """
+    Shape one state's raw stage into the DailyReady stage and {state}StationsReady.csv.
+    """
+    ## Read only the state's partitions and the columns of interest from the raw stage
+    dailyData = read_stage(raw_stage, RAW_DAILY_SCHEMA, state=state, columns=raw_columns)
+
+    ## Load county boundaries for the state (plus any county holding a station outside it)
+    uniqueStations = dailyData[['LONGITUDE', 'LATITUDE']].drop_duplicates().replace(-9999, np.nan)
+    counties_sf = load_counties_for_points(shapefile_path, state,
+                                           uniqueStations['LONGITUDE'], uniqueStations['LATITUDE'])
+
+    dailyData_with_county, stations_with_county = shape_daily(dailyData, counties_sf)
+
+    ## Write the Processed Daily Data to the DailyReady stage
+    dailyOutputPath = os.path.join(output_directory, f'{state}DailyReady.csv') if export_csv else None
+    write_stage(dailyData_with_county, daily_stage, state, DAILY_SCHEMA, csv_path=dailyOutputPath)
+    stations_with_county.to_csv(os.path.join(output_directory, f'{state}StationsReady.csv'), index=False)
+######################## End Function ########################
+
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shape a state's raw daily climate data into the DailyReady stage.")
+    parser.add_argument('--state', default=myState, help="State to shape")
+    parser.add_argument('--raw-stage', default=rawStagePath, help="DailyRaw stage directory")
+    parser.add_argument('--shapefile', default=shapeFilePath, help="County shapefile")
+    parser.add_argument('--stage', default=dailyStagePath, help="DailyReady stage directory")
+    parser.add_argument('--output-dir', default=outputDirectory,
+                        help="Folder of {state}StationsReady.csv and the CSV export")
+    parser.add_argument('--export-csv', action='store_true', default=exportCSV,
+                        help="Also write {state}DailyReady.csv")
+    args = parser.parse_args()
+
+    main(args.state, args.raw_stage, args.shapefile, args.stage, args.output_dir, args.export_csv)
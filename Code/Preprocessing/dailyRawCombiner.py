@@ -1,16 +1,40 @@
 # -*- coding: utf-8 -*-
 """
 This Script Combines GSOD NOAA data, which comes shipped in multiple
-files, into a single .CSV for each State selected.
+files, into a single table for each State selected, written to the
+DailyRaw Parquet stage (dataStore.py), with an optional .CSV export.
 
-User must set the State and Year Ranges of the files at the top of the script.
+Segment files ({state}DailyRaw{year_range}.csv, e.g. FloridaDailyRaw2010-2014.csv) are
+found by globbing the data folder; pass --year-ranges to use a fixed list instead.
+
+- Checks that every segment of a state has the same columns before writing anything
+- Keeps a manifest of the segments already ingested (size, mtime, SHA-256 and the
+  years each one wrote) in {stage}/State={state}/_manifest.json, and only ingests
+  new or changed segments; the files of changed or deleted segments are replaced
+  or removed. Adding a 2021 segment therefore processes one year, not eleven
+  (--rebuild ingests everything again)
+- Streams each segment in chunks of rows straight into the stage, one file per
+  segment and year ({stage}/State={state}/Year={year}/{segment}.parquet), so memory
+  is bounded by the chunk size rather than the state's data
+- Combines the states in parallel worker processes
+- Stops with a clear message when a state has no segment files
 
 Source: https://www.ncei.noaa.gov/access/metadata/landing-page/bin/iso?id=gov.noaa.ncdc:C00516
 @author: dforc
 """
 
-import pandas as pd
+import argparse
+import glob
 import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from climateSchema import RAW_DAILY_SCHEMA, iter_table
+from dataStore import StageWriter, clear_state, export_stage_csv
+from fileManifest import file_fingerprint, is_unchanged, load_manifest, save_manifest
 
 #######################################
 ####### !! >> Set State Here << !!
@@ -20,37 +44,214 @@ states = ['Florida', 'California']
 #######################################
 ####### !! >> Define Year Ranges of Files << !!
 #######################################
-year_ranges = ['2010-2014', '2015-2018', '2019-2020']  ## Update or add ranges as needed
+year_ranges = None  ## None finds every {state}DailyRaw{year_range}.csv; or e.g. ['2010-2014', '2015-2018']
+
+## Parquet stage read by dailyClimateShaper.py; set exportCSV to also write {state}DailyRaw.csv
+stagePath = './DailyRaw'
+exportCSV = False
+
+## Rows read and written at a time
+chunkSize = 500_000
 
 
 #######################################
-## Combine Segemented Raw Years into Single .CSV
+## Find and Check Segment Files
 #######################################
+def segment_files(state, year_ranges, data_dir='.'):
+    """
+    List a state's raw segment files, in year range order.
 
-## Loop through each state
-for state in states:
-    ## Initialize an empty list to store DataFrames for the current state
-    dataframes = []
+    Parameters:
+    - state: String, state name.
+    - year_ranges: List of strings, e.g. ['2010-2014', '2015-2018'].
+    - data_dir: String, folder holding the {state}DailyRaw{year_range}.csv files.
 
-    ## Loop through each year range
+    Returns:
+    - List of the paths that exist; missing ones are reported and skipped.
+    """
+    file_names = []
     for year_range in year_ranges:
         ## Generate the file name based on the state and year range
-        file_name = f'{state}DailyRaw{year_range}.csv'
-        
+        file_name = os.path.join(data_dir, f'{state}DailyRaw{year_range}.csv')
+
         ## Check if the file exists before reading
         if os.path.exists(file_name):
-            ## Read the CSV file into a DataFrame
-            df = pd.read_csv(file_name)
-            
-            ## Append the DataFrame to the list
-            dataframes.append(df)
+            file_names.append(file_name)
         else:
             ## Print a message if the file is not found
             print(f'File not found: {file_name}')
+    return file_names
+
+
+def discover_segments(state, data_dir='.'):
+    """
+    Find all of a state's raw segment files, {state}DailyRaw{YYYY}.csv or {state}DailyRaw{YYYY-YYYY}.csv.
+
+    Parameters:
+    - state: String, state name.
+    - data_dir: String, folder holding the segment files.
+
+    Returns:
+    - List of paths ordered by first year (the combined {state}DailyRaw.csv export is not a segment).
+    """
+    pattern = re.compile(rf'{re.escape(state)}DailyRaw(\d{{4}})(?:-(\d{{4}}))?\.csv$')
+    segments = []
+    for file_name in glob.glob(os.path.join(glob.escape(data_dir), f'{glob.escape(state)}DailyRaw*.csv')):
+        match = pattern.match(os.path.basename(file_name))
+        if match:
+            segments.append((int(match.group(1)), file_name))
+    return [file_name for _, file_name in sorted(segments)]
+
+
+def check_headers(file_names):
+    """
+    Check that all segment files have the same columns (in any order).
+
+    Parameters:
+    - file_names: List of CSV paths.
+
+    Returns:
+    - List of the column names, in the order of the first file.
+    """
+    columns = list(pd.read_csv(file_names[0], nrows=0).columns)
+    missing_key = [c for c in ['STATION', 'DATE'] if c not in columns]
+    if missing_key:
+        raise ValueError(f"{file_names[0]} has no {', '.join(missing_key)} column")
+
+    for file_name in file_names[1:]:
+        other = list(pd.read_csv(file_name, nrows=0).columns)
+        if set(other) != set(columns):
+            raise ValueError(f"{file_name} does not match the columns of {file_names[0]}: "
+                             f"missing {sorted(set(columns) - set(other))}, "
+                             f"extra {sorted(set(other) - set(columns))}")
+    return columns
+######################## End Function ########################
+
+
+
+
+#######################################
+## Combine Segmented Raw Years into the Stage
+#######################################
+def manifest_path(stage_path, state):
+    return os.path.join(stage_path, f'State={state}', '_manifest.json')
+
+
+def remove_segment(stage_path, state, segment, entry):
+    ## Delete the files a segment wrote (listed by year in its manifest entry)
+    for year in entry['years']:
+        year_path = os.path.join(stage_path, f'State={state}', f'Year={year}', f'{segment}.parquet')
+        if os.path.exists(year_path):
+            os.remove(year_path)
+            if not os.listdir(os.path.dirname(year_path)):
+                os.rmdir(os.path.dirname(year_path))
+
+
+def ingest_segment(file_name, stage_path, state, columns, chunksize):
+    """
+    Stream one segment file into the stage as {stage}/State={state}/Year={year}/{segment}.parquet.
+
+    Returns:
+    - Manifest entry: the file's fingerprint plus the years and number of rows written.
+    """
+    fingerprint = file_fingerprint(file_name)
+    segment = os.path.splitext(os.path.basename(file_name))[0]
+    with StageWriter(stage_path, state, RAW_DAILY_SCHEMA, basename=segment) as writer:
+        for chunk in iter_table(file_name, RAW_DAILY_SCHEMA, chunksize):
+            writer.write(chunk[columns])
+    return {**fingerprint, 'years': writer.years, 'rows': writer.rows}
+
+
+def combine_state(state, stage_path, data_dir='.', year_ranges=None, export_csv=False,
+                  chunksize=500_000, rebuild=False):
+    """
+    Bring one state's DailyRaw stage up to date with its segment files.
+
+    Parameters:
+    - state: String, state name.
+    - stage_path: String, DailyRaw stage directory.
+    - data_dir: String, folder of the segment files (and of the CSV export).
+    - year_ranges: List of strings, optional; only these segments (no discovery, and
+      segments missing from the list are left in the stage).
+    - export_csv: Boolean, also write {state}DailyRaw.csv from the updated stage.
+    - chunksize: Integer, rows held in memory at a time.
+    - rebuild: Boolean, ignore the manifest and ingest every segment again.
+
+    Returns:
+    - Tuple (state, number of segments ingested, number of segments unchanged, rows ingested).
+    """
+    if year_ranges:
+        file_names = segment_files(state, year_ranges, data_dir)
+    else:
+        file_names = discover_segments(state, data_dir)
+    if not file_names:
+        raise FileNotFoundError(f"no {state}DailyRaw{{year_range}}.csv files in {os.path.abspath(data_dir)}"
+                                + (f" for year ranges {', '.join(year_ranges)}" if year_ranges else ""))
+    columns = check_headers(file_names)
+
+    ## Without a manifest the state's partitions cannot be matched to segments, so start over
+    if rebuild or not os.path.exists(manifest_path(stage_path, state)):
+        clear_state(stage_path, state)
+    manifest = load_manifest(manifest_path(stage_path, state))
+    segments = {os.path.splitext(os.path.basename(f))[0]: f for f in file_names}
+
+    ## Segments deleted from the data folder are removed from the stage (discovery only)
+    if not year_ranges:
+        for segment in [s for s in manifest if s not in segments]:
+            print(f"{state}: removing {segment} (file deleted)")
+            remove_segment(stage_path, state, segment, manifest.pop(segment))
+            save_manifest(manifest_path(stage_path, state), manifest)
+
+    ingested, unchanged, rows = 0, 0, 0
+    for segment, file_name in segments.items():
+        if is_unchanged(file_name, manifest.get(segment)):
+            unchanged += 1
+            continue
+        if segment in manifest:
+            remove_segment(stage_path, state, segment, manifest.pop(segment))
+        manifest[segment] = ingest_segment(file_name, stage_path, state, columns, chunksize)
+        ## Saved after every segment, so an interrupted run keeps what it finished
+        save_manifest(manifest_path(stage_path, state), manifest)
+        ingested += 1
+        rows += manifest[segment]['rows']
+        print(f"{state}: {segment} -> years {manifest[segment]['years'][0]}-{manifest[segment]['years'][-1]}")
+
+    if export_csv:
+        export_stage_csv(stage_path, state, RAW_DAILY_SCHEMA, os.path.join(data_dir, f'{state}DailyRaw.csv'))
+    return state, ingested, unchanged, rows
+######################## End Function ########################
+
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Combine GSOD segment files into the DailyRaw stage.")
+    parser.add_argument('--states', nargs='+', default=states, help="States to combine")
+    parser.add_argument('--year-ranges', nargs='+', default=year_ranges,
+                        help="Year ranges of the {state}DailyRaw{year_range}.csv files (default: all found)")
+    parser.add_argument('--data-dir', default='.', help="Folder holding the segment files")
+    parser.add_argument('--stage', default=stagePath, help="DailyRaw stage directory")
+    parser.add_argument('--export-csv', action='store_true', default=exportCSV,
+                        help="Also write {state}DailyRaw.csv")
+    parser.add_argument('--chunk-size', type=int, default=chunkSize, help="Rows read and written at a time")
+    parser.add_argument('--rebuild', action='store_true', help="Ingest every segment, ignoring the manifest")
+    parser.add_argument('--workers', type=int, default=len(states), help="States combined in parallel")
+    args = parser.parse_args()
 
-    ## Combine all DataFrames for the current state into a single DataFrame
-    combined_df = pd.concat(dataframes, ignore_index=True)
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(combine_state, state, args.stage, args.data_dir, args.year_ranges,
+                               args.export_csv, args.chunk_size, args.rebuild): state
+                   for state in args.states}
+        for future in as_completed(futures):
+            state = futures[future]
+            try:
+                state, n_ingested, n_unchanged, n_rows = future.result()
+            except (FileNotFoundError, ValueError) as e:
+                print(f"Failed {state}: {e}")
+                failed.append(state)
+                continue
+            print(f"{state}: {n_rows:,d} rows from {n_ingested} new or changed segments, {n_unchanged} unchanged")
 
-    ## Write the combined DataFrame for the current state to a new CSV file
-    output_file_name = f'{state}DailyRaw.csv'  ## Generate output file name based on the state
-    combined_df.to_csv(output_file_name, index=False)
\ No newline at end of file
+    if failed:
+        sys.exit(f"No DailyRaw stage written for: {', '.join(failed)}")
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Parquet Stage Store \\\\\\\\\\
+
+Storage layer for the tables handed from one climate pipeline stage to the next:
+
+    dailyRawCombiner.py         -> DailyRaw
+    dailyClimateShaper.py       -> DailyReady
+    dailyClimateBasicCleaner.py -> DailyCleaned
+    normalsCountyConverter.py   -> NormalsReady
+    climateTotalMerge.py        -> Combined_Daily_Normals
+    combinedDiagnosticImpute.py -> Imputed_Combined_Daily_Normals
+
+Each stage is a Parquet dataset directory partitioned by state and year
+(hive layout, zstd compressed):
+
+    {stage}/State={state}/Year={year}/part-0.parquet
+
+Tables without a date column (the normals) are partitioned by state only. Rows are
+sorted by station and date before writing, so the row group statistics let a reader
+skip row groups by station as well as whole partitions by state and year.
+
+write_stage replaces only the partitions it writes (other states and years are kept)
+and can also export the table as CSV, the format the stages used to exchange.
+StageWriter streams a table too large to hold in memory into a stage chunk by chunk,
+each chunk becoming a row group of its year's file, and export_stage_csv streams a
+stage back out to CSV.
+read_stage reads a subset of columns and partitions, with the column types of a
+climateSchema.py schema.
+
+@author: dforc
+"""
+
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from climateSchema import DATETIME, enforce_schema, write_table
+
+
+#######################################
+####### Store Settings
+#######################################
+PARTITION_SCHEMA = {'State': 'category', 'Year': 'int32'}
+COMPRESSION = 'zstd'
+ROW_GROUP_SIZE = 256_000      ## Rows per row group (pruning granularity)
+
+
+## Date column of a schema (Date / DATE), or None for tables keyed by month-day
+def _date_column(df, schema):
+    return next((c for c, t in schema.items() if t == DATETIME and c in df.columns), None)
+
+
+#######################################
+####### Write Stage
+#######################################
+def write_stage(df, stage_path, state, schema, csv_path=None):
+    """
+    Write one state's table to a stage dataset, replacing that state's existing partitions.
+
+    Parameters:
+    - df: DataFrame to write.
+    - stage_path: String, stage dataset directory (e.g. './Clean_Daily_Data/DailyCleaned').
+    - state: String, state name written as the State partition.
+    - schema: Dictionary of column name -> dtype (climateSchema.py).
+    - csv_path: String, optional; also export the table to this CSV (write_table).
+    """
+    df = enforce_schema(df, schema)
+    date_column = _date_column(df, schema)
+
+    partition_columns = {'State': state}
+    if date_column is not None:
+        partition_columns['Year'] = df[date_column].dt.year.astype('int32')
+    station_column = next((c for c in ['STATION', 'DailyStation'] if c in df.columns), None)
+    sort_columns = [c for c in [station_column, date_column or 'DATE'] if c in df.columns]
+
+    table = pa.Table.from_pandas(df.assign(**partition_columns).sort_values(sort_columns, kind='stable'),
+                                 preserve_index=False)
+    ## delete_matching only replaces the Year folders being written; a year no longer
+    ## in df would otherwise survive from the last run
+    clear_state(stage_path, state)
+    pq.write_to_dataset(table, stage_path,
+                        partition_cols=list(partition_columns),
+                        existing_data_behavior='delete_matching',
+                        basename_template='part-{i}.parquet',
+                        compression=COMPRESSION,
+                        max_rows_per_group=ROW_GROUP_SIZE)
+
+    if csv_path is not None:
+        write_table(df, csv_path, schema)
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Stream Stage
+#######################################
+class StageWriter:
+    """
+    Stream rows of one state into a stage, one chunk at a time.
+
+    Each write adds one row group per year to {stage}/State={state}/Year={year}/{basename}.parquet,
+    so memory is bounded by the chunk size and rows keep their input order. Files of
+    other basenames in the same partitions are left alone, so several sources (e.g. one
+    per raw segment file) can feed one stage. If the writer is left through an
+    exception, the files it created are removed again.
+
+    Parameters:
+    - stage_path: String, stage dataset directory.
+    - state: String, state name written as the State partition.
+    - schema: Dictionary of column name -> dtype (climateSchema.py); must declare a date column.
+    - basename: String, file name (without .parquet) written in each year partition.
+    """
+
+    def __init__(self, stage_path, state, schema, basename='part-0'):
+        self.state_path = os.path.join(stage_path, f'State={state}')
+        self.schema = schema
+        self.basename = basename
+        self.arrow_schema = None
+        self.writers = {}
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        if exc_type is not None:
+            for year in self.years:
+                os.remove(self.year_path(year))
+
+    def year_path(self, year):
+        return os.path.join(self.state_path, f'Year={year}', f'{self.basename}.parquet')
+
+    @property
+    def years(self):
+        """Years written so far, in order."""
+        return sorted(self.writers)
+
+    def _writer(self, year):
+        if year not in self.writers:
+            output_path = self.year_path(year)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            self.writers[year] = pq.ParquetWriter(output_path, self.arrow_schema, compression=COMPRESSION)
+        return self.writers[year]
+
+    def write(self, df):
+        """
+        Append a chunk of rows (any years) to the state's partitions.
+        """
+        df = enforce_schema(df, self.schema)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.arrow_schema is None:
+            ## Every chunk must share the first chunk's file schema; categories may differ
+            ## from chunk to chunk, so dictionaries get a fixed index width and string values
+            self.arrow_schema = pa.schema([
+                field.with_type(pa.dictionary(pa.int32(), pa.string()))
+                if pa.types.is_dictionary(field.type) else field
+                for field in table.schema]).remove_metadata()
+        table = table.cast(self.arrow_schema)
+
+        years = df[_date_column(df, self.schema)].dt.year.to_numpy()
+        for year in pd.unique(years):
+            self._writer(int(year)).write_table(table.filter(pa.array(years == year)))
+        self.rows += len(df)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Read Stage
+#######################################
+def read_stage(stage_path, schema, state=None, years=None, columns=None, filters=None):
+    """
+    Read a stage dataset, pruning partitions, row groups and columns.
+
+    Parameters:
+    - stage_path: String, stage dataset directory.
+    - schema: Dictionary of column name -> dtype (climateSchema.py).
+    - state: String, optional; only read this state's partition.
+    - years: List of integers, optional; only read these Year partitions.
+    - columns: List of strings, optional; only read these columns.
+    - filters: List of (column, op, value) tuples, optional; further row filters
+      (e.g. [('STATION', 'in', ids)]), also used to skip row groups.
+
+    Returns:
+    - DataFrame with the schema's types; the State / Year partition columns are only
+      included when asked for in columns.
+    """
+    predicates = list(filters or [])
+    if state is not None:
+        predicates.append(('State', '==', state))
+    if years is not None:
+        predicates.append(('Year', 'in', [int(year) for year in years]))
+
+    df = pq.read_table(stage_path, columns=columns, filters=predicates or None).to_pandas()
+
+    partitions = [c for c in PARTITION_SCHEMA if c in df.columns and (columns is None or c not in columns)]
+    return enforce_schema(df.drop(columns=partitions), {**schema, **PARTITION_SCHEMA})
+######################## End Function ########################
+
+
+def clear_state(stage_path, state):
+    """
+    Remove all of one state's partitions (and files) from a stage.
+    """
+    shutil.rmtree(os.path.join(stage_path, f'State={state}'), ignore_errors=True)
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Export Stage
+#######################################
+def export_stage_csv(stage_path, state, schema, csv_path, batch_size=500_000, mode='w'):
+    """
+    Write one state's rows of a stage to CSV, batch by batch (bounded memory).
+
+    Parameters:
+    - stage_path: String, stage dataset directory.
+    - state: String, state partition to export.
+    - schema: Dictionary of column name -> dtype (climateSchema.py).
+    - csv_path: String, output CSV path.
+    - batch_size: Integer, rows converted at a time.
+    - mode: String, 'w' to replace the CSV or 'a' to append to it (without a header).
+
+    Returns:
+    - Number of rows written.
+    """
+    dataset = ds.dataset(stage_path, format='parquet', partitioning='hive')
+    columns = [name for name in dataset.schema.names if name not in PARTITION_SCHEMA]
+    rows = 0
+    for batch in dataset.to_batches(columns=columns, filter=ds.field('State') == state, batch_size=batch_size):
+        if batch.num_rows:
+            write_table(batch.to_pandas(), csv_path, schema, mode=mode if rows == 0 else 'a')
+            rows += batch.num_rows
+    return rows
+######################## End Function ########################
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+////////// File Manifest \\\\\\\\\\
+
+Records the size, modification time and content hash of input files, so a stage can
+tell which of its inputs are new or changed since its last run.
+
+- file_fingerprint: size, mtime and SHA-256 of one file
+- is_unchanged: compare a file with its manifest entry; the hash is only computed
+  when size or mtime differ, so unchanged inputs cost one stat call
+- load_manifest / save_manifest: JSON manifest of file name -> entry (a missing
+  manifest is empty; saving replaces the file atomically)
+
+Used by dailyRawCombiner.py for incremental ingestion of GSOD segment files.
+
+@author: dforc
+"""
+
+import hashlib
+import json
+import os
+
+
+#######################################
+####### Fingerprints
+#######################################
+def file_hash(path, block_size=1 << 20):
+    """
+    SHA-256 of a file's contents, read in blocks.
+
+    Parameters:
+    - path: String, file to hash.
+    - block_size: Integer, bytes read at a time.
+
+    Returns:
+    - Hex digest string.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """
+    Size, modification time (ns) and SHA-256 of a file.
+
+    Returns:
+    - Dictionary with 'size', 'mtime_ns' and 'sha256'.
+    """
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_hash(path)}
+
+
+def is_unchanged(path, entry):
+    """
+    Check a file against its manifest entry.
+
+    Parameters:
+    - path: String, file to check.
+    - entry: Dictionary from file_fingerprint (plus any other keys), or None.
+
+    Returns:
+    - True if the file has the recorded size and either the recorded mtime or the
+      recorded content hash (a touched but identical file counts as unchanged).
+    """
+    if entry is None:
+        return False
+    stat = os.stat(path)
+    if stat.st_size != entry['size']:
+        return False
+    return stat.st_mtime_ns == entry['mtime_ns'] or file_hash(path) == entry['sha256']
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Manifest File
+#######################################
+def load_manifest(manifest_path):
+    """
+    Read a JSON manifest; a missing manifest is an empty one.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest_path, manifest):
+    """
+    Write a JSON manifest, replacing the previous one only once it is fully written.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    temp_path = f'{manifest_path}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+######################## End Function ########################
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Imputation Diagnostic Plots \\\\\\\\\\
+
+Missing data and before / after imputation plots for combinedDiagnosticImpute.py.
+Imported only when the script is run with --plots or --plot-dir, so headless runs
+need no matplotlib.
+
+The plots used to draw every row of the table: msno.matrix over the whole frame three
+times, Date vs value line plots of all stations with a marker per point, and seaborn
+histograms / boxplots (with KDEs) over every value. On the full table that took many
+minutes and gigabytes. Each plot now draws a small summary computed in one pass:
+
+- plot_missing: share of missing values per column and month, and the correlation of
+  missingness between columns (np.corrcoef of the isna mask)
+- plot_station_missing: share of missing values per station and column, all stations
+  in one heatmap
+- plot_missing_matrix: share of missing values per column and month only
+- plot_imputation: daily min / mean / max bands across stations before and after
+  imputation, a stratified sample of the imputed values, histograms over shared
+  precomputed bins (histogram_bins) and boxplots from precomputed quartiles
+
+With plot_dir set, figures are written there as PNG files and closed (use the Agg
+backend, as combinedDiagnosticImpute.py --plot-dir does); otherwise they are shown.
+
+@author: dforc
+"""
+
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+# =============================================================================
+# Summaries
+# =============================================================================
+def finish(fig, name, plot_dir=None):
+    '''
+    Save a figure as {plot_dir}/{name}.png and close it, or show it without plot_dir.
+    '''
+    if plot_dir is None:
+        plt.show()
+        return
+    os.makedirs(plot_dir, exist_ok=True)
+    fig.savefig(os.path.join(plot_dir, f'{name}.png'), dpi=100)
+    plt.close(fig)
+
+
+def stratified_sample(df, n_rows=20_000, by='DailyStation', seed=0):
+    '''
+    About n_rows rows drawn evenly from every station (all rows if there are fewer).
+    '''
+    if len(df) <= n_rows:
+        return df
+    return df.groupby(by, observed=True, group_keys=False).sample(frac=n_rows / len(df), random_state=seed)
+
+
+def monthly_missing(df):
+    '''
+    Share of missing values per month (rows) and column (columns).
+    '''
+    dates = df['Date']
+    month = (dates.dt.year * 100 + dates.dt.month).to_numpy()   ## e.g. 201001, grouped as integers
+    missing = df.drop(columns=['Date']).isna().groupby(month).mean()
+    missing.index = [f'{m // 100}-{m % 100:02d}' for m in missing.index]
+    return missing
+
+
+def daily_bands(df, column):
+    '''
+    Daily min, mean and max of a column across stations, one row per date.
+    '''
+    return df.groupby('Date')[column].agg(['min', 'mean', 'max'])
+
+
+def histogram_bins(original, imputed, columns, bins=50):
+    '''
+    Histogram counts of each column before and after imputation over shared bins.
+
+    Returns:
+    - Dictionary of column -> (edges, counts before, counts after).
+    '''
+    histograms = {}
+    for column in columns:
+        before = original[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        after = imputed[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        low, high = np.nanmin(after), np.nanmax(after)
+        if not np.isfinite(low) or low == high:
+            low, high = (0.0, 1.0) if not np.isfinite(low) else (low - 0.5, high + 0.5)
+        edges = np.linspace(low, high, bins + 1)
+        histograms[column] = (edges,
+                              np.histogram(before[~np.isnan(before)], edges)[0],
+                              np.histogram(after[~np.isnan(after)], edges)[0])
+    return histograms
+
+
+def box_stats(values, label):
+    '''
+    Boxplot statistics (quartiles, median and 1.5 IQR whiskers) for Axes.bxp.
+    '''
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        values = np.zeros(1)
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    return {'label': label, 'q1': q1, 'med': median, 'q3': q3,
+            'whislo': max(values.min(), q1 - 1.5 * iqr), 'whishi': min(values.max(), q3 + 1.5 * iqr)}
+
+
+# =============================================================================
+# Diagnostic Plots
+# =============================================================================
+def plot_missing_matrix(df, plot_dir=None, name='missing_matrix'):
+    '''
+    Heatmap of the share of missing values per column and month.
+    '''
+    missing = monthly_missing(df)
+    fig, ax = plt.subplots(figsize=(14, 6))
+    image = ax.imshow(missing.T.to_numpy(dtype=np.float64), aspect='auto', cmap='Greys', vmin=0, vmax=1,
+                      interpolation='nearest')
+    ax.set_yticks(range(len(missing.columns)), missing.columns)
+    ticks = np.arange(0, len(missing), 12)
+    ax.set_xticks(ticks, missing.index[ticks], rotation=90)
+    ax.set_title('Missing Data by Month')
+    fig.colorbar(image, ax=ax, label='Share missing')
+    fig.tight_layout()
+    finish(fig, name, plot_dir)
+
+
+def plot_missing(df, plot_dir=None):
+    '''
+    Missing data matrix (by month) and missingness correlation heatmap of a table
+    (the heatmap only with at least two partly missing columns).
+    '''
+    ## Matrix plot to visualize missing data
+    plot_missing_matrix(df, plot_dir, 'missing_matrix_all')
+
+    ## Heatmap to show correlations of missingness between columns that have missing values
+    missing = df.isna()
+    missing = missing.loc[:, missing.any() & ~missing.all()]
+    if missing.shape[1] < 2:
+        return   ## No pair of partly missing columns to correlate
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = np.corrcoef(missing.to_numpy(dtype=np.float32), rowvar=False).reshape(missing.shape[1], -1)
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    image = ax.imshow(correlation, cmap='RdBu', vmin=-1, vmax=1)
+    ax.set_xticks(range(missing.shape[1]), missing.columns, rotation=90)
+    ax.set_yticks(range(missing.shape[1]), missing.columns)
+    ax.set_title('Missing Data Heatmap')
+    fig.colorbar(image, ax=ax, label='Missingness correlation')
+    fig.tight_layout()
+    finish(fig, 'missing_heatmap', plot_dir)
+
+
+def plot_station_missing(df, plot_dir=None):
+    '''
+    Heatmap of the share of missing values per station and column, all stations at once.
+    '''
+    missing = df.drop(columns=['Date']).isna().groupby(df['DailyStationName'], observed=True).mean()
+    fig, ax = plt.subplots(figsize=(12, max(4, len(missing) * 0.12)))
+    image = ax.imshow(missing.to_numpy(dtype=np.float64), aspect='auto', cmap='Greys', vmin=0, vmax=1,
+                      interpolation='nearest')
+    ax.set_xticks(range(missing.shape[1]), missing.columns, rotation=90)
+    ax.set_yticks(range(len(missing)), missing.index, fontsize=6)
+    ax.set_title('Missing Data by Station')
+    fig.colorbar(image, ax=ax, label='Share missing')
+    fig.tight_layout()
+    finish(fig, 'missing_by_station', plot_dir)
+
+
+def plot_imputation(original, imputed, columns, plot_dir=None, sample_rows=20_000):
+    '''
+    Daily bands, histograms and boxplots of each column before and after imputation
+    (original and imputed in the same row order, as returned by impute).
+    '''
+    fig, axes = plt.subplots(len(columns), 4, figsize=(20, len(columns) * 5), squeeze=False)
+    histograms = histogram_bins(original, imputed, columns)
+
+    for i, column in enumerate(columns):
+        before = daily_bands(original, column)
+        after = daily_bands(imputed, column)
+
+        ## Before Imputation: daily min / max band across stations and daily mean
+        axes[i, 0].fill_between(before.index, before['min'], before['max'], alpha=0.3, label='Daily min - max')
+        axes[i, 0].plot(before.index, before['mean'], linewidth=0.8, label='Daily mean')
+        axes[i, 0].set_title(f'Original {column}')
+        axes[i, 0].set_ylabel(column)
+
+        ## After Imputation, with a stratified sample of the imputed values
+        axes[i, 1].fill_between(after.index, after['min'], after['max'], alpha=0.3, color='orange',
+                                label='Daily min - max')
+        axes[i, 1].plot(after.index, after['mean'], linewidth=0.8, color='orange', label='Daily mean')
+        was_missing = original[column].isna().to_numpy() & imputed[column].notna().to_numpy()
+        points = stratified_sample(imputed[was_missing], sample_rows)
+        axes[i, 1].scatter(points['Date'], points[column], s=2, color='red', label='Imputed Values', zorder=5)
+        axes[i, 1].set_title(f'Imputed {column}')
+
+        ## Histograms over shared bins and boxplots from quartiles, before and after
+        edges, counts_before, counts_after = histograms[column]
+        axes[i, 2].stairs(counts_before, edges, label='Before')
+        axes[i, 2].stairs(counts_after, edges, color='orange', label='After')
+        axes[i, 2].set_title(f'Histogram Before / After Imputation: {column}')
+        axes[i, 3].bxp([box_stats(original[column].to_numpy(dtype=np.float64, na_value=np.nan), 'Before'),
+                        box_stats(imputed[column].to_numpy(dtype=np.float64, na_value=np.nan), 'After')],
+                       showfliers=False)
+        axes[i, 3].set_title(f'Boxplot Before / After Imputation: {column}')
+
+    axes[0, 0].legend()
+    axes[0, 1].legend()
+    axes[0, 2].legend()
+
+    fig.tight_layout()
+    finish(fig, 'imputation', plot_dir)
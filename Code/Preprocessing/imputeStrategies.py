@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Imputation Strategies \\\\\\\\\\
+
+Gap filling strategies for combinedDiagnosticImpute.py, selectable per column.
+
+Every strategy is a kernel over the same station-partitioned NumPy arrays
+(StationArrays: the combined table sorted by station and date, with integer station
+codes, day numbers and station coordinates) and fills a whole batch of columns at once:
+
+    kernel(arrays, columns, values, **options) -> filled values
+
+- values: 2-D float64 array (rows x columns), NaN where missing
+- returns an array shaped like values, present values unchanged, NaN where the
+  strategy has nothing to fill with
+
+Strategies (STRATEGIES):
+
+- rolling_mean:    centred 6 calendar day mean of the station's own values (rollingImpute.py)
+- linear:          linear interpolation in time between the station's values either side
+                   of a gap (pandas interpolate(method='time', limit_area='inside'))
+- seasonal_normal: the merged 30 year normal (normalMaxTemp, ...) of the row's normals
+                   station and day; columns without a normal, and rows whose normal is
+                   missing, take the station's own mean for that month and day
+- neighbor:        the same day's value of the nearest station that has one (up to
+                   k=3 nearest, great-circle distance, nearestStation.py)
+- idw:             the inverse distance weighted mean of the same day's values of the
+                   k=5 nearest stations (station_graph), for all days and stations at
+                   once as one sparse graph x dense station-by-day product
+
+impute_strategies(df, strategies) runs each strategy once over all of its columns.
+
+@author: dforc
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from nearestStation import NearestStations
+from rollingImpute import calendar_mean_fill
+
+
+## Merged normal column of a daily column (climateTotalMerge.py output), for seasonal_normal
+NORMAL_COLUMNS = {
+    'MaxTemp': 'normalMaxTemp',
+    'MinTemp': 'normalMinTemp',
+    'AvgTemp': 'normalAvgTemp',
+}
+
+
+#######################################
+####### Station Arrays
+#######################################
+class StationArrays:
+    """
+    A combined table sorted by station and date, as the arrays the strategies share.
+
+    Parameters:
+    - df: DataFrame with DailyStation and Date (and DailyLong / DailyLat for neighbor and idw),
+      sorted by DailyStation and Date.
+
+    Attributes:
+    - frame: The DataFrame itself, for columns a strategy reads (e.g. the normals).
+    - stations: Integer station code per row (-1 without a station).
+    - dates: datetime64[D] date per row.
+    - longitudes, latitudes: Coordinates per station code (None without DailyLong / DailyLat).
+    """
+    def __init__(self, df):
+        self.frame = df
+        self._graphs = {}
+        self.stations, _ = pd.factorize(df['DailyStation'])
+        self.dates = df['Date'].to_numpy(dtype='datetime64[D]')
+        self.n_stations = int(self.stations.max()) + 1 if len(df) else 0
+
+        self.longitudes = self.latitudes = None
+        if {'DailyLong', 'DailyLat'} <= set(df.columns):
+            first = np.unique(self.stations[self.stations >= 0], return_index=True)[1]
+            rows = np.flatnonzero(self.stations >= 0)[first]
+            self.longitudes = df['DailyLong'].to_numpy(dtype=np.float64)[rows]
+            self.latitudes = df['DailyLat'].to_numpy(dtype=np.float64)[rows]
+
+    def column(self, name):
+        """One column of the table as a float64 array, NaN where missing."""
+        return self.frame[name].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    def station_graph(self, k=5, power=2):
+        """station_graph of these stations, built once per (k, power)."""
+        if (k, power) not in self._graphs:
+            self._graphs[k, power] = station_graph(self, k, power)
+        return self._graphs[k, power]
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Rolling Mean
+#######################################
+def fill_rolling_mean(arrays, columns, values, window=6, workers=1, **options):
+    """
+    Centred window mean over the station's calendar days (rollingImpute.calendar_mean_fill).
+    """
+    return calendar_mean_fill(values, arrays.stations, arrays.dates, window, workers=workers)
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Linear Interpolation
+#######################################
+def fill_linear(arrays, columns, values, **options):
+    """
+    Linear interpolation in time between the last value before and the first value after
+    each gap of the same station. Gaps at the start or end of a station stay missing.
+    """
+    n_rows = len(values)
+    present = ~np.isnan(values)
+    rows = np.arange(n_rows)[:, None]
+
+    ## Last present row at or before each row, and first present row at or after it
+    before = np.maximum.accumulate(np.where(present, rows, -1), axis=0)
+    after = np.minimum.accumulate(np.where(present, rows, n_rows)[::-1], axis=0)[::-1]
+
+    inside = ~present & (before >= 0) & (after < n_rows) & (arrays.stations[:, None] >= 0)
+    row, column = np.nonzero(inside)
+    start, end = before[row, column], after[row, column]
+    inside_station = (arrays.stations[start] == arrays.stations[row]) & (arrays.stations[end] == arrays.stations[row])
+    row, column, start, end = row[inside_station], column[inside_station], start[inside_station], end[inside_station]
+
+    days = arrays.dates.astype(np.int64)
+    span = days[end] - days[start]
+    fraction = np.divide(days[row] - days[start], span, out=np.zeros(len(row)), where=span > 0)
+
+    filled = values.copy()
+    filled[row, column] = values[start, column] + fraction * (values[end, column] - values[start, column])
+    return filled
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Seasonal Normal
+#######################################
+def station_day_means(arrays, values):
+    """
+    Mean of each station's values for each month and day, over all its years.
+
+    Returns:
+    - float64 array shaped like values, each row's station / month-day mean (NaN without values).
+    """
+    dates = pd.DatetimeIndex(arrays.dates)
+    month = dates.month.to_numpy(dtype=np.int64, na_value=1)   ## NaT dates are not placed
+    day = dates.day.to_numpy(dtype=np.int64, na_value=1)
+    keys = arrays.stations.astype(np.int64) * 372 + (month - 1) * 31 + day - 1
+    placed = (arrays.stations >= 0) & ~np.isnat(arrays.dates)
+    keys = np.where(placed, keys, 0)
+
+    present = ~np.isnan(values) & placed[:, None]
+    n_keys = max(arrays.n_stations, 1) * 372
+    means = np.full(values.shape, np.nan)
+    for i in range(values.shape[1]):
+        total = np.bincount(keys, weights=np.where(present[:, i], values[:, i], 0.0), minlength=n_keys)
+        count = np.bincount(keys, weights=present[:, i], minlength=n_keys)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means[:, i] = np.where(placed, (total / count)[keys], np.nan)
+    return means
+
+
+def fill_seasonal_normal(arrays, columns, values, **options):
+    """
+    The row's merged normal (NORMAL_COLUMNS), else the station's own month-day mean.
+    """
+    seasonal = station_day_means(arrays, values)
+    for i, column in enumerate(columns):
+        if NORMAL_COLUMNS.get(column) in arrays.frame.columns:
+            normal = arrays.column(NORMAL_COLUMNS[column])
+            seasonal[:, i] = np.where(np.isnan(normal), seasonal[:, i], normal)
+    return np.where(np.isnan(values), seasonal, values)
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Nearest Neighbor Station
+#######################################
+def station_day_grid(arrays, values):
+    """
+    Values laid out as a dense day x station grid (mean of rows sharing a station and day).
+
+    Returns:
+    - Tuple (grid, day): grid is (days x stations x columns), NaN where a station has no
+      value that day; day is each row's day index into the grid (-1 where not placed).
+    """
+    placed = (arrays.stations >= 0) & ~np.isnat(arrays.dates)
+    days = arrays.dates.astype(np.int64)
+    first = days[placed].min() if placed.any() else 0
+    n_days = int(days[placed].max() - first + 1) if placed.any() else 0
+    day = np.where(placed, days - first, -1)
+
+    cells = n_days * arrays.n_stations
+    cell = np.where(placed, day * arrays.n_stations + arrays.stations, 0)
+    present = ~np.isnan(values) & placed[:, None]
+    grid = np.full((cells, values.shape[1]), np.nan)
+    for i in range(values.shape[1]):
+        total = np.bincount(cell, weights=np.where(present[:, i], values[:, i], 0.0), minlength=cells)
+        count = np.bincount(cell, weights=present[:, i], minlength=cells)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grid[:, i] = total / count
+    return grid.reshape(n_days, arrays.n_stations, values.shape[1]), day
+
+
+def nearest_other_stations(arrays, k):
+    """
+    The k nearest other stations of each station, closest first (k is capped at the
+    number of other stations).
+
+    Returns:
+    - Tuple (neighbors, distances): (stations x k) arrays of station codes and meters.
+    """
+    k = min(k, arrays.n_stations - 1)
+    neighbors, distances = NearestStations(arrays.longitudes, arrays.latitudes).query(
+        arrays.longitudes, arrays.latitudes, k=k + 1)
+    neighbors = neighbors.reshape(arrays.n_stations, k + 1)
+    distances = distances.reshape(arrays.n_stations, k + 1)
+
+    ## Drop each station itself (or, when stations share coordinates, the farthest hit)
+    keep = neighbors != np.arange(arrays.n_stations)[:, None]
+    keep[keep.all(axis=1), -1] = False
+    return neighbors[keep].reshape(arrays.n_stations, k), distances[keep].reshape(arrays.n_stations, k)
+
+
+def fill_neighbor(arrays, columns, values, k=3, **options):
+    """
+    The same day's value of the nearest of the k nearest other stations that has one.
+    """
+    if arrays.longitudes is None or arrays.n_stations < 2:
+        return values.copy()
+
+    neighbors, _ = nearest_other_stations(arrays, k)
+    k = neighbors.shape[1]
+
+    grid, day = station_day_grid(arrays, values)
+    filled = values.copy()
+    placed = day >= 0
+    for rank in range(k):
+        missing = np.isnan(filled) & placed[:, None]
+        row, column = np.nonzero(missing)
+        filled[row, column] = grid[day[row], neighbors[arrays.stations[row], rank], column]
+    return filled
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Inverse Distance Weighted Stations
+#######################################
+def station_graph(arrays, k=5, power=2):
+    """
+    k-nearest-station graph with inverse distance weights.
+
+    Parameters:
+    - arrays: StationArrays with station coordinates.
+    - k: Integer, neighbors per station.
+    - power: Number, weight = 1 / distance ** power (distances under 1 m count as 1 m).
+
+    Returns:
+    - scipy.sparse CSR matrix (stations x stations): row s holds the weights of the k
+      stations nearest to s (never s itself).
+    """
+    n_stations = arrays.n_stations
+    neighbors, distances = nearest_other_stations(arrays, k)
+    weights = 1.0 / np.maximum(distances, 1.0) ** power
+    return sparse.csr_matrix((weights.ravel(), neighbors.ravel(),
+                              np.arange(0, neighbors.size + 1, max(neighbors.shape[1], 1))),
+                             shape=(n_stations, n_stations))
+
+
+def fill_idw(arrays, columns, values, k=5, power=2, **options):
+    """
+    Inverse distance weighted mean of the k nearest stations' values on the same day,
+    over the neighbors that have one (weights renormalised).
+    """
+    if arrays.longitudes is None or arrays.n_stations < 2:
+        return values.copy()
+
+    ## Station x (day, column) matrices of the values (0 where missing) and of their presence
+    grid, day = station_day_grid(arrays, values)
+    present = ~np.isnan(grid)
+    by_station = np.where(present, grid, 0.0).transpose(1, 0, 2).reshape(arrays.n_stations, -1)
+    weight_present = present.transpose(1, 0, 2).reshape(arrays.n_stations, -1).astype(np.float64)
+
+    ## Weighted sums over every day and column at once, one sparse product each
+    graph = arrays.station_graph(k, power)
+    total = graph @ by_station
+    weight = graph @ weight_present
+    with np.errstate(invalid='ignore', divide='ignore'):
+        estimate = np.where(weight > 0, total / weight, np.nan).reshape(arrays.n_stations, len(grid), values.shape[1])
+
+    row, column = np.nonzero(np.isnan(values) & (day >= 0)[:, None])
+    filled = values.copy()
+    filled[row, column] = estimate[arrays.stations[row], day[row], column]
+    return filled
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Strategy Registry
+#######################################
+STRATEGIES = {
+    'rolling_mean': fill_rolling_mean,
+    'linear': fill_linear,
+    'seasonal_normal': fill_seasonal_normal,
+    'neighbor': fill_neighbor,
+    'idw': fill_idw,
+}
+
+
+def impute_strategies(df, strategies, **options):
+    """
+    Fill missing values of several columns, each with its own strategy.
+
+    Parameters:
+    - df: DataFrame sorted by DailyStation and Date (see StationArrays).
+    - strategies: Dictionary of column name -> strategy name (STRATEGIES).
+    - options: Passed to every strategy, e.g. window and workers for rolling_mean, k for neighbor.
+
+    Returns:
+    - Tuple (values, imputed): float64 arrays (rows x columns, in the order of strategies)
+      of the values before and after filling.
+    """
+    unknown = set(strategies.values()) - set(STRATEGIES)
+    if unknown:
+        raise ValueError(f'Unknown imputation strategies {sorted(unknown)}, choose from {list(STRATEGIES)}')
+
+    columns = list(strategies)
+    values = df[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    imputed = values.copy()
+    arrays = StationArrays(df)
+
+    ## One kernel call per strategy, over all of its columns
+    for name in dict.fromkeys(strategies.values()):
+        batch = [i for i, column in enumerate(columns) if strategies[column] == name]
+        imputed[:, batch] = STRATEGIES[name](arrays, [columns[i] for i in batch], values[:, batch], **options)
+    return values, imputed
+######################## End Function ########################
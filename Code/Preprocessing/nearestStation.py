@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Nearest Weather Station Engine \\\\\\\\\\
+
+Assigns points to their nearest weather station for cropStationMapper.py,
+nearestNeighborStationMapping.py and TIFtoCSV.py --aggregate station.
+
+gpd.sjoin_nearest builds Shapely points for every crop pixel and reprojects them to a
+single UTM zone, which distorts distances away from that zone (California and Florida
+both span two zones). NearestStations instead:
+
+- places the stations on the unit sphere (x, y, z) once and builds a scipy cKDTree
+- converts raw longitude/latitude arrays to unit vectors (a few trig calls, no pyproj)
+- queries the tree in parallel; the nearest chord is the nearest great-circle distance
+
+and returns station indices and great-circle distances (meters) with no geometries and
+no per-year to_crs. A projected_crs can still be given to measure planar distances in
+that CRS instead (e.g. to reproduce the former UTM joins).
+
+@author: dforc
+"""
+
+import math
+
+import numpy as np
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+
+## Mean Earth radius (IUGG), meters
+EARTH_RADIUS_M = 6_371_008.8
+
+
+#######################################
+####### Coordinates
+#######################################
+def get_utm_crs(longitude):
+    """
+    WGS 84 / UTM north zone containing a longitude, e.g. 'EPSG:32617'.
+    """
+    zone = math.floor((longitude + 180) / 6) + 1
+    return f"EPSG:326{zone:02d}"
+
+
+def unit_vectors(longitudes, latitudes):
+    """
+    Unit-sphere (x, y, z) coordinates of longitude/latitude arrays, as an (n, 3) array.
+    """
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_meters(chord):
+    """
+    Great-circle distance in meters for unit-sphere chord lengths.
+    """
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Nearest Station Index
+#######################################
+class NearestStations:
+    """
+    KD-tree over station coordinates, built once.
+
+    Parameters:
+    - longitudes, latitudes: Arrays of station coordinates (EPSG:4326).
+    - projected_crs: String, metric CRS to measure planar distances in; None (default)
+      measures great-circle distances.
+    """
+    def __init__(self, longitudes, latitudes, projected_crs=None):
+        self.crs = projected_crs
+        self._transformer = None
+        if projected_crs is not None:
+            self._transformer = Transformer.from_crs('EPSG:4326', projected_crs, always_xy=True)
+        self.tree = cKDTree(self.coordinates(longitudes, latitudes))
+
+    def coordinates(self, longitudes, latitudes):
+        """Tree coordinates of longitude/latitude arrays: unit vectors, or projected (x, y)."""
+        if self._transformer is None:
+            return unit_vectors(longitudes, latitudes)
+        return np.column_stack(self._transformer.transform(np.asarray(longitudes, dtype=np.float64),
+                                                           np.asarray(latitudes, dtype=np.float64)))
+
+    def query(self, longitudes, latitudes, workers=-1, k=1):
+        """
+        Nearest station for each point.
+
+        Parameters:
+        - longitudes, latitudes: Arrays of point coordinates (EPSG:4326).
+        - workers: Integer, threads used by the KD-tree query (-1 = all cores).
+        - k: Integer, number of nearest stations to return per point.
+
+        Returns:
+        - Tuple (indices, distances): station row number and distance in meters per point,
+          or (points x k) arrays of the k nearest, closest first, when k > 1.
+        """
+        distances, indices = self.tree.query(self.coordinates(longitudes, latitudes), k=k, workers=workers)
+        if self._transformer is None:
+            distances = chord_to_meters(distances)
+        return indices, distances
+######################## End Function ########################
@@ -12,30 +12,41 @@ It completes the following tasks:
       precipitation, snowfall, elevation, station, and geographic coordinates
 - Replaces missing values indicated by -9999 with NaN to handle missing data
 - Extracts unique weather station identifiers along with their coordinates
-- Loads a county boundaries shapefile to map stations to their respective counties
+- Loads the state's county boundaries (countyBoundaries.py) to map stations to their respective counties
 - Performs a spatial join to associate weather stations with county and state information
-- Outputs the processed data into clean CSV files, including station locations and climate normals
+- Outputs the processed climate normals to the NormalsReady Parquet stage (CSV export optional)
+  and the station locations to CSV, typed by climateSchema.py (float32 normals, category station/county/date)
+
+select_normals(raw) and shape_normals(raw, counties) do the work and can be imported;
+running the script (python normalsCountyConverter.py [--state Florida]) reads the raw
+normals and writes the outputs as before.
 
 @author: dforc
 """
 
-
+import argparse
+import os
 import pandas as pd
-import geopandas as gpd
 import numpy as np
 
+from countyBoundaries import load_counties_for_points, join_station_counties, attach_station_counties
+from climateSchema import NORMALS_SCHEMA
+from dataStore import write_stage
+
 
 #######################################
 ####### !! >> Set State Here << !!
 #######################################
 myState = "Florida"
 
+## Also export {myState}NormalsReady.csv next to the Parquet stage
+exportCSV = False
 
-## Dynamically construct the file paths for raw data
-rawDataPath = f'./Raw_Normal_Data/{myState}NormalsRaw.csv'
-
-## Read the CSV data into a DataFrame
-myNormals = pd.read_csv(rawDataPath)
+## Folder of the raw {state}NormalsRaw.csv files, county shapefile and outputs
+rawDataDirectory = './Raw_Normal_Data'
+shapeFilePath = "./Shape_Files/tl_2019_us_county.shp"
+normalsStagePath = './Clean_Normal_Data/NormalsReady'
+outputDirectory = './Clean_Normal_Data'
 
 
 
@@ -57,12 +68,7 @@ rename_dict = {
     'LONGITUDE': 'Long'
     }
 
-## Rename Columns
-myNormals = myNormals.rename(columns=rename_dict)
-
-
-
-## Select columns of interest and replace -9999 with NaN
+## Columns of interest, after renaming
 columns_of_interest = ['DATE', 'normalAvgTemp', 'normalAvgTempStd', 
                        'normalMaxTemp', 'normalMaxTempStd', 
                        'normalMinTemp', 'normalMinTempStd', 
@@ -71,14 +77,25 @@ columns_of_interest = ['DATE', 'normalAvgTemp', 'normalAvgTempStd',
                        'Long', 'Lat']
 
 
-## Handle the missing columns case
-normalSelect = myNormals[columns_of_interest].replace(-9999, np.nan)
+def read_raw_normals(path):
+    """
+    Read a raw normals CSV, keeping station ids and month-day dates as strings.
+    """
+    return pd.read_csv(path, dtype={'STATION': str, 'DATE': str})
+
 
+def select_normals(raw):
+    """
+    Rename and select the columns of interest of a raw normals table; -9999 becomes NaN.
 
-## Extract UNIQUE STATIONS
-uniqueStations = normalSelect[['STATION', 'Lat', 'Long']].drop_duplicates()
+    Parameters:
+    - raw: DataFrame from read_raw_normals.
 
-## /////////////////////////////////////
+    Returns:
+    - DataFrame with the columns_of_interest.
+    """
+    return raw.rename(columns=rename_dict)[columns_of_interest].replace(-9999, np.nan)
+######################## End Function ########################
 
 
 
@@ -88,37 +105,28 @@ uniqueStations = normalSelect[['STATION', 'Lat', 'Long']].drop_duplicates()
 #######################################
 ####### Shapefile Processing and Mapping
 #######################################
+def shape_normals(raw, counties):
+    """
+    Shape a raw normals table and map its stations to counties.
 
-## Load county boundaries shapefile
-shapeFilePath = "./Shape_Files/tl_2019_us_county.shp"
-counties_sf = gpd.read_file(shapeFilePath)
-
-## Select the necessary columns and rename for clarity
-counties_sf = counties_sf[['geometry', 'STATEFP', 'COUNTYFP', 
-                           'GEOID', 'NAME', 'ALAND', 'AWATER']]
-
+    Parameters:
+    - raw: DataFrame from read_raw_normals.
+    - counties: Geopandas GeoDataFrame of county boundaries (countyBoundaries.py), covering the stations.
 
-## Rename Columns of Interest
-counties_sf = counties_sf.rename(columns={'NAME': 'COUNTY',
-                                          'STATEFP': 'STATE_CODE'})
+    Returns:
+    - Tuple (normals DataFrame with COUNTY and STATE_CODE, stations DataFrame with
+      STATION, COUNTY, STATE_CODE, Lat and Long).
+    """
+    normalSelect = select_normals(raw)
 
-## Convert unique stations to a GeoDataFrame and perform a spatial join
-stations_sf = gpd.GeoDataFrame(uniqueStations, 
-                               geometry=gpd.points_from_xy(uniqueStations['Long'],
-                                                           uniqueStations['Lat']), 
-                               crs='EPSG:4326')
+    ## Extract UNIQUE STATIONS and perform a spatial join with the counties
+    uniqueStations = normalSelect[['STATION', 'Lat', 'Long']].drop_duplicates()
+    stations_with_county = join_station_counties(uniqueStations, counties)
 
-
-## Perform a spatial join between Stations and Map to Counties
-counties_sf_transformed = counties_sf.to_crs(stations_sf.crs)
-stations_with_county = gpd.sjoin(stations_sf, counties_sf_transformed,
-                                 how="left")
-
-## Prepare the stations data with county and state information
-stations_with_county = stations_with_county[['STATION', 'COUNTY', 
-                                             'STATE_CODE', 'Lat', 'Long']]
-
-## /////////////////////////////////////
+    ## Merge Climate Normals with Spatial Data (keeping the normals' Lat / Long)
+    myNormals_with_county = attach_station_counties(normalSelect, stations_with_county)
+    return myNormals_with_county, stations_with_county
+######################## End Function ########################
 
 
 
@@ -126,27 +134,41 @@ stations_with_county = stations_with_county[['STATION', 'COUNTY',
 
 
 #######################################
-####### Write Files
+####### Run Program
 #######################################
-
-## Construct the file paths for output
-normalsOutputPath = f'./Clean_Normal_Data/{myState}NormalsReady.csv'
-stationsOutputPath = f'./Clean_Normal_Data/{myState}StationsReady.csv'
-
-
-## Merge Climate Normals with Spatial Data
-myNormals_with_county = pd.merge(normalSelect, stations_with_county, on='STATION', 
-                                 suffixes=('_x', '_y'))
-
-## Drop the 'Lat_y' and 'Long_y' Columns (Dupes)
-myNormals_with_county.drop(columns=['Lat_y', 'Long_y'], inplace=True)
-
-## Rename Lat_x Long_x to Standard Latlong
-myNormals_with_county.rename(columns={'Lat_x': 'Lat', 'Long_x': 'Long'}, inplace=True)
-
-
-
-## Write the Processed 30 Year Normal Data to .CSV
-myNormals_with_county.to_csv(normalsOutputPath, index=False)
-stations_with_county.to_csv(stationsOutputPath, index=False)
-
+def main(state, raw_directory=rawDataDirectory, shapefile_path=shapeFilePath,
+         normals_stage=normalsStagePath, output_directory=outputDirectory, export_csv=exportCSV):
+    """
+    Shape one state's raw normals into the NormalsReady stage and {state}StationsReady.csv.
+    """
+    myNormals = read_raw_normals(os.path.join(raw_directory, f'{state}NormalsRaw.csv'))
+
+    ## Load county boundaries for the state (plus any county holding a station outside it)
+    uniqueStations = myNormals[['LONGITUDE', 'LATITUDE']].drop_duplicates().replace(-9999, np.nan)
+    counties_sf = load_counties_for_points(shapefile_path, state,
+                                           uniqueStations['LONGITUDE'], uniqueStations['LATITUDE'])
+
+    myNormals_with_county, stations_with_county = shape_normals(myNormals, counties_sf)
+
+    ## Write the Processed 30 Year Normal Data to the NormalsReady stage
+    normalsOutputPath = os.path.join(output_directory, f'{state}NormalsReady.csv') if export_csv else None
+    write_stage(myNormals_with_county, normals_stage, state, NORMALS_SCHEMA, csv_path=normalsOutputPath)
+    stations_with_county.to_csv(os.path.join(output_directory, f'{state}StationsReady.csv'), index=False)
+######################## End Function ########################
+
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shape a state's raw 30 year normals into the NormalsReady stage.")
+    parser.add_argument('--state', default=myState, help="State to shape")
+    parser.add_argument('--raw-dir', default=rawDataDirectory, help="Folder of {state}NormalsRaw.csv")
+    parser.add_argument('--shapefile', default=shapeFilePath, help="County shapefile")
+    parser.add_argument('--stage', default=normalsStagePath, help="NormalsReady stage directory")
+    parser.add_argument('--output-dir', default=outputDirectory,
+                        help="Folder of {state}StationsReady.csv and the CSV export")
+    parser.add_argument('--export-csv', action='store_true', default=exportCSV,
+                        help="Also write {state}NormalsReady.csv")
+    args = parser.parse_args()
+
+    main(args.state, args.raw_dir, args.shapefile, args.stage, args.output_dir, args.export_csv)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Raster Pixel Coordinates \\\\\\\\\\
+
+Shared NumPy helpers for turning raster pixel indices into coordinates.
+
+rasterio.transform.xy returns Python lists of floats, which for tens of millions
+of crop or NDVI pixels costs several times the memory of the index arrays and a
+Python-level pass over every pixel. pixel_centers evaluates the affine transform
+directly on the index arrays and returns float64 arrays instead.
+
+warped_grid gives the EPSG:4326 grid TIFtoCSV.py warps CropScape rasters onto, so
+other scripts can line up with the crop points without re-warping the raster.
+
+Used by TIFtoCSV.py, vegTIFtoCSV.py and cropCountyShaper.py.
+
+@author: dforc
+"""
+
+import numpy as np
+import rasterio
+from rasterio.warp import calculate_default_transform
+
+
+#######################################
+####### Pixel Centers
+#######################################
+def pixel_centers(transform, rows, cols):
+    """
+    Compute the coordinates of pixel centers from an affine transform.
+
+    Equivalent to rasterio.transform.xy(transform, rows, cols, offset='center'),
+    but vectorized and returning arrays.
+
+    Parameters:
+    - transform: affine.Affine, raster transform (pixel -> map coordinates).
+    - rows: Array of integers, pixel row indices.
+    - cols: Array of integers, pixel column indices (same shape as rows).
+
+    Returns:
+    - Tuple of float64 NumPy arrays (xs, ys), e.g. (longitudes, latitudes) for EPSG:4326.
+    """
+    a, b, c, d, e, f = transform.a, transform.b, transform.c, transform.d, transform.e, transform.f
+
+    ## Skip the rotation terms for north-up rasters, which is every CropScape/NDVI grid.
+    ## Work in place so only the two output arrays are ever allocated.
+    if b == 0 and d == 0:
+        xs = np.array(cols, dtype=np.float64)
+        xs += 0.5
+        xs *= a
+        xs += c
+
+        ys = np.array(rows, dtype=np.float64)
+        ys += 0.5
+        ys *= e
+        ys += f
+    else:
+        col_centers = np.asarray(cols, dtype=np.float64) + 0.5
+        row_centers = np.asarray(rows, dtype=np.float64) + 0.5
+        xs = col_centers * a + row_centers * b + c
+        ys = col_centers * d + row_centers * e + f
+    return xs, ys
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Warped Grid
+#######################################
+def warped_grid(fileloc, dst_crs='EPSG:4326'):
+    """
+    Grid a raster is reprojected onto by TIFtoCSV.py.
+
+    Parameters:
+    - fileloc: String, path to the source raster.
+    - dst_crs: String, target CRS.
+
+    Returns:
+    - Tuple (transform, width, height) from rasterio's calculate_default_transform.
+    """
+    with rasterio.open(fileloc) as src:
+        return calculate_default_transform(src.crs, dst_crs, src.width, src.height, *src.bounds)
+######################## End Function ########################
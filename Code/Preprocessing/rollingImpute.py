@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Grouped Rolling Mean Imputation \\\\\\\\\\
+
+Fills missing values with the centred rolling mean of each station's own values, for
+several columns at once and without a groupby.
+
+combinedDiagnosticImpute.py used to run rolling(6, center=True) over row positions after
+sorting by station and date, so when a station was missing whole days its "6 day" window
+silently spanned weeks. calendar_mean_fill windows over calendar days instead:
+
+- calendar_slots lays each station out on a dense daily calendar, one slot per day from
+  its first to its last date, so missing days are empty slots rather than absent rows
+- each slot holds the sum and number of values of its day, and the window is summed as
+  shifted copies of those arrays (window_sums), masked at station boundaries
+- the window covers the days rolling('6D', center=True) covers: days -2 .. +3 for a
+  window of 6 (centered_day_offsets); missing values count neither in the sum nor in
+  the number of values, like min_periods=1
+- with workers > 1, whole stations are spread over a process pool (station_chunks)
+
+Windows are summed directly (window additions per slot) rather than through a cumulative
+sum, so there is no rounding drift over long tables.
+
+Used by combinedDiagnosticImpute.py; benchmarked against a groupby version in
+Benchmarks/benchRollingImpute.py.
+
+@author: dforc
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+#######################################
+####### Window
+#######################################
+def centered_day_offsets(window):
+    """
+    Day offsets of a centred time window, as pandas places them for rolling('6D', center=True).
+
+    Parameters:
+    - window: Integer, window length in days.
+
+    Returns:
+    - range of offsets, e.g. -2 .. 3 for window=6 and -2 .. 2 for window=5.
+    """
+    left = (window - 1) // 2
+    right = window // 2
+    return range(-left, right + 1)
+
+
+def window_sums(total, count, groups, offsets):
+    """
+    Sum the rows of total and count over a window of row offsets, within each group.
+
+    Parameters:
+    - total: 2-D float array (rows x columns), the values to sum (0 where missing).
+    - count: 2-D integer array shaped like total, the number of values in each cell.
+    - groups: 1-D integer array of group codes, one per row; each group's rows contiguous.
+    - offsets: Iterable of integer row offsets making up the window.
+
+    Returns:
+    - Tuple (total, count) of the window sums, shaped like the inputs.
+    """
+    n_rows = len(total)
+    window_total = np.zeros(total.shape, dtype=np.float64)
+    window_count = np.zeros(count.shape, dtype=np.int32)
+
+    for offset in offsets:
+        if abs(offset) >= n_rows:
+            continue
+        ## Row i takes row i + offset, if that row is of the same group
+        target = slice(max(0, -offset), n_rows - max(0, offset))
+        source = slice(max(0, offset), n_rows - max(0, -offset))
+        same_group = (groups[target] == groups[source])[:, None]
+        np.add(window_total[target], total[source], out=window_total[target], where=same_group)
+        np.add(window_count[target], count[source], out=window_count[target], where=same_group)
+    return window_total, window_count
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Daily Calendar
+#######################################
+def calendar_slots(groups, dates):
+    """
+    Place rows on a dense daily calendar: each group gets one slot per day from its
+    first to its last date, missing days included.
+
+    Parameters:
+    - groups: 1-D integer array of group codes (e.g. station codes), one per row.
+    - dates: 1-D array of dates (datetime64 or anything numpy converts to days).
+
+    Returns:
+    - Tuple (slot, slot_groups): the calendar slot of each row (-1 for rows without a
+      group or date), and the group code of each calendar slot.
+    """
+    groups = np.asarray(groups)
+    days = np.asarray(dates, dtype='datetime64[D]')
+    placed = (groups >= 0) & ~np.isnat(days)
+
+    slot = np.full(len(groups), -1, dtype=np.int64)
+    if not placed.any():
+        return slot, np.empty(0, dtype=groups.dtype)
+
+    group = groups[placed]
+    day = days[placed].astype(np.int64)
+    n_groups = int(group.max()) + 1
+
+    ## First and last day of each group (groups without rows get no slots)
+    first = np.full(n_groups, np.iinfo(np.int64).max)
+    last = np.full(n_groups, np.iinfo(np.int64).min)
+    np.minimum.at(first, group, day)
+    np.maximum.at(last, group, day)
+    span = np.where(last >= first, last - first + 1, 0)
+    start = np.cumsum(span) - span
+
+    slot[placed] = start[group] + day - first[group]
+    return slot, np.repeat(np.arange(n_groups, dtype=groups.dtype), span)
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Calendar Mean Fill
+#######################################
+def _fill_stations(values, groups, dates, window, min_periods):
+    """
+    calendar_mean_fill for one set of stations, in this process.
+    """
+    slot, slot_groups = calendar_slots(groups, dates)
+    placed = slot >= 0
+    rows = slot[placed]
+    n_slots = len(slot_groups)
+
+    ## Sum and number of values of each calendar day (days without rows stay empty)
+    present = ~np.isnan(values)
+    total = np.zeros((n_slots, values.shape[1]), dtype=np.float64)
+    count = np.zeros((n_slots, values.shape[1]), dtype=np.int32)
+    for i in range(values.shape[1]):
+        column_present = present[placed, i]
+        total[:, i] = np.bincount(rows, weights=np.where(column_present, values[placed, i], 0.0), minlength=n_slots)
+        count[:, i] = np.bincount(rows, weights=column_present, minlength=n_slots)
+
+    total, count = window_sums(total, count, slot_groups, centered_day_offsets(window))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(count >= min_periods, total / count, np.nan)
+
+    ## Missing cells of rows on the calendar take their day's window mean
+    row, column = np.nonzero(~present & placed[:, None])
+    filled = values.copy()
+    filled[row, column] = means[slot[row], column]
+    return filled
+
+
+def _fill_stations_task(args):
+    return _fill_stations(*args)
+
+
+def station_chunks(groups, n_chunks):
+    """
+    Split rows into about n_chunks sets of whole stations with similar row counts.
+
+    Parameters:
+    - groups: 1-D integer array of group codes, one per row (negative codes are left out).
+    - n_chunks: Integer, number of chunks wanted.
+
+    Returns:
+    - List of integer arrays of row positions, one per chunk.
+    """
+    order = np.argsort(groups, kind='stable')
+    order = order[np.asarray(groups)[order] >= 0]
+    sorted_groups = np.asarray(groups)[order]
+
+    ## Cut at the first row of the station found at each even split of the rows
+    cuts = np.linspace(0, len(order), n_chunks + 1).astype(np.int64)[1:-1]
+    cuts = np.unique(np.searchsorted(sorted_groups, sorted_groups[cuts], side='left'))
+    return [chunk for chunk in np.split(order, cuts) if len(chunk)]
+
+
+def calendar_mean_fill(values, groups, dates, window=6, min_periods=1, workers=1):
+    """
+    Fill missing values with the centred time-window mean of their station's values.
+
+    Each station is laid out on a dense daily calendar (calendar_slots), so a window of
+    6 covers 6 calendar days, as rolling('6D', center=True) does, however many days are
+    missing from the table. Days with several rows count every row.
+
+    Parameters:
+    - values: 2-D array (rows x columns) of floats, NaN where missing; any row order.
+    - groups: 1-D integer array of station codes, one per row. Rows with a negative code
+      (no station) or without a date are left as they are.
+    - dates: 1-D array of dates, one per row.
+    - window: Integer, window length in days.
+    - min_periods: Integer, values needed in a window for a mean.
+    - workers: Integer, processes to spread the stations over (1 runs in this process).
+
+    Returns:
+    - float64 array shaped like values: the original values where present, the window
+      mean where missing (NaN when the window has fewer than min_periods values).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        return calendar_mean_fill(values[:, None], groups, dates, window, min_periods, workers)[:, 0]
+    groups = np.asarray(groups)
+    dates = np.asarray(dates, dtype='datetime64[D]')
+
+    if workers <= 1:
+        return _fill_stations(values, groups, dates, window, min_periods)
+
+    ## Station-parallel: a few chunks of whole stations per worker, codes renumbered from 0
+    chunks = station_chunks(groups, workers * 4)
+    tasks = [(values[rows], groups[rows] - groups[rows].min(), dates[rows], window, min_periods) for rows in chunks]
+
+    filled = values.copy()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rows, chunk_filled in zip(chunks, pool.map(_fill_stations_task, tasks)):
+            filled[rows] = chunk_filled
+    return filled
+######################## End Function ########################
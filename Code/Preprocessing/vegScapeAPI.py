@@ -47,9 +47,14 @@ def download_tif_file(url, local_path):
         print(f"An error occurred: {e}")
 
 # Example usage
-fips_code = "19015"
-date_string = "2012.07.09_2012.07.15"
-weekly_ndvi_string = "weekly_ndvi_28"  # Correcting potential duplication here
-url = f"https://nassgeo.csiss.gmu.edu/ndvi_data_cache/byfips/{weekly_ndvi_string}_{date_string}_{fips_code}.tif"
-local_filename = f"{weekly_ndvi_string}_{fips_code}_{date_string}.tif"
-download_tif_file(url, local_filename)
\ No newline at end of file
+def main():
+    fips_code = "19015"
+    date_string = "2012.07.09_2012.07.15"
+    weekly_ndvi_string = "weekly_ndvi_28"  # Correcting potential duplication here
+    url = f"https://nassgeo.csiss.gmu.edu/ndvi_data_cache/byfips/{weekly_ndvi_string}_{date_string}_{fips_code}.tif"
+    local_filename = f"{weekly_ndvi_string}_{fips_code}_{date_string}.tif"
+    download_tif_file(url, local_filename)
+
+
+if __name__ == "__main__":
+    main()
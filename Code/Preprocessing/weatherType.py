@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+////////// GSOD Weather Type (FRSHTT) Decoding \\\\\\\\\\
+
+GSOD's FRSHTT field is a six digit indicator string (Fog, Rain/Drizzle, Snow/Ice,
+Hail, Thunder, Tornado/Funnel), e.g. '010010' for a day with rain and thunder.
+pandas reads it as an integer, dropping the leading zeros.
+
+decode_weather_type parses the column once into an integer array and extracts all six
+digits with integer division and modulo, instead of one str(x).zfill(6) pass per flag.
+
+Used by dailyClimateBasicCleaner.py.
+
+@author: dforc
+"""
+
+import numpy as np
+import pandas as pd
+
+
+## Indicator columns, in FRSHTT digit order
+WEATHER_CONDITIONS = ['Fog', 'Rain_Drizzle', 'Snow_Ice', 'Hail', 'Thunder', 'Tornado_Funnel']
+
+
+#######################################
+####### Decode WeatherType
+#######################################
+def decode_weather_type(weather_type, conditions=WEATHER_CONDITIONS):
+    """
+    Split FRSHTT codes into one 0/1 indicator column per weather condition.
+
+    Parameters:
+    - weather_type: pandas Series of FRSHTT codes (integers, floats or digit strings).
+    - conditions: List of strings, output column names in digit order.
+
+    Returns:
+    - DataFrame with one nullable Int8 column per condition, indexed like weather_type;
+      missing or unparseable codes give <NA> in every column.
+    """
+    codes = pd.to_numeric(weather_type, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    missing = np.isnan(codes)
+    codes = np.where(missing, 0, codes).astype(np.int64)
+
+    n_digits = len(conditions)
+    flags = {}
+    for i, condition in enumerate(conditions):
+        digit = (codes // 10 ** (n_digits - 1 - i)) % 10
+        flags[condition] = pd.arrays.IntegerArray(digit.astype(np.int8), missing.copy())
+    return pd.DataFrame(flags, index=weather_type.index)
+######################## End Function ########################
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Zonal Crop Pixel Counts \\\\\\\\\\
+
+Aggregate-at-source support for TIFtoCSV.py --aggregate.
+
+cropCountyShaper.py and cropStationMapper.py only keep the number of crop pixels per
+(county or station, CropTypes, Year). Instead of writing every pixel as a point and
+spatially joining it afterwards, each warped raster strip's crop pixels are given their
+zone directly (burnt polygons or a nearest-station lookup) and the pixels are counted with one np.bincount over (zone, crop code) pairs:
+
+- CountyZones: county polygons (same output as cropCountyShaper.py)
+- StationZones: nearest daily weather station of each crop pixel center by great-circle
+  distance, from the same KD-tree engine cropStationMapper.py uses (nearestStation.py)
+
+With a shapefile path, CountyZones reads the county ids from the cached county grid
+(countyGrid.py) instead of rasterizing the polygons again for every year.
+
+Pixels are assigned by their centers (rasterize with all_touched=False), matching the
+point-in-polygon and nearest-station joins on pixel-center points.
+
+@author: dforc
+"""
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+import shapely
+from rasterio.features import rasterize
+from rasterio.windows import bounds as window_bounds, transform as window_transform
+
+from countyGrid import load_county_grid
+from nearestStation import NearestStations
+from rasterCoords import pixel_centers
+
+
+#######################################
+####### Zone Sets
+#######################################
+class ZoneSet(ABC):
+    """
+    Polygons burnt onto raster strips as integer zone ids (1..n, 0 = no zone).
+
+    Subclasses set self.geometries (EPSG:4326 shapely geometries) and self.attributes
+    (DataFrame with one row per geometry), and implement to_table. Zones that are not
+    polygons override n_zones and pixel_zones instead of setting geometries.
+    """
+    name = None
+
+    def _build_index(self):
+        self.tree = shapely.STRtree(self.geometries)
+
+    @property
+    def n_zones(self):
+        return len(self.geometries)
+
+    def prepare(self, transform, width, height):
+        """Hook called once per raster with its full warped grid, before any strip."""
+
+    def zones_for(self, transform, out_shape, window):
+        """
+        Rasterize the zones onto one strip.
+
+        Parameters:
+        - transform: affine.Affine, transform of the full warped grid.
+        - out_shape: Tuple (rows, cols) of the strip.
+        - window: rasterio Window of the strip within the full grid.
+
+        Returns:
+        - int32 NumPy array of zone ids with shape out_shape.
+        """
+        strip_box = shapely.box(*window_bounds(window, transform))
+        candidates = self.tree.query(strip_box)
+        zones = np.zeros(out_shape, dtype=np.int32)
+        if candidates.size == 0:
+            return zones
+
+        return rasterize(((self.geometries[i], int(i) + 1) for i in candidates),
+                         out_shape=out_shape, transform=window_transform(window, transform),
+                         fill=0, dtype='int32', all_touched=False)
+
+    def pixel_zones(self, transform, window, block, mask):
+        """
+        Zone ids of the pixels of one strip selected by a boolean mask.
+
+        Parameters:
+        - transform: affine.Affine, transform of the full warped grid.
+        - window: rasterio Window of the strip within the full grid.
+        - block: NumPy array of the strip's pixel values.
+        - mask: Boolean NumPy array, pixels to return zones for.
+
+        Returns:
+        - Integer NumPy array of zone ids, one per selected pixel.
+        """
+        return self.zones_for(transform, block.shape, window)[mask]
+
+    def counts_frame(self, counts, crop_legend):
+        """
+        Turn a (n_zones + 1, n_codes) count matrix into long (zone, CropTypes, Count) rows.
+        Pixels outside every zone or with codes missing from the legend are dropped,
+        like the NaN keys dropped by the point-based groupby.
+        """
+        zone_ids, codes = np.nonzero(counts[1:])
+        frame = pd.DataFrame({'zone': zone_ids,
+                              'CropValue': codes,
+                              'Count': counts[1:][zone_ids, codes]})
+        legend = crop_legend.rename(columns={'Value': 'CropValue', 'Category': 'CropTypes'})
+        frame = frame.merge(legend[['CropValue', 'CropTypes']], on='CropValue', how='inner')
+        return frame.groupby(['zone', 'CropTypes'], as_index=False)['Count'].sum()
+
+    @abstractmethod
+    def to_table(self, counts, crop_legend, data_year):
+        """
+        Long (zone, CropTypes, Count) rows of counts_frame with the zone set's own columns.
+        """
+
+
+class CountyZones(ZoneSet):
+    """
+    County polygons, emitting the columns of cropCountyShaper.py's grouped output.
+
+    Parameters:
+    - counties: GeoDataFrame with geometry, STATEFP, COUNTYFP, GEOID, NAME, ALAND, AWATER.
+    - shapefile_path: String, shapefile the counties came from; enables the county grid cache.
+    - cache_dir: String, folder of the county grid cache.
+    """
+    name = 'county'
+
+    def __init__(self, counties, shapefile_path=None, cache_dir='County_Grid_Cache'):
+        self.counties = counties.to_crs('EPSG:4326').reset_index(drop=True)
+        self.geometries = np.asarray(self.counties.geometry.values)
+        self.attributes = pd.DataFrame(self.counties.drop(columns='geometry')).rename(columns={'NAME': 'County'})
+        self.shapefile_path = shapefile_path
+        self.cache_dir = cache_dir
+        self.grid = None
+        self._build_index()
+
+    def prepare(self, transform, width, height):
+        if self.shapefile_path is not None:
+            self.grid, _ = load_county_grid(self.counties, self.shapefile_path,
+                                            transform, width, height, cache_dir=self.cache_dir)
+
+    def zones_for(self, transform, out_shape, window):
+        if self.grid is None:
+            return super().zones_for(transform, out_shape, window)
+        return np.asarray(self.grid[window.row_off:window.row_off + out_shape[0],
+                                    window.col_off:window.col_off + out_shape[1]], dtype=np.int32)
+
+    def to_table(self, counts, crop_legend, data_year):
+        frame = self.counts_frame(counts, crop_legend)
+        frame = frame.join(self.attributes, on='zone')
+        frame['Year'] = data_year
+        return frame[['County', 'CropTypes', 'Year', 'STATEFP', 'COUNTYFP',
+                      'GEOID', 'ALAND', 'AWATER', 'Count']]
+
+
+class StationZones(ZoneSet):
+    """
+    Nearest daily weather station of each pixel, emitting cropStationMapper.py's columns.
+
+    Stations are not polygons: each selected pixel center is looked up in the
+    great-circle KD-tree of nearestStation.py, so the zones match cropStationMapper.py's
+    point assignment exactly and stay correct across UTM zones.
+
+    Parameters:
+    - station_mapping: DataFrame with DailyStation, DailyLong, DailyLat columns.
+    """
+    name = 'station'
+
+    def __init__(self, station_mapping):
+        stations = station_mapping[['DailyStation', 'DailyLong', 'DailyLat']].drop_duplicates(
+            subset='DailyStation').reset_index(drop=True)
+        self.stations = NearestStations(stations['DailyLong'], stations['DailyLat'])
+        self.attributes = stations[['DailyStation']]
+
+    @property
+    def n_zones(self):
+        return len(self.attributes)
+
+    def zones_for(self, transform, out_shape, window):
+        return self.pixel_zones(transform, window, None,
+                                np.ones(out_shape, dtype=bool)).reshape(out_shape)
+
+    def pixel_zones(self, transform, window, block, mask):
+        rows, cols = np.nonzero(mask)
+        longitudes, latitudes = pixel_centers(transform, rows + window.row_off, cols + window.col_off)
+        indices, _ = self.stations.query(longitudes, latitudes)
+        return indices + 1
+
+    def to_table(self, counts, crop_legend, data_year):
+        frame = self.counts_frame(counts, crop_legend)
+        frame = frame.join(self.attributes, on='zone')
+        frame['Year'] = data_year
+        return frame[['DailyStation', 'CropTypes', 'Year', 'Count']]
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Accumulate Counts
+#######################################
+class ZonalAccumulator:
+    """
+    Running (zone, crop code) pixel counts for one raster.
+
+    Parameters:
+    - zone_set: ZoneSet to count by.
+    - n_codes: Integer, number of possible crop codes (256 for CropScape's uint8).
+    """
+    def __init__(self, zone_set, n_codes):
+        self.zone_set = zone_set
+        self.n_codes = n_codes
+        self.counts = np.zeros((zone_set.n_zones + 1) * n_codes, dtype=np.int64)
+
+    def add(self, block, transform, window):
+        """Count the non-zero pixels of one strip by zone and crop code."""
+        crop = block != 0
+        zones = self.zone_set.pixel_zones(transform, window, block, crop)
+        keys = zones.astype(np.int64) * self.n_codes + block[crop]
+        self.counts += np.bincount(keys, minlength=self.counts.size)
+
+    def to_table(self, crop_legend, data_year):
+        return self.zone_set.to_table(self.counts.reshape(-1, self.n_codes), crop_legend, data_year)
+######################## End Function ########################
@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+"""
+////////// Preprocessing Pipeline Runner \\\\\\\\\\
+
+Runs the preprocessing scripts as a dependency graph of stages, instead of by hand in
+the order documented in the README, each with a hard-coded state.
+
+Each stage declares its script (run as a subprocess in its working folder), its
+input and output paths and the stages it needs. Per-state stages run once per state
+in --states; the state is passed in the script's --state / --states argument (each
+script falls back to its own default when run by hand). "Link" stages
+replace the by-hand moves of outputs into the folders the next scripts read from,
+with hard links where possible.
+
+- A stage's signature is the SHA-256 of its script and the local modules it imports,
+  its arguments and state, and the contents of its inputs (files, folders or globs)
+- A stage is skipped when its signature matches the last successful run and its
+  outputs exist; file hashes are cached by size and mtime, so unchanged inputs are
+  not re-read
+- Independent stages run in parallel (--workers): the crop raster branch and the
+  climate branch, and the states within each branch
+- Changing one state's inputs (e.g. its raw normals) reruns only that state's stages
+  downstream of the change, and only as far as outputs actually change
+- Stages run once overall (per_state=False) that need a per-state stage wait for
+  every state's task of it, e.g. the imputed CSV export of all states
+- Stages writing the same output run one after another
+
+Signatures and the hash cache are kept in {root}/.pipeline/state.json, logs of each
+stage in {root}/.pipeline/logs/.
+
+Usage:
+    python pipeline.py [--states California Florida] [--workers 4] [--only imputed crop_county]
+                       [--force] [--dry-run]
+
+@author: dforc
+"""
+
+import argparse
+import fnmatch
+import glob
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Preprocessing'))
+from fileManifest import file_hash, load_manifest, save_manifest
+
+
+CODE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+#######################################
+####### !! >> Set Defaults Here << !!
+#######################################
+states = ['California', 'Florida']
+
+## Working folders of the weather and crop preprocessing scripts, relative to the repository root
+## (they hold the raw downloads listed in ExternalData.txt, laid out as the scripts expect)
+weather_dir = 'Data/Weather_Work'
+crop_dir = 'Data/Crop_Work'
+
+
+#######################################
+####### Stages
+#######################################
+class Stage:
+    """
+    One step of the pipeline; paths and arguments may use {state}, {states} (comma
+    separated), {weather} and {crop}.
+
+    Parameters:
+    - name: String, stage name (per-state stages run as name/state).
+    - script: String, script path relative to Code/ (None for link stages).
+    - links: List of (source, destination) paths to mirror instead of running a script.
+    - cwd: String, working folder of the script, relative to the repository root.
+    - args: List of strings, command line arguments of the script.
+    - inputs: List of files, folders or globs the stage reads, relative to the repository root.
+    - outputs: List of files, folders or globs the stage writes.
+    - needs: List of stage names that must finish first (same state for per-state stages,
+      every state for stages run once overall).
+    - per_state: Boolean, run once per state (True) or once overall (False).
+    """
+
+    def __init__(self, name, script=None, links=(), cwd='.', args=(), inputs=(), outputs=(),
+                 needs=(), per_state=True):
+        self.name = name
+        self.script = script
+        self.links = list(links)
+        self.cwd = cwd
+        self.args = list(args)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.needs = list(needs)
+        self.per_state = per_state
+        self.state = None
+
+    @property
+    def task_id(self):
+        return f'{self.name}/{self.state}' if self.per_state else self.name
+
+    def bind(self, state, folders):
+        """
+        Copy of the stage for one state, with every template filled in.
+        """
+        fill = lambda text: text.format(state=state, **folders)
+        stage = Stage(self.name, self.script, [(fill(s), fill(d)) for s, d in self.links], fill(self.cwd),
+                      [fill(a) for a in self.args], [fill(p) for p in self.inputs],
+                      [fill(p) for p in self.outputs], self.needs, self.per_state)
+        stage.state = state if self.per_state else None
+        stage.needs = [f'{need}/{state}' if self.per_state else need for need in self.needs]
+        return stage
+######################## End Function ########################
+
+
+_DAILY_CLEANED = 'Code/Data/Daily_Weather_Data/DailyCleaned/State={state}'
+_NORMALS_READY = 'Code/Data/30YearNormals_Data/NormalsReady/State={state}'
+_STATION_MAPPING = 'Code/Data/Station_Mapping/{state}_Station_Mapping.csv'
+_COMBINED = 'Code/Data/Main_Data/Combined_Daily_Normals/State={state}'
+_CROP_POINTS = '{crop}/{state}CropData/{state}TopCropLonLat'
+
+STAGES = [
+    ## ---- Climate branch
+    Stage('daily_raw', 'Preprocessing/dailyRawCombiner.py', cwd='{weather}',
+          args=['--states', '{state}', '--data-dir', 'Raw_Daily_Data',
+                '--stage', 'Raw_Daily_Data/DailyRaw', '--workers', '1'],
+          inputs=['{weather}/Raw_Daily_Data/{state}DailyRaw*.csv'],
+          outputs=['{weather}/Raw_Daily_Data/DailyRaw/State={state}']),
+    Stage('daily_ready', 'Preprocessing/dailyClimateShaper.py', cwd='{weather}',
+          args=['--state', '{state}'],
+          inputs=['{weather}/Raw_Daily_Data/DailyRaw/State={state}', '{weather}/Shape_Files'],
+          outputs=['{weather}/Clean_Daily_Data/DailyReady/State={state}',
+                   '{weather}/Clean_Daily_Data/{state}StationsReady.csv'],
+          needs=['daily_raw']),
+    Stage('daily_cleaned', 'Preprocessing/dailyClimateBasicCleaner.py', cwd='{weather}',
+          args=['--state', '{state}'],
+          inputs=['{weather}/Clean_Daily_Data/DailyReady/State={state}'],
+          outputs=['{weather}/Clean_Daily_Data/DailyCleaned/State={state}'],
+          needs=['daily_ready']),
+    Stage('normals_ready', 'Preprocessing/normalsCountyConverter.py', cwd='{weather}',
+          args=['--state', '{state}'],
+          inputs=['{weather}/Raw_Normal_Data/{state}NormalsRaw.csv', '{weather}/Shape_Files'],
+          outputs=['{weather}/Clean_Normal_Data/NormalsReady/State={state}',
+                   '{weather}/Clean_Normal_Data/{state}StationsReady.csv']),
+    Stage('publish_daily', links=[('{weather}/Clean_Daily_Data/DailyCleaned/State={state}', _DAILY_CLEANED)],
+          needs=['daily_cleaned']),
+    Stage('publish_normals', links=[('{weather}/Clean_Normal_Data/NormalsReady/State={state}', _NORMALS_READY)],
+          needs=['normals_ready']),
+    Stage('station_mapping', 'Analysis/nearestNeighborStationMapping.py', cwd='Code/Analysis',
+          args=['--state', '{state}'],
+          inputs=[_DAILY_CLEANED, _NORMALS_READY],
+          outputs=[_STATION_MAPPING],
+          needs=['publish_daily', 'publish_normals']),
+    Stage('combined', 'Analysis/climateTotalMerge.py', cwd='Code/Analysis',
+          args=['--state', '{state}'],
+          inputs=[_DAILY_CLEANED, _NORMALS_READY, _STATION_MAPPING],
+          outputs=[_COMBINED],
+          needs=['station_mapping']),
+    Stage('imputed', 'Preprocessing/combinedDiagnosticImpute.py', cwd='Code/Preprocessing',
+          args=['--state', '{state}', '--csv', ''],   ## Exported for all states at once by imputed_csv
+          inputs=[_COMBINED],
+          outputs=['Code/Data/Main_Data/Imputed_Combined_Daily_Normals/State={state}'],
+          needs=['combined']),
+    Stage('imputed_csv', 'Preprocessing/combinedDiagnosticImpute.py', cwd='Code/Preprocessing',
+          args=['--export-states', '{states}'],
+          inputs=['Code/Data/Main_Data/Imputed_Combined_Daily_Normals'],
+          outputs=['Code/Data/Main_Data/Imputed_Combined_Daily_Normals.csv'],
+          needs=['imputed'], per_state=False),
+
+    ## ---- Crop branch
+    Stage('crop_points', 'Preprocessing/TIFtoCSV.py', cwd='{crop}',
+          args=['--states', '{state}', '--years', '2010-2020', '--data-dir', 'Rasters',
+                '--output-dir', '.', '--format', 'parquet'],
+          inputs=['{crop}/Rasters/{state}_*.tif', '{crop}/Rasters/Legend.csv'],
+          outputs=[_CROP_POINTS]),
+    Stage('publish_crop_points', links=[(_CROP_POINTS, '{crop}/{state}TopCropLonLat')],
+          needs=['crop_points']),
+    Stage('crop_county', 'Preprocessing/cropCountyShaper.py', cwd='{crop}',
+          args=['--states', '{state}'],
+          inputs=['{crop}/{state}TopCropLonLat', '{crop}/Shapefiles', '{crop}/Rasters/{state}_*.tif'],
+          outputs=['{crop}/Output_CSVs/{state}/{state}TopCropLonLat_*_with_County_Grouped.csv'],
+          needs=['publish_crop_points']),
+    Stage('crop_county_ready', 'Preprocessing/cropCountyAllYearsCombine.py', cwd='{crop}',
+          args=['--state', '{state}'],
+          inputs=['{crop}/Output_CSVs/{state}/{state}TopCropLonLat_*_with_County_Grouped.csv'],
+          outputs=['{crop}/Output_CSVs/{state}/{state}CropsCountyReady.csv'],
+          needs=['crop_county']),
+    Stage('publish_crop_station_inputs',
+          links=[(_STATION_MAPPING, 'Code/Analysis/{state}_Station_Mapping.csv'),
+                 (_CROP_POINTS, 'Code/Analysis/{state}TopCropLonLat')],
+          needs=['station_mapping', 'crop_points']),
+    Stage('crop_station', 'Analysis/cropStationMapper.py', cwd='Code/Analysis',
+          args=['--states', '{state}'],
+          inputs=['Code/Analysis/{state}_Station_Mapping.csv', 'Code/Analysis/{state}TopCropLonLat'],
+          outputs=['Code/Analysis/Output_CSVs/{state}'],
+          needs=['publish_crop_station_inputs']),
+    Stage('crop_reports', 'Preprocessing/countyCropRecordCombine.py', cwd='Code/Preprocessing',
+          inputs=['Data/Crop_Production_Data/Crop_Report_20[0-9][0-9].csv'],
+          outputs=['Data/Crop_Production_Data/Crop_Report_2010_2020.csv',
+                   'Data/Crop_Production_Data/Filtered_Crop_Report_2010_2020.csv'],
+          per_state=False),
+]
+
+
+def build_tasks(stages, states, folders):
+    """
+    Bind the stages to the states, in declaration order.
+
+    Parameters:
+    - stages: List of Stage.
+    - states: List of strings, states to run the per-state stages for.
+    - folders: Dictionary filling {weather} and {crop}.
+
+    Returns:
+    - Dictionary of task id -> bound Stage; a stage run once overall needs every
+      state's task of the per-state stages it names, and a stage writing an output an
+      earlier stage also writes needs that stage, so the two never run at the same time.
+    """
+    folders = {**folders, 'states': ','.join(states)}
+    tasks = {}
+    for stage in stages:
+        for state in (states if stage.per_state else [None]):
+            task = stage.bind(state, folders)
+            tasks[task.task_id] = task
+
+    for task in tasks.values():
+        if not task.per_state:
+            task.needs = [t for need in task.needs
+                          for t in ([need] if need in tasks else [t for t in tasks if t.startswith(need + '/')])]
+
+    writers = {}
+    for task in tasks.values():
+        for output in task.outputs + [d for _, d in task.links]:
+            if output in writers:
+                task.needs.append(writers[output])
+            writers[output] = task.task_id
+    return tasks
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Signatures
+#######################################
+class FileHashes:
+    """
+    SHA-256 of files, cached by path, size and mtime (in the pipeline state file).
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __call__(self, path):
+        stat = os.stat(path)
+        entry = self.cache.get(path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_hash(path)}
+            self.cache[path] = entry
+        return entry['sha256']
+
+
+def expand_path(path):
+    """
+    Files behind an input or output path: the file itself, every file under a folder,
+    or every match of a glob; sorted, and empty when nothing exists.
+    """
+    matches = sorted(glob.glob(path)) if glob.has_magic(path) else ([path] if os.path.exists(path) else [])
+    files = []
+    for match in matches:
+        if os.path.isdir(match):
+            for folder, _, names in sorted(os.walk(match)):
+                files.extend(os.path.join(folder, name) for name in sorted(names))
+        else:
+            files.append(match)
+    return files
+
+
+def local_modules(script_path, search_dirs):
+    """
+    The script and the repository modules it imports, directly or through each other.
+    """
+    found, todo = [], [script_path]
+    while todo:
+        path = todo.pop()
+        if path in found:
+            continue
+        found.append(path)
+        with open(path, encoding='utf-8') as f:
+            names = re.findall(r'^\s*(?:from|import)\s+(\w+)', f.read(), re.M)
+        for name in names:
+            for folder in search_dirs:
+                candidate = os.path.join(folder, f'{name}.py')
+                if os.path.exists(candidate):
+                    todo.append(candidate)
+                    break
+    return sorted(found)
+
+
+def signature(task, root, file_hashes):
+    """
+    SHA-256 over the task's code, arguments, state and the contents of its inputs.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((task.script, task.links, task.cwd, task.args, task.state)).encode())
+    if task.script is not None:
+        script_path = os.path.join(CODE_DIR, task.script)
+        for path in local_modules(script_path, [os.path.dirname(script_path),
+                                                os.path.join(CODE_DIR, 'Preprocessing')]):
+            digest.update(f'{os.path.relpath(path, CODE_DIR)}:{file_hash(path)}'.encode())
+
+    inputs = task.inputs + [source for source, _ in task.links]
+    for pattern in inputs:
+        files = expand_path(os.path.join(root, pattern))
+        digest.update(f'{pattern}:{len(files)}'.encode())
+        for path in files:
+            digest.update(f'{os.path.relpath(path, root)}:{file_hashes(path)}'.encode())
+    return digest.hexdigest()
+
+
+def outputs_exist(task, root):
+    return all(expand_path(os.path.join(root, path)) for path in task.outputs + [d for _, d in task.links])
+######################## End Function ########################
+
+
+
+
+#######################################
+####### Run Tasks
+#######################################
+def link_tree(source, destination):
+    """
+    Mirror a file or folder at destination, hard-linking files (copying across devices).
+    """
+    ## Checked first, so a missing source never removes the published copy
+    if not os.path.lexists(source):
+        raise FileNotFoundError(f'Link source {source} does not exist')
+    if os.path.isdir(destination) and not os.path.islink(destination):
+        shutil.rmtree(destination)
+    elif os.path.lexists(destination):
+        os.remove(destination)
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+
+    def link_file(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    if os.path.isdir(source):
+        shutil.copytree(source, destination, copy_function=link_file)
+    else:
+        link_file(source, destination)
+
+
+def execute_task(task, root, log_path):
+    """
+    Run one task's links or script (logging to log_path); returns its return code.
+    """
+    if task.script is None:
+        for source, destination in task.links:
+            link_tree(os.path.join(root, source), os.path.join(root, destination))
+        return 0
+
+    cwd = os.path.join(root, task.cwd)
+    os.makedirs(cwd, exist_ok=True)
+    ## The scripts expect their output folders to exist
+    for output in task.outputs:
+        os.makedirs(os.path.dirname(os.path.join(root, output)), exist_ok=True)
+    env = {**os.environ, 'MPLBACKEND': 'Agg'}   ## Plots are not shown when run here
+    with open(log_path, 'w') as log:
+        result = subprocess.run([sys.executable, os.path.join(CODE_DIR, task.script), *task.args],
+                                cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return result.returncode
+
+
+def run_task(task, root, log_dir):
+    """
+    Run one task (script or links); returns (task id, return code, seconds).
+    An exception (e.g. a missing link source) is logged and returned as code 1, so
+    the task fails and the tasks needing it are blocked.
+    """
+    start = time.perf_counter()
+    log_path = os.path.join(log_dir, task.task_id.replace('/', '_') + '.log')
+    try:
+        returncode = execute_task(task, root, log_path)
+    except Exception:
+        with open(log_path, 'a') as log:
+            log.write(traceback.format_exc())
+        returncode = 1
+    return task.task_id, returncode, time.perf_counter() - start
+
+
+def select_tasks(tasks, only):
+    """
+    The tasks named in only (stage names or task ids) and everything they need.
+    """
+    if not only:
+        return tasks
+    selected = [t for t in tasks if t in only or any(fnmatch.fnmatch(t, f'{name}/*') for name in only)]
+    keep = set()
+    while selected:
+        task_id = selected.pop()
+        if task_id not in keep:
+            keep.add(task_id)
+            selected.extend(tasks[task_id].needs)
+    return {t: task for t, task in tasks.items() if t in keep}
+
+
+def run_pipeline(tasks, root, workers=4, force=False, dry_run=False):
+    """
+    Run the tasks in dependency order, skipping those whose signature is unchanged.
+
+    Parameters:
+    - tasks: Dictionary of task id -> bound Stage (build_tasks / select_tasks).
+    - root: String, repository root the stage paths are relative to.
+    - workers: Integer, tasks run at the same time.
+    - force: Boolean, run every task whatever its signature.
+    - dry_run: Boolean, only report which tasks would run (assumes every task that
+      would run changes its outputs).
+
+    Returns:
+    - Dictionary of task id -> 'ran', 'skipped', 'failed' or 'blocked'.
+    """
+    state_path = os.path.join(root, '.pipeline', 'state.json')
+    log_dir = os.path.join(root, '.pipeline', 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    state = load_manifest(state_path)
+    signatures = state.setdefault('signatures', {})
+    file_hashes = FileHashes(state.setdefault('files', {}))
+
+    status = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while len(status) < len(tasks):
+            for task_id, task in tasks.items():
+                if task_id in status or task_id in running.values():
+                    continue
+                needs = [n for n in task.needs if n in tasks]
+                if any(status.get(n) in ('failed', 'blocked') for n in needs):
+                    status[task_id] = 'blocked'
+                    print(f'blocked  {task_id}')
+                    continue
+                if not all(n in status for n in needs):
+                    continue
+
+                if dry_run:
+                    upstream_runs = any(status[n] == 'ran' for n in needs)
+                    current = signature(task, root, file_hashes)
+                    changed = force or upstream_runs or signatures.get(task_id) != current
+                    status[task_id] = 'ran' if changed or not outputs_exist(task, root) else 'skipped'
+                    print(f"{'would run' if status[task_id] == 'ran' else 'up to date'}  {task_id}")
+                    continue
+
+                current = signature(task, root, file_hashes)
+                if not force and signatures.get(task_id) == current and outputs_exist(task, root):
+                    status[task_id] = 'skipped'
+                    print(f'up to date  {task_id}')
+                    continue
+                print(f'running  {task_id}')
+                running[pool.submit(run_task, task, root, log_dir)] = task_id
+                task.signature = current
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task_id, returncode, seconds = future.result()
+                del running[future]
+                if returncode == 0:
+                    status[task_id] = 'ran'
+                    signatures[task_id] = tasks[task_id].signature
+                    print(f'done     {task_id} ({seconds:.1f} s)')
+                else:
+                    status[task_id] = 'failed'
+                    signatures.pop(task_id, None)
+                    print(f'FAILED   {task_id} (exit {returncode}, see {log_dir})')
+                ## Saved as tasks finish, so an interrupted run keeps what it completed
+                save_manifest(state_path, state)
+
+    if not dry_run:
+        save_manifest(state_path, state)
+    return status
+######################## End Function ########################
+
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the preprocessing pipeline, skipping up-to-date stages.")
+    parser.add_argument('--states', nargs='+', default=states, help="States of the per-state stages")
+    parser.add_argument('--workers', type=int, default=4, help="Stages run at the same time")
+    parser.add_argument('--only', nargs='+', help="Stage names or stage/state ids to bring up to date "
+                        "(with the stages they need)")
+    parser.add_argument('--root', default=os.path.dirname(CODE_DIR), help="Repository root")
+    parser.add_argument('--weather-dir', default=weather_dir, help="Working folder of the weather scripts")
+    parser.add_argument('--crop-dir', default=crop_dir, help="Working folder of the crop scripts")
+    parser.add_argument('--force', action='store_true', help="Run every selected stage")
+    parser.add_argument('--dry-run', action='store_true', help="Only list the stages that would run")
+    parser.add_argument('--list', action='store_true', help="List the stages and exit")
+    args = parser.parse_args()
+
+    tasks = build_tasks(STAGES, args.states, {'weather': args.weather_dir, 'crop': args.crop_dir})
+    tasks = select_tasks(tasks, args.only)
+    if args.list:
+        for task_id, task in tasks.items():
+            print(f"{task_id:40s} {task.script or 'link'}  needs: {', '.join(task.needs) or '-'}")
+        sys.exit()
+
+    start = time.perf_counter()
+    status = run_pipeline(tasks, os.path.abspath(args.root), args.workers, args.force, args.dry_run)
+    counts = {s: list(status.values()).count(s) for s in ('ran', 'skipped', 'failed', 'blocked')}
+    print(f"{counts['ran']} {'to run' if args.dry_run else 'ran'}, {counts['skipped']} up to date, {counts['failed']} failed, "
+          f"{counts['blocked']} blocked in {time.perf_counter() - start:.1f} s")
+    if counts['failed'] or counts['blocked']:
+        sys.exit(1)